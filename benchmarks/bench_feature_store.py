@@ -0,0 +1,72 @@
+import argparse
+import contextlib
+import io
+import os
+import time
+
+# PGOPTIONS points every connection of this process at the scratch schema
+os.environ["PGOPTIONS"] = "-c search_path=bench_queue"
+
+import database  # noqa: E402
+import feature_store  # noqa: E402
+import popularity_prediction  # noqa: E402
+from benchmarks.bench_scoring_queue import prepare  # noqa: E402
+
+# Benchmark of the incremental feature store: the initial build, a refresh with nothing changed, a
+# refresh after one new day of statistics, and scoring a day of unrated rows with and without the store.
+# Uses the database from the usual DB_* variables, but only touches its own bench_queue schema.
+# Run from the repository root: python -m benchmarks.bench_feature_store --rows 300000
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the incremental feature store")
+    parser.add_argument("--rows", type=int, default=300000, help="Historical statistics rows (30 dates)")
+    args = parser.parse_args()
+
+    connection = popularity_prediction.connect_database()
+    try:
+        prepare(connection, args.rows)
+        cursor = connection.cursor()
+        scaler, model = popularity_prediction.load_models()
+
+        refreshed, elapsed = timed(feature_store.refresh, connection)
+        print(f"initial build       {refreshed:>8} rows {elapsed:7.2f}s")
+        refreshed, elapsed = timed(feature_store.refresh, connection)
+        print(f"unchanged refresh   {refreshed:>8} rows {elapsed:7.2f}s")
+
+        # History is rated; one new day of statistics arrives unrated
+        cursor.execute("UPDATE Fact_Video_Statistics SET popularity_rating = 'populair';")
+        cursor.execute("""
+            INSERT INTO Fact_Video_Statistics (video_id, date_id, view_count, like_count, comment_count, timestamp)
+            SELECT video_id, 20240201, view_count + 100, like_count, comment_count, TIMESTAMP '2024-02-01'
+            FROM Fact_Video_Statistics WHERE date_id = 20240101;
+        """)
+        new_rows = cursor.rowcount
+        connection.commit()
+
+        refreshed, elapsed = timed(feature_store.refresh, connection)
+        print(f"new day refresh     {refreshed:>8} rows {elapsed:7.2f}s")
+
+        for use_store in [False, True]:
+            popularity_prediction.use_feature_store = use_store
+            cursor.execute("UPDATE Fact_Video_Statistics SET popularity_rating = NULL WHERE date_id = 20240201;")
+            connection.commit()
+            _, elapsed = timed(popularity_prediction.score_popularity, connection, scaler, model)
+            print(f"score new day       {new_rows:>8} rows {elapsed:7.2f}s  ({'feature store' if use_store else 'raw rows'})")
+    finally:
+        connection.rollback()
+        cursor = connection.cursor()
+        cursor.execute("DROP SCHEMA IF EXISTS bench_queue CASCADE;")
+        connection.commit()
+        database.release(connection)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+import argparse
+import re
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+import features
+import popularity_prediction
+
+# Microbenchmark of the vectorized feature builder against the per-row pandas code popularity_prediction.py
+# used before (regex per row via apply, two groupbys, pd.cut). The old per-row debug print of the whole
+# scaled matrix is left out: it is O(n^2) output and would dominate at any size.
+# Also checks that both paths predict the same clusters.
+# Run from the repository root: python -m benchmarks.bench_features --rows 10000 100000 1000000
+
+
+# Function to generate n synthetic unrated rows
+def synthetic_rows(n, seed=42):
+    rng = np.random.default_rng(seed)
+    views = rng.integers(1000, 5_000_000, n)
+    minutes = rng.integers(0, 40, n)
+    hours = np.where(rng.random(n) < 0.05, 1, 0)
+    return pd.DataFrame({
+        'video_id': [f"vid{i:08d}" for i in range(n)],
+        'view_count': views,
+        'like_count': np.where(rng.random(n) < 0.1, 0, views // rng.integers(20, 60, n)),
+        'comment_count': np.where(rng.random(n) < 0.1, 0, views // rng.integers(300, 1000, n)),
+        'duration': [f"PT{h}H{m}M{s}S" if h else f"PT{m}M{s}S"
+                     for h, m, s in zip(hours, minutes, rng.integers(0, 60, n))],
+        'category_id': rng.choice([22, 24, 27, 28, 29, 99], n),
+        'timestamp': pd.Timestamp("2026-10-01") + pd.to_timedelta(rng.integers(0, 14, n), unit="D"),
+    })
+
+
+# Function to convert ISO 8601 duration to seconds, as popularity_prediction.py used to do per row
+def legacy_convert_duration_to_seconds(duration):
+    match = re.match(
+        r'PT((?P<hours>\d+)H)?((?P<minutes>\d+)M)?((?P<seconds>\d+)S)?', duration)
+    if not match:
+        return 0
+    time_data = match.groupdict()
+    return int(time_data['hours'] or 0) * 3600 + int(time_data['minutes'] or 0) * 60 + int(time_data['seconds'] or 0)
+
+
+# The feature code popularity_prediction.py used before, minus the per-row print
+def legacy_predict(df, scaler, model):
+    df = df.copy()
+    df['timestamp'] = pd.to_datetime(df['timestamp'], errors='coerce')
+    df['date'] = df['timestamp'].dt.date
+    mean_likes = df.groupby('date')['like_count'].transform('mean')
+    mean_comments = df.groupby('date')['comment_count'].transform('mean')
+    df['date'] = df['timestamp'].dt.date
+    mean_likes = df.groupby('date')['like_count'].transform('mean')
+    mean_comments = df.groupby('date')['comment_count'].transform('mean')
+    df['like_count'] = np.where(df['like_count'] == 0, mean_likes, df['like_count'])
+    df['comment_count'] = np.where(df['comment_count'] == 0, mean_comments, df['comment_count'])
+    df['duration_seconds'] = df['duration'].apply(legacy_convert_duration_to_seconds)
+    df['duration_bin'] = pd.cut(df['duration_seconds'], bins=[0, 300, 900, float('inf')], labels=[1, 2, 3], right=False)
+    df['like_view_ratio'] = df['like_count'] / df['view_count']
+    df['comment_view_ratio'] = df['comment_count'] / df['view_count']
+    df['interaction_score'] = df['like_view_ratio'] + df['comment_view_ratio']
+    df['category_popularity'] = df['category_id'].map(features.category_popularity).fillna(5)
+    df[features.SCALED_COLUMNS] = scaler.transform(df[features.SCALED_COLUMNS])
+    return model.predict(df[features.CLUSTERING_COLUMNS])
+
+
+# The vectorized path popularity_prediction.score_chunk uses now
+def vectorized_predict(df, scaler, model):
+    matrix, duration_bin = features.build_features(df, features.daily_means_for(df))
+    scaled = features.scale(scaler, matrix)
+    return features.predict_clusters(model, features.clustering_matrix(scaled, duration_bin))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the popularity feature builder")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    args = parser.parse_args()
+
+    warnings.simplefilter("ignore")
+    scaler, model = popularity_prediction.load_models()
+
+    # Warm up both paths so the first size does not pay for imports and regex compilation
+    warm_up = synthetic_rows(1000)
+    legacy_predict(warm_up, scaler, model)
+    vectorized_predict(warm_up, scaler, model)
+
+    for n in args.rows:
+        df = synthetic_rows(n)
+        start = time.perf_counter()
+        legacy = legacy_predict(df, scaler, model)
+        legacy_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        vectorized = vectorized_predict(df, scaler, model)
+        vectorized_time = time.perf_counter() - start
+
+        mismatches = int((np.asarray(legacy) != np.asarray(vectorized)).sum())
+        print(f"{n:>9} rows  legacy {legacy_time:7.2f}s  vectorized {vectorized_time:7.2f}s  "
+              f"speedup x{legacy_time / vectorized_time:5.1f}  mismatches {mismatches}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+import argparse
+import threading
+import time
+
+import youtube_fetcher
+from benchmarks.stub_youtube_api import make_server, MAX_IDS_PER_REQUEST
+
+# Benchmark of the concurrent metadata fetcher against the local stub API with injected latency.
+# The "writer" sleeps per batch to stand in for upsert_video_metadata, so the numbers show how much
+# of the database time the concurrent fetcher hides.
+# Run from the repository root: python -m benchmarks.bench_fetcher --videos 5000 --latency 0.2
+
+
+def run(base_url, batches, workers, rate_limit, write_time):
+    rate_limiter = youtube_fetcher.TokenBucket(rate_limit) if rate_limit > 0 else None
+    fetched = 0
+    start = time.perf_counter()
+    with youtube_fetcher.create_session(workers) as session:
+        def fetch_batch(batch):
+            return youtube_fetcher.get_with_retry(
+                session, f"{base_url}/videos", {"id": ",".join(batch), "part": "snippet"}, rate_limiter)
+
+        for batch, response, error in youtube_fetcher.fetch_concurrently(batches, fetch_batch, workers=workers):
+            if error is None and response.status_code == 200:
+                fetched += len(response.json()["items"])
+            time.sleep(write_time)
+    return fetched, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the concurrent YouTube metadata fetcher")
+    parser.add_argument("--videos", type=int, default=2000)
+    parser.add_argument("--latency", type=float, default=0.2, help="Stub API latency per request in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--write-time", type=float, default=0.05, help="Simulated database time per batch")
+    parser.add_argument("--rate-limit", type=float, default=0, help="Requests per second, 0 for no limit")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    server = make_server(latency=args.latency, error_rate=args.error_rate)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    video_ids = [f"vid{i:08d}" for i in range(args.videos)]
+    batches = [video_ids[i:i + MAX_IDS_PER_REQUEST] for i in range(0, len(video_ids), MAX_IDS_PER_REQUEST)]
+
+    print(f"{len(video_ids)} videos, {len(batches)} batches, {args.latency}s latency, {args.write_time}s write per batch")
+    baseline = None
+    for workers in args.workers:
+        fetched, elapsed = run(base_url, batches, workers, args.rate_limit, args.write_time)
+        baseline = baseline or elapsed
+        print(f"workers={workers:<3} fetched={fetched:<7} {elapsed:7.2f}s  "
+              f"{fetched / elapsed:9.1f} videos/s  speedup x{baseline / elapsed:.1f}")
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
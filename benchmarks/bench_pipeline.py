@@ -0,0 +1,205 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+# PGOPTIONS points this process and every stage it starts at the scratch schema
+SCHEMA = "bench_pipeline"
+os.environ["PGOPTIONS"] = f"-c search_path={SCHEMA}"
+
+import database  # noqa: E402
+from benchmarks import synthetic_catalog  # noqa: E402
+from benchmarks.stub_youtube_api import make_server  # noqa: E402
+
+# Offline end-to-end benchmark of the three pipeline scripts. For every catalog size it writes a synthetic
+# catalog to a local directory (the SFTP share stand-in), serves its metadata, statistics and transcripts
+# from the local stub (with the given latency), resets the bench_pipeline schema of the database from the
+# usual DB_* variables, and runs schrif_video_weg.py, popularity_prediction.py and transcript.py one after
+# the other as separate processes. Per stage it records the wall time, the rows written and rows/s, the
+# peak RSS of the process and its database round trips (statements + commits + rollbacks, from
+# database.report), and writes everything to a JSON baseline.
+#
+#   python -m benchmarks.bench_pipeline --videos 1000 10000 100000 --output baseline.json
+#   python -m benchmarks.bench_pipeline --videos 1000 --compare baseline.json
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Stage name, script, and the table (with filter) whose row count grows by the rows the stage wrote
+STAGES = [
+    ("ingest", "schrif_video_weg.py", "Fact_Video_Statistics", "TRUE"),
+    ("scoring", "popularity_prediction.py", "Fact_Video_Statistics", "popularity_rating IS NOT NULL"),
+    ("transcripts", "transcript.py", "Dim_Transcript", "TRUE"),
+]
+
+
+# Function to recreate the scratch schema with the tables the pipeline expects to exist already
+def prepare_database(connection):
+    with database.transaction(connection) as cursor:
+        cursor.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE; CREATE SCHEMA {SCHEMA};")
+        cursor.execute("""
+            CREATE TABLE Dim_Date (date_id SERIAL PRIMARY KEY, year INT, month INT, day INT);
+            INSERT INTO Dim_Date (year, month, day)
+            SELECT EXTRACT(year FROM d), EXTRACT(month FROM d), EXTRACT(day FROM d)
+            FROM generate_series('2005-01-01'::date, '2035-12-31'::date, '1 day') d;
+            CREATE TABLE Dim_Transcript (video_id VARCHAR(15) PRIMARY KEY, transcript_text TEXT,
+                                         language VARCHAR(10), version VARCHAR(20));
+        """)
+
+
+# Function to count the rows of a table matching a filter (0 while the table does not exist yet)
+def count_rows(connection, table, condition):
+    with database.transaction(connection) as cursor:
+        cursor.execute("SELECT to_regclass(%s) IS NOT NULL;", (table.lower(),))
+        if not cursor.fetchone()[0]:
+            return 0
+        cursor.execute(f"SELECT COUNT(*) FROM {table} WHERE {condition};")
+        return cursor.fetchone()[0]
+
+
+# Function to run one script as a child process; returns (seconds, peak RSS in MB, database counts)
+def run_script(script, env, log_path):
+    stats_path = log_path + ".db.json"
+    env = dict(env, DB_STATS_FILE=stats_path)
+    with open(log_path, "w") as log:
+        start = time.perf_counter()
+        process = subprocess.Popen([sys.executable, script], cwd=REPOSITORY, env=env, stdout=log,
+                                   stderr=subprocess.STDOUT)
+        _, status, usage = os.wait4(process.pid, 0)
+        seconds = time.perf_counter() - start
+    process.returncode = os.waitstatus_to_exitcode(status)
+    if process.returncode != 0:
+        with open(log_path) as log:
+            tail = "".join(log.readlines()[-20:])
+        raise RuntimeError(f"{script} exited with {process.returncode}:\n{tail}")
+
+    counts = {}
+    if os.path.exists(stats_path):
+        with open(stats_path) as stats_file:
+            counts = json.load(stats_file)
+    return seconds, usage.ru_maxrss / 1024, counts
+
+
+# Function to benchmark the three stages on a fresh catalog of n videos; returns {stage: result}
+def run_size(connection, n, args, stub_url, work_directory):
+    catalog = os.path.join(work_directory, f"catalog-{n}")
+    synthetic_catalog.write_video_files(catalog, synthetic_catalog.video_ids(n, args.missing))
+    prepare_database(connection)
+
+    env = dict(os.environ)
+    env.pop("SCORING_SERVICE_URL", None)
+    env.update({
+        "DISCOVERY_SOURCE": "local",
+        "REMOTE_DIRECTORY": catalog,
+        "YOUTUBE_API_URL": stub_url,
+        "YOUTUBE_API_KEY": env.get("YOUTUBE_API_KEY", "offline"),
+        "TRANSCRIPT_SERVICE_URL": stub_url,
+        "FETCH_RATE_LIMIT": "0",
+        "TRANSCRIPT_RATE_LIMIT": "0",
+    })
+    for name in ["SSH_HOST", "SSH_USERNAME", "SSH_PASSWORD"]:
+        env.setdefault(name, "offline")
+
+    results = {}
+    for stage, script, table, condition in STAGES:
+        before = count_rows(connection, table, condition)
+        seconds, peak_rss, counts = run_script(script, env, os.path.join(work_directory, f"{n}-{stage}.log"))
+        rows = count_rows(connection, table, condition) - before
+        results[stage] = {
+            "seconds": round(seconds, 3),
+            "rows": rows,
+            "rows_per_second": round(rows / seconds, 1),
+            "peak_rss_mb": round(peak_rss, 1),
+            "db": counts,
+        }
+        print(f"{n:>7} videos  {stage:<12} {seconds:8.2f}s {rows:>8} rows {rows / seconds:9.1f} rows/s  "
+              f"peak RSS {peak_rss:7.1f} MB  {counts.get('round_trips', '?')} round trips")
+    return results
+
+
+# Function to get the current commit of the repository (None outside a git checkout)
+def current_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPOSITORY, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# Function to print the change of every stage against a baseline written by an earlier run
+def compare(baseline, result):
+    print(f"Compared with {baseline.get('commit')} ({baseline.get('created')}):")
+    compared = 0
+    for size, stages in result["runs"].items():
+        for stage, now in stages.items():
+            before = baseline.get("runs", {}).get(size, {}).get(stage)
+            if before is None:
+                continue
+            compared += 1
+            print(f"{size:>7} videos  {stage:<12} {before['seconds']:8.2f}s -> {now['seconds']:8.2f}s "
+                  f"(x{before['seconds'] / max(now['seconds'], 1e-9):.2f})  "
+                  f"round trips {before['db'].get('round_trips', '?')} -> {now['db'].get('round_trips', '?')}  "
+                  f"peak RSS {before['peak_rss_mb']} -> {now['peak_rss_mb']} MB")
+    if not compared:
+        print("No catalog size in common with the baseline.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark of the pipeline scripts")
+    parser.add_argument("--videos", type=int, nargs="+", default=[1000, 10000, 100000], help="Catalog sizes")
+    parser.add_argument("--latency", type=float, default=0.05, help="Stub API and transcript latency in seconds")
+    parser.add_argument("--transcript-words", type=int, default=1000)
+    parser.add_argument("--missing", type=float, default=0.01, help="Share of videos unknown to the API")
+    parser.add_argument("--output", help="JSON file for the results (default: pipeline-<commit>.json)")
+    parser.add_argument("--compare", help="Baseline JSON from an earlier run to compare against")
+    parser.add_argument("--keep", action="store_true", help="Keep the catalog, the logs and the schema")
+    args = parser.parse_args()
+
+    server = make_server(latency=args.latency, transcript_words=args.transcript_words)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    stub_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    commit = current_commit()
+    result = {
+        "commit": commit,
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "settings": {"latency": args.latency, "transcript_words": args.transcript_words, "missing": args.missing},
+        "runs": {},
+    }
+
+    work_directory = tempfile.mkdtemp(prefix="bench_pipeline-")
+    connection = database.connect()
+    try:
+        for n in args.videos:
+            result["runs"][str(n)] = run_size(connection, n, args, stub_url, work_directory)
+    finally:
+        if not args.keep:
+            shutil.rmtree(work_directory, ignore_errors=True)
+            with database.transaction(connection) as cursor:
+                cursor.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE;")
+        else:
+            print(f"Catalog and logs kept in {work_directory}")
+        database.release(connection)
+        server.shutdown()
+
+    output = args.output or f"pipeline-{commit or 'local'}.json"
+    with open(output, "w") as output_file:
+        json.dump(result, output_file, indent=2)
+    print(f"Results written to {output}")
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            compare(json.load(baseline_file), result)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+import argparse
+import time
+
+import pandas as pd
+
+import database
+import popularity_prediction
+
+# Benchmark of the popularity_rating write-back: the old per-row UPDATE + commit loop against the
+# COPY + UPDATE ... FROM path in popularity_prediction.write_popularity.
+# Uses the database from the usual DB_* variables, but only touches its own bench_writeback schema.
+# Run from the repository root: python -m benchmarks.bench_popularity_writeback --rows 20000
+
+
+# Function to create a scratch Fact_Video_Statistics with rows rows in the bench_writeback schema
+def prepare(connection, rows):
+    cursor = connection.cursor()
+    cursor.execute("DROP SCHEMA IF EXISTS bench_writeback CASCADE; CREATE SCHEMA bench_writeback;")
+    cursor.execute("SET search_path TO bench_writeback;")
+    cursor.execute("""
+        CREATE TABLE Fact_Video_Statistics (
+            video_id VARCHAR(15),
+            date_id INT,
+            view_count INT,
+            like_count INT,
+            comment_count INT,
+            timestamp TIMESTAMP NOT NULL,
+            popularity_rating VARCHAR(15) DEFAULT NULL,
+            PRIMARY KEY (video_id, date_id)
+        );
+        INSERT INTO Fact_Video_Statistics (video_id, date_id, view_count, like_count, comment_count, timestamp)
+        SELECT 'vid' || (i / 10), i %% 10, 1000, 10, 1, now() FROM generate_series(0, %s - 1) i;
+    """, (rows,))
+    connection.commit()
+    cursor.execute("SELECT video_id, date_id FROM Fact_Video_Statistics;")
+    df = pd.DataFrame(cursor.fetchall(), columns=['video_id', 'date_id'])
+    df['popularity_status'] = 'populair'
+    cursor.close()
+    return df
+
+
+# The write-back loop popularity_prediction.py used before: one UPDATE (matching video_id only) and one commit per row
+def legacy_write_popularity(connection, df):
+    cursor = connection.cursor()
+    for _, row in df.iterrows():
+        cursor.execute("""
+            UPDATE Fact_Video_Statistics
+            SET popularity_rating = %s
+            WHERE video_id = %s;
+        """, (row['popularity_status'], row['video_id']))
+        connection.commit()
+    cursor.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the popularity_rating write-back")
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--skip-legacy", action="store_true", help="Only time the bulk path")
+    args = parser.parse_args()
+
+    connection = popularity_prediction.connect_database()
+    try:
+        timings = {}
+        for name, write in [("legacy loop", legacy_write_popularity), ("COPY + UPDATE FROM", popularity_prediction.write_popularity)]:
+            if name == "legacy loop" and args.skip_legacy:
+                continue
+            df = prepare(connection, args.rows)
+            start = time.perf_counter()
+            write(connection, df)
+            timings[name] = time.perf_counter() - start
+            print(f"{name:<20} {args.rows} rows {timings[name]:8.2f}s {args.rows / timings[name]:10.0f} rows/s")
+        if len(timings) == 2:
+            print(f"speedup x{timings['legacy loop'] / timings['COPY + UPDATE FROM']:.1f}")
+    finally:
+        cursor = connection.cursor()
+        cursor.execute("DROP SCHEMA IF EXISTS bench_writeback CASCADE;")
+        connection.commit()
+        database.release(connection)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+import argparse
+import contextlib
+import io
+import multiprocessing
+import os
+import time
+
+# The workers connect with the usual DB_* variables; PGOPTIONS points every connection of this process
+# and its workers at the scratch schema
+os.environ["PGOPTIONS"] = "-c search_path=bench_queue"
+
+import database  # noqa: E402
+import popularity_prediction  # noqa: E402
+import scoring_queue  # noqa: E402
+
+# Benchmark of the work-queue scoring mode: the same backlog scored by 1, 2, 4, ... worker processes,
+# plus a crash test where a worker dies holding a lease and its rows are picked up after the lease expires.
+# Uses the database from the usual DB_* variables, but only touches its own bench_queue schema.
+# Run from the repository root: python -m benchmarks.bench_scoring_queue --rows 200000 --workers 1 2 4
+
+
+# Function to create a scratch Dim_Video and Fact_Video_Statistics with rows unrated rows
+def prepare(connection, rows):
+    cursor = connection.cursor()
+    cursor.execute("DROP SCHEMA IF EXISTS bench_queue CASCADE; CREATE SCHEMA bench_queue;")
+    cursor.execute("""
+        CREATE TABLE Dim_Video (
+            video_id VARCHAR(15) PRIMARY KEY,
+            duration TEXT NOT NULL,
+            category_id INT NOT NULL
+        );
+        CREATE TABLE Fact_Video_Statistics (
+            video_id VARCHAR(15),
+            date_id INT,
+            view_count INT,
+            like_count INT,
+            comment_count INT,
+            timestamp TIMESTAMP NOT NULL,
+            popularity_rating VARCHAR(15) DEFAULT NULL,
+            PRIMARY KEY (video_id, date_id)
+        );
+        INSERT INTO Dim_Video
+        SELECT 'vid' || i, (ARRAY['PT4M12S', 'PT9M', 'PT14M30S', 'PT18M2S'])[1 + i %% 4], (ARRAY[22, 24, 27, 28])[1 + i %% 4]
+        FROM generate_series(0, %(videos)s - 1) i;
+        INSERT INTO Fact_Video_Statistics (video_id, date_id, view_count, like_count, comment_count, timestamp)
+        SELECT 'vid' || (i / 30), 20240101 + i %% 30, 1000 + (i * 7919) %% 500000, (i * 104729) %% 20000,
+               (i * 1299709) %% 800, TIMESTAMP '2024-01-01' + (i %% 30) * INTERVAL '1 day'
+        FROM generate_series(0::bigint, %(rows)s - 1) i;
+    """, {"videos": rows // 30 + 1, "rows": rows})
+    connection.commit()
+    cursor.close()
+
+
+# Function to make every row unrated again and empty the queue
+def reset(connection):
+    cursor = connection.cursor()
+    cursor.execute("UPDATE Fact_Video_Statistics SET popularity_rating = NULL;")
+    cursor.execute("DROP TABLE IF EXISTS Popularity_Queue, Popularity_Queue_Means;")
+    connection.commit()
+    cursor.close()
+
+
+# Function to check that every row was scored and the queue is empty
+def check(connection):
+    cursor = connection.cursor()
+    cursor.execute("SELECT COUNT(*) FILTER (WHERE popularity_rating IS NULL) FROM Fact_Video_Statistics;")
+    unrated = cursor.fetchone()[0]
+    remaining = scoring_queue.queue_size(cursor)
+    connection.commit()
+    cursor.close()
+    return unrated, remaining
+
+
+# A worker that claims one chunk and dies without releasing it
+def crashing_worker(chunk):
+    with contextlib.redirect_stdout(io.StringIO()):
+        connection = popularity_prediction.connect_database()
+        scoring_queue.claim_chunk(connection, "crashed-worker", chunk)
+    os._exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the work-queue popularity scoring")
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--chunk", type=int, default=5000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--lease", type=int, default=3, help="Lease in seconds for the crash test")
+    args = parser.parse_args()
+
+    connection = popularity_prediction.connect_database()
+    try:
+        prepare(connection, args.rows)
+        print(f"{args.rows} rows, chunks of {args.chunk}, {os.cpu_count()} CPUs")
+
+        baseline = None
+        for workers in args.workers:
+            reset(connection)
+            scoring_queue.enqueue(connection)
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                scored = scoring_queue.launch(workers, args.chunk)
+            elapsed = time.perf_counter() - start
+            baseline = baseline or elapsed
+            unrated, remaining = check(connection)
+            print(f"workers={workers:<3} scored={scored:<8} {elapsed:7.2f}s {scored / elapsed:10.0f} rows/s  "
+                  f"speedup x{baseline / elapsed:.1f}  unrated={unrated} queued={remaining}")
+
+        # Crash test: one worker dies holding a chunk; the others finish the rest, then its rows after the lease
+        reset(connection)
+        scoring_queue.enqueue(connection)
+        scoring_queue.lease_seconds = args.lease
+        crashed = multiprocessing.Process(target=crashing_worker, args=(args.chunk,))
+        crashed.start()
+        crashed.join()
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            scored = scoring_queue.launch(2, args.chunk)
+        unrated, remaining = check(connection)
+        print(f"crash test: {args.chunk} rows leased by a dead worker, {scored} rows scored by the others in "
+              f"{time.perf_counter() - start:.2f}s (lease {args.lease}s)  unrated={unrated} queued={remaining}")
+    finally:
+        connection.rollback()
+        cursor = connection.cursor()
+        cursor.execute("DROP SCHEMA IF EXISTS bench_queue CASCADE;")
+        connection.commit()
+        database.release(connection)
+
+
+if __name__ == "__main__":
+    main()
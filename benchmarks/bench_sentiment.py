@@ -0,0 +1,113 @@
+import argparse
+import os
+import random
+import time
+
+# PGOPTIONS points the connection of this process at the scratch schema
+os.environ["PGOPTIONS"] = "-c search_path=bench_sentiment"
+
+import database  # noqa: E402
+import transcript  # noqa: E402
+
+# Benchmark of the sentiment stage: the old per-document path (transform + predict + UPDATE + commit per
+# video) against transcript.process_transcripts (one vectorize/predict call and one UPDATE per batch), and
+# a rerun and a backfill served from the sentiment cache.
+# Uses the database from the usual DB_* variables, but only touches its own bench_sentiment schema.
+# Run from the repository root: python -m benchmarks.bench_sentiment --transcripts 2000
+
+
+# Function to create a scratch Dim_Video and Dim_Transcript with synthetic transcripts
+def prepare(connection, count, words):
+    vocabulary = list(transcript.nlp_model.vocabulary_)
+    rng = random.Random(0)
+    rows = [(f"vid{i:08d}", " ".join(rng.choice(vocabulary) for _ in range(words))) for i in range(count)]
+
+    cursor = connection.cursor()
+    cursor.execute("DROP SCHEMA IF EXISTS bench_sentiment CASCADE; CREATE SCHEMA bench_sentiment;")
+    cursor.execute("""
+        CREATE TABLE Dim_Video (video_id VARCHAR(15) PRIMARY KEY, sentiment VARCHAR(15) DEFAULT NULL);
+        CREATE TABLE Dim_Transcript (video_id VARCHAR(15) PRIMARY KEY, transcript_text TEXT, language TEXT, version TEXT);
+    """)
+    transcript.psycopg2.extras.execute_values(cursor, "INSERT INTO Dim_Video (video_id) VALUES %s;",
+                                              [(video_id,) for video_id, _ in rows])
+    transcript.psycopg2.extras.execute_values(cursor, "INSERT INTO Dim_Transcript (video_id, transcript_text) VALUES %s;", rows)
+    connection.commit()
+    cursor.close()
+    transcript.create_transcript_tables()
+    return rows
+
+
+# Function to clear all sentiments (and the sentiment cache, unless keep_cache is set)
+def reset(connection, keep_cache=False):
+    cursor = connection.cursor()
+    cursor.execute("UPDATE Dim_Video SET sentiment = NULL;")
+    if not keep_cache:
+        cursor.execute("DELETE FROM Sentiment_Cache;")
+    connection.commit()
+    cursor.close()
+
+
+# The per-document path transcript.py used before: one transform/predict, one UPDATE and one commit per video
+def legacy_process(rows):
+    cursor = transcript.connectie.cursor()
+    for video_id, transcript_text in rows:
+        prediction = transcript.classificatie_model.predict(transcript.nlp_model.transform([transcript.clean_transcript(transcript_text)]))
+        cursor.execute("UPDATE Dim_Video SET sentiment = %s WHERE video_id = %s AND sentiment IS NULL;",
+                       ('positief' if prediction[0] == 1 else 'negatief', video_id))
+        transcript.connectie.commit()
+    cursor.close()
+
+
+def batched_process(rows, batch_size):
+    for start in range(0, len(rows), batch_size):
+        transcript.process_transcripts(rows[start:start + batch_size])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark per-document against batched sentiment classification")
+    parser.add_argument("--transcripts", type=int, default=2000)
+    parser.add_argument("--words", type=int, default=2000, help="Words per synthetic transcript")
+    parser.add_argument("--batch-size", type=int, nargs="+", default=[64, 1000])
+    args = parser.parse_args()
+
+    transcript.setup(transcript.connect_database(), transcript.load_models())
+    connection = transcript.connectie
+    try:
+        rows = prepare(connection, args.transcripts, args.words)
+        cursor = connection.cursor()
+        labels = {}
+
+        runs = [("per document", legacy_process)] + [
+            (f"batches of {size}", lambda rows, size=size: batched_process(rows, size)) for size in args.batch_size]
+        runs.append(("cached rerun", lambda rows: batched_process(rows, max(args.batch_size))))
+        baseline = None
+        for name, process in runs:
+            reset(connection, keep_cache=name == "cached rerun")
+            start = time.perf_counter()
+            process(rows)
+            elapsed = time.perf_counter() - start
+            baseline = baseline or elapsed
+            cursor.execute("SELECT video_id, sentiment FROM Dim_Video;")
+            labels[name] = dict(cursor.fetchall())
+            connection.commit()
+            print(f"{name:<18} {len(rows)} transcripts {elapsed:7.2f}s {len(rows) / elapsed:9.1f} transcripts/s  "
+                  f"speedup x{baseline / elapsed:.1f}")
+
+        reference = labels["per document"]
+        mismatches = sum(label != reference[video_id] for run in labels.values() for video_id, label in run.items())
+        print(f"Label mismatches against the per-document path: {mismatches}")
+
+        reset(connection, keep_cache=True)
+        start = time.perf_counter()
+        transcript.backfill_sentiment(max(args.batch_size))
+        print(f"backfill           {len(rows)} transcripts {time.perf_counter() - start:7.2f}s")
+    finally:
+        connection.rollback()
+        cursor = connection.cursor()
+        cursor.execute("DROP SCHEMA IF EXISTS bench_sentiment CASCADE;")
+        connection.commit()
+        database.release(connection)
+
+
+if __name__ == "__main__":
+    main()
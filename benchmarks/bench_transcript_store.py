@@ -0,0 +1,72 @@
+import argparse
+import os
+import random
+
+# PGOPTIONS points the connection of this process at the scratch schema
+os.environ["PGOPTIONS"] = "-c search_path=bench_transcript_store"
+
+import database  # noqa: E402
+import transcript  # noqa: E402
+import transcript_store  # noqa: E402
+
+# Benchmark of the compressed transcript storage: fills a scratch Dim_Transcript with plain synthetic
+# transcripts (a share of them duplicates, like reuploads), reports the table size and read throughput,
+# migrates the rows to Transcript_Blob and reports again.
+# Uses the database from the usual DB_* variables, but only touches its own bench_transcript_store schema.
+# Run from the repository root: python -m benchmarks.bench_transcript_store --transcripts 5000
+
+
+# Function to create a scratch Dim_Transcript with plain synthetic transcripts
+def prepare(connection, count, words, duplicates):
+    vocabulary = list(transcript.load_models()[0].vocabulary_)
+    rng = random.Random(0)
+    texts = []
+    for _ in range(count):
+        if texts and rng.random() < duplicates:
+            texts.append(rng.choice(texts))
+        else:
+            texts.append(" ".join(rng.choice(vocabulary) for _ in range(words)))
+
+    cursor = connection.cursor()
+    cursor.execute("DROP SCHEMA IF EXISTS bench_transcript_store CASCADE; CREATE SCHEMA bench_transcript_store;")
+    cursor.execute("CREATE TABLE Dim_Transcript (video_id VARCHAR(15) PRIMARY KEY, transcript_text TEXT, language TEXT, version TEXT);")
+    transcript.psycopg2.extras.execute_values(cursor, "INSERT INTO Dim_Transcript (video_id, transcript_text, language, version) VALUES %s;",
+                                              [(f"vid{i:08d}", text, "en", "1.0") for i, text in enumerate(texts)])
+    connection.commit()
+    cursor.close()
+    return dict((f"vid{i:08d}", text) for i, text in enumerate(texts))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark plain against compressed transcript storage")
+    parser.add_argument("--transcripts", type=int, default=5000)
+    parser.add_argument("--words", type=int, default=2000, help="Words per synthetic transcript")
+    parser.add_argument("--duplicates", type=float, default=0.1, help="Share of transcripts that repeat an earlier one")
+    args = parser.parse_args()
+
+    connection = transcript.connect_database()
+    try:
+        texts = prepare(connection, args.transcripts, args.words, args.duplicates)
+        transcript_store.report(connection, "plain     ")
+        transcript_store.migrate(connection)
+        connection.autocommit = True
+        connection.cursor().execute("VACUUM FULL Dim_Transcript;")
+        connection.autocommit = False
+        transcript_store.report(connection, f"{transcript_store.codec:<10}")
+
+        cursor = connection.cursor()
+        stored = dict(transcript_store.read(cursor, list(texts)))
+        cursor.execute("SELECT COUNT(*) FROM Transcript_Blob;")
+        print(f"{cursor.fetchone()[0]} blobs for {len(texts)} transcripts; "
+              f"mismatches after migration: {sum(stored[video_id] != text for video_id, text in texts.items())}")
+    finally:
+        connection.rollback()
+        connection.autocommit = False
+        cursor = connection.cursor()
+        cursor.execute("DROP SCHEMA IF EXISTS bench_transcript_store CASCADE;")
+        connection.commit()
+        database.release(connection)
+
+
+if __name__ == "__main__":
+    main()
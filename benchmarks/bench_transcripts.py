@@ -0,0 +1,78 @@
+import argparse
+import random
+import threading
+import time
+
+import requests
+
+import transcript
+
+# Benchmark of the concurrent transcript stage against a local fake transcript client with injected
+# latency and transient failures. The "writer" sleeps per transcript to stand in for the insert and the
+# sentiment update, so the numbers show how much of the database time the fetch threads hide.
+# Run from the repository root: python -m benchmarks.bench_transcripts --videos 500 --latency 0.3
+
+WORDS = ["great", "love", "terrible", "hope", "sad", "future", "idea", "talk", "world", "people"]
+
+
+# Fake transcript client: sleeps latency seconds per call, fails transiently with error_rate and has no
+# transcript for IDs starting with "missing"
+class FakeTranscriptClient:
+    def __init__(self, latency=0.3, error_rate=0.0, words=300):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.words = words
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def fetch(self, video_id):
+        with self.lock:
+            self.calls += 1
+        time.sleep(self.latency)
+        if video_id.startswith("missing"):
+            raise LookupError(f"No transcript for {video_id}")
+        if random.random() < self.error_rate:
+            raise requests.ConnectionError("Injected transient failure")
+        return " ".join(random.choice(WORDS) for _ in range(self.words))
+
+
+def run(video_ids, client, workers, rate_limit, write_time):
+    fetched = 0
+    failed = 0
+    start = time.perf_counter()
+    for video_id, text, error in transcript.fetch_transcripts(video_ids, client, workers, rate_limit):
+        if error is None:
+            fetched += 1
+        else:
+            failed += 1
+        time.sleep(write_time)
+    return fetched, failed, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the concurrent transcript stage with a fake client")
+    parser.add_argument("--videos", type=int, default=500)
+    parser.add_argument("--missing", type=float, default=0.05, help="Share of videos without a transcript")
+    parser.add_argument("--latency", type=float, default=0.3, help="Fake client latency per call in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.05, help="Share of calls failing transiently")
+    parser.add_argument("--write-time", type=float, default=0.01, help="Simulated database time per transcript")
+    parser.add_argument("--rate-limit", type=float, default=0, help="Requests per second, 0 for no limit")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8, 16])
+    args = parser.parse_args()
+
+    random.seed(0)
+    video_ids = [f"missing{i:07d}" if random.random() < args.missing else f"vid{i:08d}" for i in range(args.videos)]
+    print(f"{len(video_ids)} videos, {args.latency}s latency, {args.error_rate:.0%} transient errors, "
+          f"{args.write_time}s write per transcript")
+
+    baseline = None
+    for workers in args.workers:
+        client = FakeTranscriptClient(args.latency, args.error_rate)
+        fetched, failed, elapsed = run(video_ids, client, workers, args.rate_limit, args.write_time)
+        baseline = baseline or elapsed
+        print(f"workers={workers:<3} fetched={fetched:<6} failed={failed:<5} calls={client.calls:<6} {elapsed:7.2f}s  "
+              f"{fetched / elapsed:8.1f} transcripts/s  speedup x{baseline / elapsed:.1f}")
+
+
+if __name__ == "__main__":
+    main()
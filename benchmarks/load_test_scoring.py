@@ -0,0 +1,148 @@
+import argparse
+import contextlib
+import io
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import requests
+
+import features
+import model_runtime
+import popularity_prediction
+import scoring_service
+
+# Load test of the warm scoring service: concurrent clients send small popularity and sentiment requests,
+# with micro-batching off (every request is its own predict call) and on. The service runs in its own
+# process, as it does in production. The "cold" lines are the old way of scoring a small batch: load the
+# models, then predict, once per call.
+# Run from the repository root: python -m benchmarks.load_test_scoring --requests 2000 --clients 16
+
+
+# Function to make a synthetic chunk of statistics rows and its daily means
+def synthetic_rows(rng, rows):
+    df = pd.DataFrame({
+        'view_count': rng.integers(1000, 5_000_000, rows),
+        'like_count': rng.integers(0, 100_000, rows),
+        'comment_count': rng.integers(0, 5_000, rows),
+        'duration': rng.choice(['PT4M12S', 'PT9M', 'PT14M30S', 'PT18M2S', 'PT1H2M'], rows),
+        'category_id': rng.choice([22, 24, 27, 28], rows),
+        'timestamp': pd.Timestamp('2024-06-01') + pd.to_timedelta(rng.integers(0, 30, rows), unit='D'),
+    })
+    return df, features.daily_means_for(df)
+
+
+# Function to make synthetic cleaned transcripts from the model vocabulary
+def synthetic_documents(rng, count, words=300):
+    nlp_model, _ = model_runtime.load_sentiment_models()
+    vocabulary = list(nlp_model.vocabulary_)
+    return [" ".join(rng.choice(vocabulary, words)) for _ in range(count)]
+
+
+# Function to send the requests from concurrent clients; returns (latencies, elapsed seconds)
+def run_clients(url, requests_per_client, clients, make_request):
+    latencies = []
+    lock = threading.Lock()
+
+    def client_loop(client_index):
+        client = scoring_service.ScoringClient(url)
+        local = []
+        for i in range(requests_per_client):
+            start = time.perf_counter()
+            if make_request(client, client_index * requests_per_client + i) is None:
+                raise RuntimeError("Scoring service request failed")
+            local.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(local)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        list(executor.map(client_loop, range(clients)))
+    return np.array(latencies), time.perf_counter() - start
+
+
+# Function to start the service in its own process and wait until it answers /health
+def start_service(port, max_batch, max_wait_ms):
+    process = subprocess.Popen([sys.executable, "scoring_service.py", "--port", str(port),
+                                "--max-batch", str(max_batch), "--max-wait-ms", str(max_wait_ms)],
+                               stdout=subprocess.DEVNULL, env=os.environ.copy())
+    url = f"http://127.0.0.1:{port}"
+    for _ in range(300):
+        try:
+            if requests.get(f"{url}/health", timeout=1).ok:
+                return process, url
+        except requests.ConnectionError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError("Scoring service did not start")
+
+
+def report(label, latencies, elapsed):
+    print(f"{label:<36} p50={np.percentile(latencies, 50) * 1000:7.2f}ms  p99={np.percentile(latencies, 99) * 1000:7.2f}ms  "
+          f"{len(latencies) / elapsed:8.1f} req/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the warm scoring service")
+    parser.add_argument("--requests", type=int, default=2000, help="Requests per endpoint")
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--rows", type=int, default=20, help="Statistics rows per popularity request")
+    parser.add_argument("--max-wait-ms", type=float, default=2)
+    parser.add_argument("--cold-calls", type=int, default=20)
+    parser.add_argument("--port", type=int, default=8766)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    chunks = [synthetic_rows(rng, args.rows) for _ in range(32)]
+    documents = synthetic_documents(rng, 64)
+    per_client = max(1, args.requests // args.clients)
+    print(f"{args.clients} clients x {per_client} requests, {args.rows} rows per popularity request")
+
+    # Old way: load the models for every small scoring call
+    for runtime in ["sklearn", "numpy"]:
+        os.environ["MODEL_RUNTIME"] = runtime
+        latencies = []
+        start = time.perf_counter()
+        for i in range(args.cold_calls):
+            call_start = time.perf_counter()
+            scaler, model = popularity_prediction.load_models()
+            df, daily_means = chunks[i % len(chunks)]
+            with contextlib.redirect_stdout(io.StringIO()):
+                popularity_prediction.predict_chunk(df, daily_means, scaler, model)
+            latencies.append(time.perf_counter() - call_start)
+        report(f"cold {runtime} (load per call)", np.array(latencies), time.perf_counter() - start)
+    os.environ.pop("MODEL_RUNTIME")
+
+    for label, max_batch, max_wait_ms in [("warm, no micro-batching", 1, 0), ("warm, micro-batching", 4096, args.max_wait_ms)]:
+        process, url = start_service(args.port, max_batch, max_wait_ms)
+        try:
+            def popularity_request(client, i):
+                df, daily_means = chunks[i % len(chunks)]
+                return client.popularity_clusters(df, daily_means)
+
+            def sentiment_request(client, i):
+                return client.sentiments([documents[i % len(documents)]])
+
+            report(f"{label} /popularity", *run_clients(url, per_client, args.clients, popularity_request))
+            report(f"{label} /sentiment", *run_clients(url, per_client, args.clients, sentiment_request))
+
+            # Check the service returns exactly what in-process scoring returns
+            client = scoring_service.ScoringClient(url)
+            scaler, model = popularity_prediction.load_models()
+            with contextlib.redirect_stdout(io.StringIO()):
+                mismatches = sum(int((client.popularity_clusters(df, daily_means) !=
+                                      popularity_prediction.predict_chunk(df, daily_means, scaler, model)).sum())
+                                 for df, daily_means in chunks)
+            print(f"{'':<28} mismatches against in-process scoring: {mismatches}")
+        finally:
+            process.terminate()
+            process.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+import argparse
+import hashlib
+import json
+import random
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from benchmarks.synthetic_catalog import fake_transcript
+
+# Local stand-in for the YouTube Data API videos endpoint, so the pipeline can run offline.
+# Point the pipeline at it with YOUTUBE_API_URL=http://127.0.0.1:<port>
+# IDs that start with "missing" are never returned, to exercise the "no metadata found" path.
+# Every item carries an etag computed from the requested parts, like the real API; raising the revision
+# changes the title (and so the snippet etag) of about one video in ten.
+# It also serves the transcripts of benchmarks.synthetic_catalog as plain text at /transcripts/<video_id>
+# (404 when a video has none), for transcript.py with TRANSCRIPT_SERVICE_URL=http://127.0.0.1:<port>
+
+MAX_IDS_PER_REQUEST = 50
+
+
+# Function to build deterministic fake metadata for a video ID, limited to the requested parts
+def fake_video_item(video_id, parts=("snippet", "contentDetails", "statistics"), revision=0):
+    digest = int(hashlib.sha1(video_id.encode()).hexdigest(), 16)
+    views = 1000 + digest % 5000000
+    edition = revision if digest % 10 == 0 else 0
+    resource = {
+        "snippet": {
+            "publishedAt": f"20{10 + digest % 14:02d}-{1 + digest % 12:02d}-{1 + digest % 28:02d}T12:00:00Z",
+            "channelId": "UCAuUUnT6oDeKwE6v1NGQxug",
+            "title": f"Stub talk {video_id}" + (f" (edit {edition})" if edition else ""),
+            "channelTitle": "TED",
+            "categoryId": str([22, 24, 27, 28, 29][digest % 5])
+        },
+        "contentDetails": {
+            "duration": f"PT{digest % 25}M{digest % 60}S"
+        },
+        "statistics": {
+            "viewCount": str(views),
+            "likeCount": str(views // (20 + digest % 30)),
+            "commentCount": str(views // (500 + digest % 500))
+        }
+    }
+    item = {"kind": "youtube#video", "id": video_id}
+    item.update({part: resource[part] for part in parts if part in resource})
+    item["etag"] = hashlib.sha1(json.dumps(item, sort_keys=True).encode()).hexdigest()[:27]
+    return item
+
+
+class StubYouTubeHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real API
+    latency = 0.0
+    error_rate = 0.0
+    revision = 0
+    transcript_words = 1000
+    request_count = 0
+
+    def do_GET(self):
+        type(self).request_count += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if self.error_rate and random.random() < self.error_rate:
+            self.send_error(random.choice([429, 503]))
+            return
+
+        url = urlparse(self.path)
+        segments = url.path.rstrip("/").split("/")
+        if len(segments) >= 2 and segments[-2] == "transcripts":
+            self.send_transcript(segments[-1])
+            return
+        if segments[-1] != "videos":
+            self.send_error(404)
+            return
+
+        query = parse_qs(url.query)
+        video_ids = [video_id for video_id in ",".join(query.get("id", [])).split(",") if video_id]
+        if len(video_ids) > MAX_IDS_PER_REQUEST:
+            self.send_error(400, "Too many video IDs")
+            return
+
+        parts = [part for part in ",".join(query.get("part", ["snippet,contentDetails,statistics"])).split(",") if part]
+        items = [fake_video_item(video_id, parts, self.revision)
+                 for video_id in video_ids if not video_id.startswith("missing")]
+        body = json.dumps({"kind": "youtube#videoListResponse", "items": items}).encode()
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_transcript(self, video_id):
+        text = fake_transcript(video_id, self.transcript_words)
+        if text is None or video_id.startswith("missing"):
+            self.send_error(404, "No transcript")
+            return
+        body = text.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+# Function to create a stub server; port 0 picks a free port (see server.server_address)
+def make_server(host="127.0.0.1", port=0, latency=0.0, error_rate=0.0, revision=0, transcript_words=1000):
+    handler = type("ConfiguredStubYouTubeHandler", (StubYouTubeHandler,),
+                   {"latency": latency, "error_rate": error_rate, "revision": revision,
+                    "transcript_words": transcript_words, "request_count": 0})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stub for the YouTube Data API videos endpoint")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds of delay added to every response")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 429/503")
+    parser.add_argument("--revision", type=int, default=0, help="Change the titles of ~10%% of the videos")
+    parser.add_argument("--transcript-words", type=int, default=1000, help="Words per synthetic transcript")
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port, args.latency, args.error_rate, args.revision, args.transcript_words)
+    print(f"Stub YouTube API listening on http://{args.host}:{server.server_address[1]}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+import argparse
+import base64
+import hashlib
+import os
+import random
+
+# Synthetic TED catalog for the offline benchmarks: YouTube-style video IDs, a directory of video files to
+# stand in for the SFTP share (DISCOVERY_SOURCE=local), and a deterministic transcript per video. The
+# metadata and statistics of the same IDs come from stub_youtube_api.fake_video_item, so a catalog can be
+# regenerated anywhere without storing it.
+#
+#   python -m benchmarks.synthetic_catalog /tmp/catalog --videos 10000
+
+# IDs that start with "missing" are not known to the stub API (deleted or private videos)
+MISSING_PREFIX = "missing"
+
+# Share of videos without a transcript, and of videos whose transcript repeats another one (reuploads)
+NO_TRANSCRIPT_SHARE = 0.02
+DUPLICATE_SHARE = 0.03
+
+# Word pools for the transcripts: mostly neutral talk words with a per-video mix of positive and negative
+# ones, so both sentiment labels occur
+NEUTRAL_WORDS = ("people world idea think know time year work city school science music story question "
+                 "water energy brain design data future history children country problem change start "
+                 "technology human life system power language money planet learn build share today").split()
+POSITIVE_WORDS = "great love hope amazing beautiful wonderful inspire happy success joy brilliant kind".split()
+NEGATIVE_WORDS = "terrible sad fear poverty war crisis pain fail hate loss danger violence".split()
+
+
+# Function to get the YouTube-style ID (11 characters) of the video with the given index
+def video_id(index, missing_share=0.0):
+    digest = hashlib.sha1(f"ted-{index}".encode()).digest()
+    if int.from_bytes(digest[:4], "big") / 2 ** 32 < missing_share:
+        return f"{MISSING_PREFIX}{index:04d}"
+    return base64.urlsafe_b64encode(digest).decode()[:11]
+
+
+# Function to get the IDs of a catalog of n videos
+def video_ids(n, missing_share=0.0):
+    return [video_id(index, missing_share) for index in range(n)]
+
+
+# Function to write one (sparse) file per video into directory; returns the number of files written
+def write_video_files(directory, ids):
+    os.makedirs(directory, exist_ok=True)
+    for vid in ids:
+        path = os.path.join(directory, f"{vid}.mp4")
+        with open(path, "wb") as video_file:
+            video_file.truncate(50_000_000 + int(hashlib.sha1(vid.encode()).hexdigest()[:6], 16))
+    return len(ids)
+
+
+# Function to get the transcript of a video, or None when it has none. Duplicates repeat the transcript
+# of another video exactly.
+def fake_transcript(vid, words=1000):
+    digest = int(hashlib.sha1(f"transcript-{vid}".encode()).hexdigest(), 16)
+    share = (digest % 10000) / 10000
+    if share < NO_TRANSCRIPT_SHARE:
+        return None
+    if share < NO_TRANSCRIPT_SHARE + DUPLICATE_SHARE:
+        vid = f"original-{digest % 10}"
+
+    rng = random.Random(vid)
+    tone = rng.random()
+    sentences = []
+    count = 0
+    while count < words:
+        length = rng.randint(6, 20)
+        sentence = []
+        for _ in range(length):
+            draw = rng.random()
+            if draw < 0.08 * tone:
+                sentence.append(rng.choice(POSITIVE_WORDS))
+            elif draw < 0.08:
+                sentence.append(rng.choice(NEGATIVE_WORDS))
+            else:
+                sentence.append(rng.choice(NEUTRAL_WORDS))
+        sentences.append(" ".join(sentence).capitalize() + ".")
+        count += length
+    return " ".join(sentences)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic catalog of video files")
+    parser.add_argument("directory")
+    parser.add_argument("--videos", type=int, default=1000)
+    parser.add_argument("--missing", type=float, default=0.01, help="Share of IDs unknown to the API")
+    args = parser.parse_args()
+
+    print(f"Wrote {write_video_files(args.directory, video_ids(args.videos, args.missing))} video files to {args.directory}")
+
+
+if __name__ == "__main__":
+    main()
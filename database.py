@@ -0,0 +1,230 @@
+import contextlib
+import json
+import os
+import threading
+
+import psycopg2
+import psycopg2.extensions
+import psycopg2.pool
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Shared database access for the pipeline scripts. Connections come from one thread-safe pool per process
+# (connect()/release()), transaction() scopes many statements into one commit, stream() reads large
+# results through a server-side cursor and execute_prepared() runs per-row statements as prepared
+# statements. Every connection counts the connections opened and the statements, commits and rollbacks
+# sent, so each run can report them (report()).
+
+# Pool size per process: connections kept open, and the most that can be checked out at once
+pool_min_connections = int(os.getenv("DB_POOL_MIN", "1"))
+pool_max_connections = int(os.getenv("DB_POOL_MAX", "8"))
+
+# synchronous_commit for bulk transactions (see transaction()); "on" (the server default) waits for the WAL
+# flush. With DB_BULK_SYNCHRONOUS_COMMIT=off a commit returns before its WAL is flushed: a crash can lose
+# the last few bulk commits (in order, never partially), and every bulk phase recomputes what is missing on
+# the next run.
+bulk_synchronous_commit = os.getenv("DB_BULK_SYNCHRONOUS_COMMIT", "on")
+
+
+# Counters of one process; updated from every thread that uses a connection
+class DatabaseStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.connections = 0
+            self.checkouts = 0
+            self.statements = 0
+            self.commits = 0
+            self.rollbacks = 0
+
+    def count(self, name):
+        with self.lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    # Function to get the counts as a dict; round_trips counts every statement, commit and rollback sent
+    def as_dict(self):
+        with self.lock:
+            return {"connections": self.connections, "checkouts": self.checkouts, "statements": self.statements,
+                    "commits": self.commits, "rollbacks": self.rollbacks,
+                    "round_trips": self.statements + self.commits + self.rollbacks}
+
+
+stats = DatabaseStats()
+
+
+# psycopg2 cursor that counts the statements it sends (and the FETCHes of a named, server-side cursor)
+class CountingCursor(psycopg2.extensions.cursor):
+    def execute(self, query, vars=None):
+        stats.count("statements")
+        return super().execute(query, vars)
+
+    def executemany(self, query, vars_list):
+        stats.count("statements")
+        return super().executemany(query, vars_list)
+
+    def copy_expert(self, sql, file, *args, **kwargs):
+        stats.count("statements")
+        return super().copy_expert(sql, file, *args, **kwargs)
+
+    def fetchmany(self, *args, **kwargs):
+        if self.name:
+            stats.count("statements")
+        return super().fetchmany(*args, **kwargs)
+
+
+# psycopg2 connection that counts commits and rollbacks, hands out counting cursors and remembers its
+# prepared statements
+class CountingConnection(psycopg2.extensions.connection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cursor_factory = CountingCursor
+        self.prepared = set()
+        stats.count("connections")
+
+    def commit(self):
+        super().commit()
+        stats.count("commits")
+
+    def rollback(self):
+        super().rollback()
+        stats.count("rollbacks")
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+# Function to get the connection details from the environment
+def connection_parameters():
+    parameters = {
+        "database": os.getenv("DB_NAME"),
+        "user": os.getenv("DB_USER"),
+        "host": os.getenv("DB_HOST"),
+        "password": os.getenv("DB_PASSWORD"),
+        "port": os.getenv("DB_PORT"),
+    }
+    if not all(parameters.values()):
+        raise ValueError("Missing one or more environment variables for database connection.")
+    return parameters
+
+
+# Function to get the pool of this process. Worker processes forked from a process that already had a
+# pool get their own (and their own counts); the inherited connections belong to the parent and are left
+# alone.
+def get_pool():
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            if _pool_pid not in (None, os.getpid()):
+                stats.reset()
+            _pool = psycopg2.pool.ThreadedConnectionPool(pool_min_connections, pool_max_connections,
+                                                         connection_factory=CountingConnection,
+                                                         **connection_parameters())
+            _pool_pid = os.getpid()
+        return _pool
+
+
+# Function to check a connection out of the pool; give it back with release()
+def connect():
+    connection = get_pool().getconn()
+    stats.count("checkouts")
+    return connection
+
+
+# Function to return a connection to the pool (an open transaction is rolled back first)
+def release(connection):
+    if _pool is not None and _pool_pid == os.getpid():
+        _pool.putconn(connection)
+    else:
+        connection.close()
+
+
+# Function to close every pooled connection of this process
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            _pool.closeall()
+        _pool = None
+
+
+# Context manager for a connection from the pool
+@contextlib.contextmanager
+def pooled_connection():
+    connection = connect()
+    try:
+        yield connection
+    finally:
+        release(connection)
+
+
+# Function to apply bulk_synchronous_commit to the current transaction only
+def use_bulk_commit(cursor):
+    cursor.execute("SET LOCAL synchronous_commit = %s;", (bulk_synchronous_commit,))
+
+
+# Context manager for one transaction: yields a cursor, commits when the block succeeds and rolls back
+# when it raises. bulk=True applies bulk_synchronous_commit to this transaction.
+@contextlib.contextmanager
+def transaction(connection, bulk=False):
+    cursor = connection.cursor()
+    try:
+        if bulk:
+            use_bulk_commit(cursor)
+        yield cursor
+        connection.commit()
+    except BaseException:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+# Context manager to read a query result in chunks of chunk_size rows from a named server-side cursor;
+# yields an iterator over the chunks. The cursor is declared WITH HOLD and committed right away (together
+# with anything the caller had pending), so it stays open across the commits and rollbacks the caller makes
+# between chunks. The cursor is closed and the transaction committed when the block ends; when the block
+# raises, the caller's pending work is rolled back instead.
+@contextlib.contextmanager
+def stream(connection, name, sql, params=None, chunk_size=10000):
+    cursor = connection.cursor(name=name, withhold=True)
+    cursor.itersize = chunk_size
+    cursor.execute(sql, params)
+    connection.commit()
+    try:
+        yield iter(lambda: cursor.fetchmany(chunk_size), [])
+    except BaseException:
+        connection.rollback()
+        cursor.close()
+        connection.commit()
+        raise
+    cursor.close()
+    connection.commit()
+
+
+# Function to execute a statement as a prepared statement: it is parsed and planned once per connection
+# (PREPARE on first use, kept while the connection lives in the pool) and then run with EXECUTE.
+# sql uses $1, $2, ... placeholders.
+def execute_prepared(cursor, name, sql, params):
+    prepared = cursor.connection.prepared
+    if name not in prepared:
+        cursor.execute(f"PREPARE {name} AS {sql};")
+        prepared.add(name)
+    cursor.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(params))});", params)
+
+
+# Function to print the connection, statement and commit counts of this process. When DB_STATS_FILE is set
+# they are also written there as JSON (the benchmark harness reads them).
+def report(label="Database"):
+    counts = stats.as_dict()
+    print(f"{label}: {counts['connections']} connections opened, {counts['checkouts']} checked out of the pool, "
+          f"{counts['statements']} statements, {counts['commits']} commits, {counts['rollbacks']} rollbacks.")
+    stats_file = os.getenv("DB_STATS_FILE")
+    if stats_file:
+        with open(stats_file, "w") as output:
+            json.dump(counts, output)
@@ -0,0 +1,59 @@
+import datetime
+
+import psycopg2.extras
+
+
+# In-process cache for the Dim_Date and Dim_Category lookups done for every video.
+# Dim_Date rows are loaded once for a date range and indexed by ordinal day, so lookups need no
+# round trip; a date outside the loaded range falls back to one query and the result is memoized.
+class DimensionCache:
+    def __init__(self, cursor):
+        self.cursor = cursor
+        self.date_ids = {}  # date.toordinal() -> date_id (None when Dim_Date has no row for that day)
+        self.category_ids = set()
+        self.date_lookups = 0
+        self.date_queries = 0
+
+    # Function to load the Dim_Date rows between two dates (inclusive) into the cache
+    def load_dates(self, start, end):
+        self.cursor.execute("""
+            SELECT date_id, year, month, day FROM Dim_Date
+            WHERE (year, month, day) BETWEEN (%s, %s, %s) AND (%s, %s, %s);
+        """, (start.year, start.month, start.day, end.year, end.month, end.day))
+        self.date_queries += 1
+        for date_id, year, month, day in self.cursor.fetchall():
+            self.date_ids[datetime.date(year, month, day).toordinal()] = date_id
+        return len(self.date_ids)
+
+    # Function to get the date_id for a date or datetime, querying Dim_Date only on a cache miss
+    def date_id(self, date):
+        if isinstance(date, datetime.datetime):
+            date = date.date()
+        key = date.toordinal()
+        self.date_lookups += 1
+        if key not in self.date_ids:
+            self.cursor.execute("""
+                SELECT date_id FROM Dim_Date WHERE year = %s AND month = %s AND day = %s;
+            """, (date.year, date.month, date.day))
+            self.date_queries += 1
+            result = self.cursor.fetchone()
+            self.date_ids[key] = result[0] if result else None
+        return self.date_ids[key]
+
+    # Function to write the static category mapping to Dim_Category once; the caller commits
+    def sync_categories(self, categories):
+        psycopg2.extras.execute_values(self.cursor, """
+            INSERT INTO Dim_Category (category_id, category)
+            VALUES %s
+            ON CONFLICT (category_id) DO UPDATE
+            SET category = EXCLUDED.category;
+        """, list(categories.items()))
+        self.category_ids.update(categories)
+
+    # Function to return the category IDs that are not known to be in Dim_Category yet
+    def missing_categories(self, category_ids):
+        return {category_id for category_id in category_ids if category_id not in self.category_ids}
+
+    # Function to record category IDs as present once the transaction that inserted them has committed
+    def mark_categories(self, category_ids):
+        self.category_ids.update(category_ids)
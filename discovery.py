@@ -0,0 +1,135 @@
+import datetime
+import os
+import stat
+
+import paramiko
+import psycopg2.extras
+
+
+# A video file in the remote directory; the video ID is the file name without extension
+class VideoFile:
+    def __init__(self, file_name, size, mtime):
+        self.file_name = file_name
+        self.video_id = os.path.splitext(file_name)[0]
+        self.size = size
+        self.mtime = mtime
+
+
+# Result of one discovery pass: which videos need a full ingest and which only need their stats refreshed
+# (details_due is the part of stale whose snippet/contentDetails should be re-checked as well)
+class DiscoveryResult:
+    def __init__(self, new_or_changed, stale, present, details_due=None):
+        self.new_or_changed = new_or_changed
+        self.stale = stale
+        self.present = present
+        self.details_due = details_due or []
+
+    # Function to return every video ID the ingest stage has to fetch this run
+    def to_ingest(self):
+        return self.new_or_changed + self.stale
+
+
+# Function to create the manifest table that remembers what the previous runs saw
+def create_manifest_table(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS Video_Manifest (
+            video_id VARCHAR(15) PRIMARY KEY,
+            file_name TEXT NOT NULL,
+            file_size BIGINT,
+            file_mtime BIGINT,
+            present BOOLEAN NOT NULL DEFAULT TRUE,
+            first_seen TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            last_seen TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            last_ingested TIMESTAMP DEFAULT NULL,
+            last_details_check TIMESTAMP DEFAULT NULL
+        );
+    """)
+    cursor.execute("ALTER TABLE Video_Manifest ADD COLUMN IF NOT EXISTS last_details_check TIMESTAMP DEFAULT NULL;")
+
+
+# Function to list the video files (with size and mtime) in the remote directory over SFTP
+def list_sftp_files(host, username, password, directory):
+    ssh = paramiko.SSHClient()
+    ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+    ssh.connect(host, username=username, password=password)
+
+    sftp = ssh.open_sftp()
+    try:
+        return [VideoFile(attr.filename, attr.st_size, attr.st_mtime)
+                for attr in sftp.listdir_attr(directory) if not stat.S_ISDIR(attr.st_mode or 0)]
+    finally:
+        sftp.close()
+        ssh.close()
+
+
+# Function to list the video files in a local directory (stand-in for the SFTP share in offline runs)
+def list_local_files(directory):
+    with os.scandir(directory) as entries:
+        return [VideoFile(entry.name, entry.stat().st_size, int(entry.stat().st_mtime))
+                for entry in entries if entry.is_file()]
+
+
+# Function to diff the current listing against Video_Manifest and record the listing; the caller commits.
+# Videos that are new or whose size/mtime changed need a full ingest; unchanged videos whose last ingest
+# is older than refresh_interval only need their statistics refreshed, and their details re-checked when the
+# last details check is older than details_interval.
+def discover(cursor, video_files, refresh_interval, details_interval=None):
+    cursor.execute("SELECT video_id, file_size, file_mtime, last_ingested, last_details_check FROM Video_Manifest;")
+    manifest = {row[0]: row[1:] for row in cursor.fetchall()}
+
+    now = datetime.datetime.now()
+    files = {video_file.video_id: video_file for video_file in video_files}
+    new_or_changed = []
+    stale = []
+    details_due = []
+    for video_id, video_file in files.items():
+        known = manifest.get(video_id)
+        if known is None or (known[0], known[1]) != (video_file.size, video_file.mtime) or known[2] is None:
+            new_or_changed.append(video_id)
+        elif known[2] <= now - refresh_interval:
+            stale.append(video_id)
+            if details_interval is not None and (known[3] is None or known[3] <= now - details_interval):
+                details_due.append(video_id)
+
+    if files:
+        psycopg2.extras.execute_values(cursor, """
+            INSERT INTO Video_Manifest (video_id, file_name, file_size, file_mtime, present, first_seen, last_seen)
+            VALUES %s
+            ON CONFLICT (video_id) DO UPDATE
+            SET file_name = EXCLUDED.file_name,
+                file_size = EXCLUDED.file_size,
+                file_mtime = EXCLUDED.file_mtime,
+                present = TRUE,
+                last_seen = EXCLUDED.last_seen;
+        """, [(f.video_id, f.file_name, f.size, f.mtime, True, now, now) for f in files.values()], page_size=1000)
+
+    # Files that disappeared from the share stay in the manifest but are no longer handed downstream
+    cursor.execute("UPDATE Video_Manifest SET present = FALSE WHERE present AND last_seen < %s;", (now,))
+
+    return DiscoveryResult(new_or_changed, stale, sorted(files), details_due)
+
+
+# Function to record that the ingest stage stored these videos; the caller commits
+def mark_ingested(cursor, video_ids):
+    _set_timestamp(cursor, "last_ingested", video_ids)
+
+
+# Function to record that the snippet/contentDetails of these videos were checked; the caller commits
+def mark_details_checked(cursor, video_ids):
+    _set_timestamp(cursor, "last_details_check", video_ids)
+
+
+def _set_timestamp(cursor, column, video_ids):
+    now = datetime.datetime.now()
+    if video_ids:
+        psycopg2.extras.execute_values(cursor, f"""
+            UPDATE Video_Manifest m SET {column} = v.checked
+            FROM (VALUES %s) AS v(video_id, checked)
+            WHERE m.video_id = v.video_id;
+        """, [(video_id, now) for video_id in video_ids], page_size=1000)
+
+
+# Function to return the video IDs currently on the share, as recorded by the last discovery pass
+def present_video_ids(cursor):
+    cursor.execute("SELECT video_id FROM Video_Manifest WHERE present ORDER BY video_id;")
+    return [row[0] for row in cursor.fetchall()]
@@ -0,0 +1,214 @@
+import argparse
+import io
+import os
+
+import pandas as pd
+
+import database
+import features
+
+# Incremental feature store for the daily video statistics. Feature_Video_Statistics keeps, per
+# (video_id, date_id), the inputs a statistics row was built from and the per-row features that do not
+# depend on other rows (duration_bin, category_popularity). Feature_Daily_Totals keeps running sums and
+# counts of like_count/comment_count per date, so the all-row daily means are never recomputed from the raw
+# rows. The Video_Features view combines both into the model features (imputed ratios and interaction score)
+# for retraining and the dashboards. With FEATURE_STORE=1 scoring also reads duration_bin and
+# category_popularity from the store; it imputes with the daily means of the unrated rows, like the other
+# scoring paths.
+#
+# refresh() only processes fact rows that are new or whose counts, timestamp date, duration or category
+# changed since they were stored; running it again on unchanged data writes nothing. Historical statistics
+# do not change, so by default only rows from the latest stored date_id on are compared, plus every unrated
+# row whatever its date (it may be missing from the store because its Dim_Video row only appeared after its
+# day was processed, or its video details may have changed since), so scoring never reads stale features;
+# a full refresh compares every row and also picks up backfilled days and changed video details.
+# Refresh by hand with: python feature_store.py [--full]
+
+# Number of changed fact rows processed per transaction
+refresh_chunk_size = int(os.getenv("FEATURE_STORE_CHUNK_SIZE", "50000"))
+
+# Advisory lock key, so concurrent refreshes (e.g. several scoring workers) do not count a row twice
+REFRESH_LOCK_ID = 61500
+
+# Version of the Video_Features definition below, stored as the comment of the view; raise it when the
+# definition changes so the next refresh replaces the view
+VIDEO_FEATURES_VERSION = 1
+
+
+# Function to create the feature tables and the Video_Features view. CREATE OR REPLACE VIEW takes an ACCESS
+# EXCLUSIVE lock on a view the dashboard reads, so it only runs when the view is missing or its stored
+# version differs from VIDEO_FEATURES_VERSION; on every later refresh this is a catalog lookup.
+def create_feature_tables(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS Feature_Video_Statistics (
+            video_id VARCHAR(15),
+            date_id INT,
+            date DATE NOT NULL,
+            view_count INT,
+            like_count INT,
+            comment_count INT,
+            duration TEXT,
+            category_id INT,
+            duration_bin SMALLINT NOT NULL,
+            category_popularity SMALLINT NOT NULL,
+            PRIMARY KEY (video_id, date_id)
+        );
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS Feature_Daily_Totals (
+            date DATE PRIMARY KEY,
+            like_sum BIGINT NOT NULL,
+            comment_sum BIGINT NOT NULL,
+            row_count BIGINT NOT NULL
+        );
+    """)
+    cursor.execute("SELECT obj_description(to_regclass('video_features'), 'pg_class');")
+    if cursor.fetchone()[0] == f"version {VIDEO_FEATURES_VERSION}":
+        return
+    cursor.execute("""
+        CREATE OR REPLACE VIEW Video_Features AS
+        SELECT fs.video_id, fs.date_id, fs.date,
+               i.likes / NULLIF(fs.view_count, 0) AS like_view_ratio,
+               i.comments / NULLIF(fs.view_count, 0) AS comment_view_ratio,
+               (i.likes + i.comments) / NULLIF(fs.view_count, 0) AS interaction_score,
+               fs.duration_bin,
+               fs.category_popularity
+        FROM Feature_Video_Statistics fs
+        JOIN Feature_Daily_Totals t ON t.date = fs.date
+        CROSS JOIN LATERAL (
+            SELECT CASE WHEN fs.like_count = 0 THEN (t.like_sum::numeric / t.row_count)::float8 ELSE fs.like_count END AS likes,
+                   CASE WHEN fs.comment_count = 0 THEN (t.comment_sum::numeric / t.row_count)::float8 ELSE fs.comment_count END AS comments
+        ) i;
+    """)
+    cursor.execute(f"COMMENT ON VIEW Video_Features IS 'version {VIDEO_FEATURES_VERSION}';")
+
+
+# Function to bring the store up to date with Fact_Video_Statistics and Dim_Video.
+# Returns the number of fact rows that were (re)computed.
+def refresh(connection, full=False):
+    cursor = connection.cursor()
+    create_feature_tables(cursor)
+    cursor.execute("""
+        CREATE TEMP TABLE IF NOT EXISTS feature_updates (
+            video_id VARCHAR(15),
+            date_id INT,
+            date DATE,
+            view_count INT,
+            like_count INT,
+            comment_count INT,
+            duration TEXT,
+            category_id INT,
+            duration_bin SMALLINT,
+            category_popularity SMALLINT
+        ) ON COMMIT DELETE ROWS;
+    """)
+    connection.commit()
+    cursor.execute("SELECT pg_advisory_lock(%s);", (REFRESH_LOCK_ID,))
+    cursor.close()
+
+    # New or changed rows only (the server-side cursor stays open across the per-chunk commits)
+    changed_sql = """
+        SELECT fvs.video_id, fvs.date_id, fvs.timestamp::date, fvs.view_count, fvs.like_count, fvs.comment_count,
+               dv.duration, dv.category_id
+        FROM Fact_Video_Statistics fvs
+        JOIN Dim_Video dv ON dv.video_id = fvs.video_id
+        LEFT JOIN Feature_Video_Statistics fs ON fs.video_id = fvs.video_id AND fs.date_id = fvs.date_id
+        WHERE (%(full)s OR fvs.date_id >= (SELECT COALESCE(MAX(date_id), 0) FROM Feature_Video_Statistics)
+               OR fvs.popularity_rating IS NULL)
+          AND (fs.video_id IS NULL
+               OR (fs.date, fs.view_count, fs.like_count, fs.comment_count, fs.duration, fs.category_id)
+                  IS DISTINCT FROM (fvs.timestamp::date, fvs.view_count, fvs.like_count, fvs.comment_count, dv.duration, dv.category_id));
+    """
+
+    refreshed = 0
+    try:
+        with database.stream(connection, "changed_video_statistics", changed_sql, {"full": full},
+                             refresh_chunk_size) as chunks:
+            for rows in chunks:
+                df = pd.DataFrame(rows, columns=['video_id', 'date_id', 'date', 'view_count', 'like_count',
+                                                 'comment_count', 'duration', 'category_id'])
+                df['duration_bin'] = features.duration_bins(features.duration_to_seconds(df['duration']))
+                df['category_popularity'] = features.category_popularity_for(df['category_id'].to_numpy()).astype(int)
+                store_rows(connection, df)
+                refreshed += len(df)
+    finally:
+        cursor = connection.cursor()
+        cursor.execute("SELECT pg_advisory_unlock(%s);", (REFRESH_LOCK_ID,))
+        connection.commit()
+        cursor.close()
+
+    if refreshed:
+        print(f"Feature store: {refreshed} statistics rows added or updated.")
+    return refreshed
+
+
+# Function to write one chunk of (re)computed rows in one bulk transaction: the daily totals get the new
+# counts added and the previously stored counts of the same rows subtracted, then the rows are upserted
+def store_rows(connection, df):
+    with database.transaction(connection, bulk=True) as cursor:
+        copy_rows(cursor, df)
+
+
+# Function to COPY a chunk into feature_updates and apply it to the totals and the rows (no commit)
+def copy_rows(cursor, df):
+    buffer = io.StringIO()
+    df.to_csv(buffer, sep='\t', header=False, index=False, na_rep='\\N')
+    buffer.seek(0)
+    cursor.copy_expert("""
+        COPY feature_updates (video_id, date_id, date, view_count, like_count, comment_count, duration, category_id,
+                              duration_bin, category_popularity) FROM STDIN
+    """, buffer)
+
+    cursor.execute("""
+        INSERT INTO Feature_Daily_Totals AS t (date, like_sum, comment_sum, row_count)
+        SELECT date, SUM(like_count), SUM(comment_count), SUM(row_count)
+        FROM (
+            SELECT u.date, u.like_count, u.comment_count, 1 AS row_count
+            FROM feature_updates u
+            UNION ALL
+            SELECT fs.date, -fs.like_count, -fs.comment_count, -1
+            FROM Feature_Video_Statistics fs
+            JOIN feature_updates u ON u.video_id = fs.video_id AND u.date_id = fs.date_id
+        ) changes
+        GROUP BY date
+        ON CONFLICT (date) DO UPDATE
+        SET like_sum = t.like_sum + EXCLUDED.like_sum,
+            comment_sum = t.comment_sum + EXCLUDED.comment_sum,
+            row_count = t.row_count + EXCLUDED.row_count;
+    """)
+    cursor.execute("""
+        INSERT INTO Feature_Video_Statistics (video_id, date_id, date, view_count, like_count, comment_count, duration,
+                                              category_id, duration_bin, category_popularity)
+        SELECT video_id, date_id, date, view_count, like_count, comment_count, duration, category_id,
+               duration_bin, category_popularity
+        FROM feature_updates
+        ON CONFLICT (video_id, date_id) DO UPDATE
+        SET date = EXCLUDED.date,
+            view_count = EXCLUDED.view_count,
+            like_count = EXCLUDED.like_count,
+            comment_count = EXCLUDED.comment_count,
+            duration = EXCLUDED.duration,
+            category_id = EXCLUDED.category_id,
+            duration_bin = EXCLUDED.duration_bin,
+            category_popularity = EXCLUDED.category_popularity;
+    """)
+
+
+def main():
+    import popularity_prediction
+
+    parser = argparse.ArgumentParser(description="Refresh the incremental feature store")
+    parser.add_argument("--full", action="store_true", help="Compare every statistics row, not only the latest dates")
+    args = parser.parse_args()
+
+    connection = popularity_prediction.connect_database()
+    try:
+        print(f"Feature store refreshed: {refresh(connection, args.full)} rows (re)computed.")
+    finally:
+        database.release(connection)
+        database.close_pool()
+    database.report()
+
+
+if __name__ == "__main__":
+    main()
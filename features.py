@@ -0,0 +1,174 @@
+import warnings
+
+import numpy as np
+import pandas as pd
+
+# Vectorized feature engineering for the popularity model, shared by scoring and (re)training.
+# Every step works on whole columns; there is no per-row Python code.
+
+# Columns the scaler was fitted on, in order
+SCALED_COLUMNS = ['like_view_ratio', 'comment_view_ratio', 'interaction_score', 'category_popularity']
+
+# Columns the KMeans model was fitted on, in order ('duration_bin' is not scaled)
+CLUSTERING_COLUMNS = ['like_view_ratio', 'comment_view_ratio', 'interaction_score', 'duration_bin', 'category_popularity']
+
+# ISO 8601 duration (e.g. PT1H2M3S), anchored at the start like re.match
+DURATION_PATTERN = r'^PT(?:(?P<hours>\d+)H)?(?:(?P<minutes>\d+)M)?(?:(?P<seconds>\d+)S)?'
+
+# Cluster returned for rows whose features are not finite (no views yet); such rows are left unrated
+UNRATED_CLUSTER = -1
+
+# Duration bin edges in seconds: [0, 300) -> 1, [300, 900) -> 2, [900, inf) -> 3
+DURATION_BIN_EDGES = np.array([300, 900])
+
+# Popularity rank per YouTube category; unknown categories get 5
+category_popularity = {
+    10: 1,  # Music
+    23: 2,  # Comedy
+    22: 1,  # People & Blogs
+    24: 4,  # Entertainment
+    28: 1,  # Science & Technology
+    27: 6,  # Education
+    25: 7,  # News & Politics
+    26: 8,  # Howto & Style
+    17: 8,  # Sports
+    19: 9,  # Travel & Events
+    2: 10,  # Autos & Vehicles
+    15: 10,  # Pets & Animals
+    20: 10,  # Gaming
+    1: 6,   # Film & Animation
+    18: 7,  # Short Movies
+    21: 7,  # Videoblogging
+    29: 8,  # Nonprofits & Activism
+    30: 9,  # Movies
+    31: 9,  # Anime/Animation
+    32: 9,  # Action/Adventure
+    33: 10,  # Classics
+    34: 2,  # Comedy (duplicate, consider using 23)
+    35: 5,  # Documentary
+    36: 7,  # Drama
+    37: 6,  # Family
+    38: 9,  # Foreign
+    39: 8,  # Horror
+    40: 7,  # Sci-Fi/Fantasy
+    41: 8,  # Thriller
+    42: 7,  # Shorts
+    43: 8,  # Shows
+    44: 9   # Trailers
+}
+DEFAULT_CATEGORY_POPULARITY = 5
+
+# category_id -> popularity as an array index
+_category_lookup = np.full(max(category_popularity) + 1, DEFAULT_CATEGORY_POPULARITY, dtype=np.float32)
+_category_lookup[list(category_popularity)] = list(category_popularity.values())
+
+
+# Function to convert ISO 8601 durations to seconds (unparseable or missing durations become 0).
+# Talks share a limited set of durations, so only the distinct values go through the regex.
+def duration_to_seconds(durations):
+    codes, uniques = pd.factorize(pd.Series(durations, dtype=object))
+    parts = pd.Series(uniques, dtype=object).astype(str).str.extract(DURATION_PATTERN)
+    seconds = parts.apply(pd.to_numeric).fillna(0).to_numpy() @ np.array([3600, 60, 1])
+    # Missing durations have code -1, which picks the trailing 0
+    return np.append(seconds, 0)[codes]
+
+
+# Function to put durations in seconds into the bins 1, 2, 3
+def duration_bins(seconds):
+    return np.searchsorted(DURATION_BIN_EDGES, seconds, side='right') + 1
+
+
+# Function to map category IDs to their popularity rank
+def category_popularity_for(category_ids):
+    category_ids = np.asarray(category_ids, dtype=np.int64)
+    known = (category_ids >= 0) & (category_ids < len(_category_lookup))
+    return np.where(known, _category_lookup[np.where(known, category_ids, 0)], DEFAULT_CATEGORY_POPULARITY)
+
+
+# Function to truncate timestamps to midnight (rows from the database already have a datetime64 dtype)
+def _days(timestamps):
+    if not pd.api.types.is_datetime64_any_dtype(timestamps):
+        timestamps = pd.to_datetime(timestamps, errors='coerce')
+    return timestamps.dt.normalize()
+
+
+# Function to replace zero like/comment counts with the mean of their date.
+# daily_means is a DataFrame indexed by date with 'mean_likes' and 'mean_comments' columns. When rows
+# from several sources are scored together, keys holds the source of every row and daily_means is
+# indexed by (key, date).
+def impute_zero_counts(df, daily_means, keys=None):
+    days = _days(df['timestamp'])
+    if keys is None:
+        means = daily_means.set_axis(pd.to_datetime(daily_means.index)).reindex(days)
+    else:
+        means = daily_means.reindex(pd.MultiIndex.from_arrays([keys, days]))
+    likes = df['like_count'].to_numpy(dtype=np.float64)
+    comments = df['comment_count'].to_numpy(dtype=np.float64)
+    likes = np.where(likes == 0, means['mean_likes'].to_numpy(dtype=np.float64), likes)
+    comments = np.where(comments == 0, means['mean_comments'].to_numpy(dtype=np.float64), comments)
+    return likes, comments
+
+
+# Function to compute the per-date means over a whole frame (for callers that have all rows in memory)
+def daily_means_for(df):
+    days = _days(df['timestamp'])
+    means = df[['like_count', 'comment_count']].groupby(days).mean()
+    return means.rename(columns={'like_count': 'mean_likes', 'comment_count': 'mean_comments'})
+
+
+# Function to build the features for rows with view_count, like_count, comment_count, duration, category_id
+# and timestamp columns. Returns (float32 matrix with SCALED_COLUMNS, ready for scaler.transform,
+# float32 duration_bin vector). keys is passed on to impute_zero_counts. Rows read from the feature store
+# bring duration_bin and category_popularity columns, which are used as they are.
+def build_features(df, daily_means, keys=None):
+    likes, comments = impute_zero_counts(df, daily_means, keys)
+    views = df['view_count'].to_numpy(dtype=np.float64)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        like_view_ratio = likes / views
+        comment_view_ratio = comments / views
+
+    matrix = np.empty((len(df), len(SCALED_COLUMNS)), dtype=np.float32)
+    matrix[:, 0] = like_view_ratio
+    matrix[:, 1] = comment_view_ratio
+    matrix[:, 2] = like_view_ratio + comment_view_ratio
+    if 'category_popularity' in df:
+        matrix[:, 3] = df['category_popularity'].to_numpy()
+    else:
+        matrix[:, 3] = category_popularity_for(df['category_id'].to_numpy())
+
+    if 'duration_bin' in df:
+        duration_bin = df['duration_bin'].to_numpy(dtype=np.float32)
+    else:
+        duration_bin = duration_bins(duration_to_seconds(df['duration'])).astype(np.float32)
+    return matrix, duration_bin
+
+
+# Function to apply the fitted scaler to a feature matrix without the feature-name warning
+# (the scaler was fitted on a DataFrame, the matrix has the same columns in the same order). Infinite
+# ratios (view_count 0) become NaN first: StandardScaler passes NaN through but raises on infinity.
+def scale(scaler, matrix):
+    matrix = np.where(np.isfinite(matrix), matrix, np.nan).astype(matrix.dtype, copy=False)
+    with warnings.catch_warnings():
+        warnings.filterwarnings('ignore', message='X does not have valid feature names')
+        return scaler.transform(matrix)
+
+
+# Function to combine the scaled features and the duration bins in CLUSTERING_COLUMNS order
+def clustering_matrix(scaled, duration_bin):
+    return np.column_stack([scaled[:, :3], duration_bin, scaled[:, 3]]).astype(np.float32, copy=False)
+
+
+# Function to predict clusters with the fitted model without the feature-name warning
+# (the input is cast to the dtype of the cluster centers, which the KMeans kernels require).
+# Rows with infinite or NaN features (view_count 0) are not passed to the model, which would raise, and
+# get UNRATED_CLUSTER; both model runtimes handle them the same way.
+def predict_clusters(model, matrix):
+    matrix = matrix.astype(model.cluster_centers_.dtype, copy=False)
+    finite = np.isfinite(matrix).all(axis=1)
+    clusters = np.full(len(matrix), UNRATED_CLUSTER, dtype=np.int32)
+    if finite.any():
+        with warnings.catch_warnings():
+            warnings.filterwarnings('ignore', message='X does not have valid feature names')
+            clusters[finite] = model.predict(matrix[finite])
+    return clusters
@@ -0,0 +1,105 @@
+import atexit
+import datetime
+import queue
+import threading
+import time
+
+import psycopg2.extras
+
+_STOP = object()
+
+
+# Background sink for the Log table. Records are queued by the pipeline and written by a thread with
+# its own database connection (from connect(), handed back with release()) in multi-row INSERTs, flushed
+# when batch_size records are waiting, every flush_interval seconds and at process exit. log() never
+# blocks: when the queue is full the record is printed instead. A failed flush also falls back to
+# printing, so log rows never touch the pipeline's own transaction.
+class BufferedLogWriter:
+    def __init__(self, connect, batch_size=100, flush_interval=2.0, max_queue=10000, release=None):
+        self.connect = connect
+        self.release = release or (lambda connection: connection.close())
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.records = queue.Queue(maxsize=max_queue)
+        self.connection = None
+        self.dropped = 0
+        self.written = 0
+        self.thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    # Function to queue one log record; the timestamp is taken now, not at flush time
+    def log(self, service_name, log_level, message):
+        record = (datetime.datetime.now(), service_name, log_level, message)
+        try:
+            self.records.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            print(f"[{log_level}] {service_name}: {message}")
+
+    # Function to block until everything queued so far has been written
+    def flush(self):
+        if not self.thread.is_alive():
+            return
+        done = threading.Event()
+        self.records.put(done)
+        done.wait()
+
+    # Function to flush the remaining records and stop the writer thread
+    def close(self):
+        if self.thread.is_alive():
+            self.records.put(_STOP)
+            self.thread.join()
+        if self.connection is not None:
+            self.release(self.connection)
+            self.connection = None
+
+    def _run(self):
+        buffer = []
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = self.records.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if isinstance(item, tuple):
+                buffer.append(item)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+                if len(buffer) < self.batch_size and time.monotonic() < deadline:
+                    continue
+
+            # Size reached, interval elapsed, explicit flush or stop: write what is buffered
+            self._write(buffer)
+            buffer = []
+            deadline = None
+            if isinstance(item, threading.Event):
+                item.set()
+            elif item is _STOP:
+                return
+
+    def _write(self, buffer):
+        if not buffer:
+            return
+        try:
+            if self.connection is None or self.connection.closed:
+                self.connection = self.connect()
+            with self.connection.cursor() as cursor:
+                psycopg2.extras.execute_values(cursor, """
+                    INSERT INTO Log (timestamp, service_name, log_level, message)
+                    VALUES %s;
+                """, buffer, page_size=len(buffer))
+            self.connection.commit()
+            self.written += len(buffer)
+        except Exception as e:
+            print(f"Could not write {len(buffer)} log records to the database: {e}")
+            for timestamp, service_name, log_level, message in buffer:
+                print(f"{timestamp:%Y-%m-%d %H:%M:%S} [{log_level}] {service_name}: {message}")
+            if self.connection is not None:
+                try:
+                    self.connection.rollback()
+                except Exception:
+                    self.release(self.connection)
+                    self.connection = None
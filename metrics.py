@@ -0,0 +1,250 @@
+import bisect
+import contextlib
+import datetime
+import functools
+import json
+import os
+import threading
+import time
+
+import database
+import run_ledger
+
+# Instrumentation for the pipeline: latency histograms and counters for the hot paths (API calls,
+# database writes, scoring, transcript fetching and classification). At the end of a run finish_run()
+# adds the database counts (round trips, commits) from database.stats, prints the p50/p95/p99 latencies,
+# writes everything in the Prometheus text format for the node_exporter textfile collector
+# (METRICS_TEXTFILE_DIR) and stores a summary row in Pipeline_Run_Summary, linked to the run in the run
+# ledger (Pipeline_Run) when the script has one.
+
+PREFIX = "ted_pipeline"
+
+# Directory of the node_exporter textfile collector; one <PREFIX>_<script>.prom file per script (not written
+# when unset)
+textfile_directory = os.getenv("METRICS_TEXTFILE_DIR")
+
+# Store a Pipeline_Run_Summary row at the end of every run
+record_run_summary = os.getenv("METRICS_RUN_SUMMARY", "1") == "1"
+
+# Histogram bucket upper bounds in seconds: 100 microseconds to about 100 seconds, a factor sqrt(2) apart
+BUCKETS = [0.0001 * 2 ** (step / 2) for step in range(41)]
+
+QUANTILES = [0.5, 0.95, 0.99]
+
+# Start of this run (the process)
+run_started = datetime.datetime.now()
+run_started_counter = time.perf_counter()
+
+
+# Latency histogram with fixed buckets (the same ones Prometheus gets); quantiles are interpolated within
+# the bucket, like histogram_quantile() does
+class Histogram:
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS) + 1)  # the last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.buckets[bisect.bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        if not self.count:
+            return None
+        rank = q * self.count
+        cumulative = 0
+        for index, in_bucket in enumerate(self.buckets):
+            if in_bucket and cumulative + in_bucket >= rank:
+                lower = BUCKETS[index - 1] if index > 0 else 0.0
+                upper = BUCKETS[index] if index < len(BUCKETS) else self.max
+                return min(lower + (upper - lower) * (rank - cumulative) / in_bucket, self.max)
+            cumulative += in_bucket
+        return self.max
+
+
+# Histograms and counters of this process, keyed by (name, labels); shared by all threads
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+
+    def observe(self, name, value, labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def count(self, name, value, labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+
+registry = Registry()
+
+
+# Function to record one latency (in seconds) in the histogram name
+def observe(name, seconds, **labels):
+    registry.observe(name, seconds, labels)
+
+
+# Function to add value to the counter name
+def count(name, value=1, **labels):
+    registry.count(name, value, labels)
+
+
+# Context manager that records the time spent in the block in the histogram name
+@contextlib.contextmanager
+def timer(name, **labels):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        registry.observe(name, time.perf_counter() - start, labels)
+
+
+# Decorator that records the duration of every call of a function in the histogram name
+def timed(name, **labels):
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with timer(name, **labels):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+# Function to format the labels of a series, e.g. {script="pipeline",stage="ingest"}
+def _labels(labels, **extra):
+    pairs = list(labels) + list(extra.items())
+    return "{" + ",".join(f'{name}="{value}"' for name, value in pairs) + "}"
+
+
+# Function to get the database counts of this run as counters
+def _database_counters():
+    return {(f"db_{name}", ()): value for name, value in database.stats.as_dict().items()}
+
+
+# Function to render every histogram and counter in the Prometheus text exposition format
+def prometheus_text(script):
+    script_label = (("script", script),)
+    with registry.lock:
+        histograms = sorted(registry.histograms.items())
+        counters = sorted({**registry.counters, **_database_counters()}.items())
+
+    lines = []
+    seen = set()
+    for (name, labels), value in counters:
+        metric = f"{PREFIX}_{name}_total"
+        if metric not in seen:
+            lines.append(f"# TYPE {metric} counter")
+            seen.add(metric)
+        lines.append(f"{metric}{_labels(script_label + labels)} {value}")
+
+    for (name, labels), histogram in histograms:
+        metric = f"{PREFIX}_{name}_seconds"
+        if metric not in seen:
+            lines.append(f"# TYPE {metric} histogram")
+            seen.add(metric)
+        cumulative = 0
+        for bound, in_bucket in zip(BUCKETS + [float("inf")], histogram.buckets):
+            cumulative += in_bucket
+            le = "+Inf" if bound == float("inf") else f"{bound:.6g}"
+            lines.append(f"{metric}_bucket{_labels(script_label + labels, le=le)} {cumulative}")
+        lines.append(f"{metric}_sum{_labels(script_label + labels)} {histogram.sum:.6f}")
+        lines.append(f"{metric}_count{_labels(script_label + labels)} {histogram.count}")
+
+    duration = time.perf_counter() - run_started_counter
+    lines.append(f"# TYPE {PREFIX}_run_duration_seconds gauge")
+    lines.append(f"{PREFIX}_run_duration_seconds{_labels(script_label)} {duration:.3f}")
+    lines.append(f"# TYPE {PREFIX}_last_run_timestamp_seconds gauge")
+    lines.append(f"{PREFIX}_last_run_timestamp_seconds{_labels(script_label)} {time.time():.0f}")
+    return "\n".join(lines) + "\n"
+
+
+# Function to write the Prometheus text file of a script (atomically, so the collector never reads half)
+def write_textfile(script, directory=None):
+    directory = directory or textfile_directory
+    if not directory:
+        return None
+    path = os.path.join(directory, f"{PREFIX}_{script}.prom")
+    with open(path + ".tmp", "w") as textfile:
+        textfile.write(prometheus_text(script))
+    os.replace(path + ".tmp", path)
+    return path
+
+
+# Function to summarize the run: count, sum, max and p50/p95/p99 per histogram, and every counter
+def summary():
+    def key(name, labels):
+        return name + (_labels(labels) if labels else "")
+
+    with registry.lock:
+        histograms = {key(name, labels): {"count": histogram.count, "sum": round(histogram.sum, 6),
+                                          "max": round(histogram.max, 6),
+                                          **{f"p{round(q * 100)}": round(histogram.quantile(q), 6) for q in QUANTILES}}
+                      for (name, labels), histogram in sorted(registry.histograms.items())}
+        counters = {key(name, labels): value for (name, labels), value in sorted(registry.counters.items())}
+    return {"histograms": histograms, "counters": counters, "database": database.stats.as_dict()}
+
+
+# Function to create the run summary table; run_id is the ledger run the summary describes (NULL for scripts
+# run on their own, which have no ledger run)
+def create_tables(cursor):
+    run_ledger.create_tables(cursor)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS Pipeline_Run_Summary (
+            summary_id SERIAL PRIMARY KEY,
+            run_id INT REFERENCES Pipeline_Run (run_id) ON DELETE SET NULL,
+            script VARCHAR(50) NOT NULL,
+            started_at TIMESTAMP NOT NULL,
+            finished_at TIMESTAMP NOT NULL,
+            duration_seconds FLOAT8 NOT NULL,
+            db_round_trips BIGINT,
+            db_commits BIGINT,
+            api_calls BIGINT,
+            bytes_fetched BIGINT,
+            metrics JSONB NOT NULL
+        );
+    """)
+
+
+# Function to store the summary of this run in Pipeline_Run_Summary (under the ledger run_id, if any)
+def record_run(script, run_summary, run_id=None):
+    counters = run_summary["counters"]
+    with database.pooled_connection() as connection, database.transaction(connection) as cursor:
+        create_tables(cursor)
+        cursor.execute("""
+            INSERT INTO Pipeline_Run_Summary (run_id, script, started_at, finished_at, duration_seconds,
+                                              db_round_trips, db_commits, api_calls, bytes_fetched, metrics)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s);
+        """, (run_id, script, run_started, datetime.datetime.now(), time.perf_counter() - run_started_counter,
+              run_summary["database"]["round_trips"], run_summary["database"]["commits"],
+              sum(value for name, value in counters.items() if name.startswith("api_calls")),
+              sum(value for name, value in counters.items() if name.startswith("bytes_fetched")),
+              json.dumps(run_summary)))
+
+
+# Function to finish the instrumentation of a run: print the latencies, write the Prometheus text file
+# and store the run summary row (linked to the ledger run_id, if any). Never raises; instrumentation must
+# not fail a run.
+def finish_run(script, run_id=None):
+    run_summary = summary()
+    for name, histogram in run_summary["histograms"].items():
+        print(f"{name}: {histogram['count']} calls, p50 {histogram['p50'] * 1000:.1f} ms, "
+              f"p95 {histogram['p95'] * 1000:.1f} ms, p99 {histogram['p99'] * 1000:.1f} ms")
+    try:
+        path = write_textfile(script)
+        if path:
+            print(f"Metrics written to {path}")
+        if record_run_summary:
+            record_run(script, run_summary, run_id)
+    except Exception as e:
+        print(f"Could not export the metrics of this run: {e}")
+    return run_summary
@@ -0,0 +1,296 @@
+import argparse
+import hashlib
+import os
+import re
+import warnings
+from itertools import chain, repeat
+
+import numpy as np
+
+# NumPy-only inference for the pipeline's models, so scoring does not import scikit-learn or unpickle
+# estimators on the hot path. export_models() writes the fitted parameters of the scaler, the KMeans
+# model, the bag-of-words vocabulary and the Naive Bayes classifier into one versioned .npz artifact,
+# and checks that the NumPy runtime predicts exactly what the scikit-learn models predict.
+# Re-export after retraining: python model_runtime.py export
+
+FORMAT_VERSION = 1
+ARTIFACT_PATH = os.getenv("MODEL_ARTIFACT", "ted_models.npz")
+
+# CountVectorizer's default token pattern
+DEFAULT_TOKEN_PATTERN = r"(?u)\b\w\w+\b"
+
+# Source model files, in the order their checksums are stored in the artifact
+SOURCE_FILES = ['teddyxscaler.joblib', 'kmeans_model_for_ted_videos.joblib', 'nlp_model.pkl', 'classificatie_model.pkl']
+
+
+# Standardization with the mean/scale of the fitted StandardScaler (same interface as scaler.transform)
+class StandardScalerRuntime:
+    def __init__(self, mean, scale):
+        self.mean_ = mean
+        self.scale_ = scale
+
+    def transform(self, X):
+        X = np.asarray(X)
+        dtype = X.dtype if X.dtype in (np.float32, np.float64) else np.float64
+        return ((X - self.mean_) / self.scale_).astype(dtype, copy=False)
+
+
+# Nearest-centroid assignment with the fitted KMeans centers (same interface as model.predict). Like
+# scikit-learn, it raises ValueError on infinite or NaN input instead of assigning a cluster.
+class KMeansRuntime:
+    def __init__(self, cluster_centers):
+        self.cluster_centers_ = cluster_centers
+
+    def predict(self, X):
+        X = np.asarray(X, dtype=self.cluster_centers_.dtype)
+        if not np.isfinite(X).all():
+            raise ValueError("Input X contains infinity or NaN.")
+        distances = ((X[:, np.newaxis, :] - self.cluster_centers_[np.newaxis, :, :]) ** 2).sum(axis=2)
+        return distances.argmin(axis=1).astype(np.int32)
+
+
+# Sparse document-term matrix in CSR layout (what VocabularyRuntime.transform returns)
+class SparseCounts:
+    def __init__(self, indptr, indices, data, n_features):
+        self.indptr = indptr
+        self.indices = indices
+        self.data = data
+        self.shape = (len(indptr) - 1, n_features)
+
+
+# Bag-of-words vectorizer with the fitted vocabulary (same interface as nlp_model.transform).
+# Mirrors the fitted CountVectorizer: lowercase, token pattern, unigrams, binary counts; stop words are
+# never in the fitted vocabulary, so the vocabulary lookup drops them.
+class VocabularyRuntime:
+    def __init__(self, terms, token_pattern, lowercase=True, binary=True):
+        self.vocabulary_ = {term: index for index, term in enumerate(terms)}
+        self.token_pattern = re.compile(token_pattern)
+        self.lowercase = lowercase
+        self.binary = binary
+        # With the default pattern, a document whose whitespace-separated words are all alphanumeric (such
+        # as a cleaned transcript) tokenizes to exactly those words; one-letter words are never in the vocabulary
+        self.split_words = token_pattern == DEFAULT_TOKEN_PATTERN
+
+    def _tokenize(self, document):
+        if self.lowercase:
+            document = document.lower()
+        if self.split_words:
+            words = document.split()
+            if all(map(str.isalnum, words)):
+                return words
+        return self.token_pattern.findall(document)
+
+    # The whole batch is vectorized at once: one vocabulary lookup per token, then the (document, term)
+    # pairs are deduplicated (binary) or counted with NumPy, which also sorts the terms within each row
+    def transform(self, documents):
+        tokens = [self._tokenize(document) for document in documents]
+        lengths = np.fromiter(map(len, tokens), dtype=np.int64, count=len(tokens))
+        indices = np.fromiter(map(self.vocabulary_.get, chain.from_iterable(tokens), repeat(-1)),
+                              dtype=np.int64, count=int(lengths.sum()))
+        rows = np.repeat(np.arange(len(tokens), dtype=np.int64), lengths)
+
+        known = indices >= 0
+        n_features = len(self.vocabulary_)
+        keys, counts = np.unique(rows[known] * n_features + indices[known], return_counts=True)
+        rows = keys // n_features
+        indptr = np.zeros(len(tokens) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=len(tokens)), out=indptr[1:])
+        data = np.ones(len(keys)) if self.binary else counts.astype(np.float64)
+        return SparseCounts(indptr, keys % n_features, data, n_features)
+
+
+# Multinomial Naive Bayes with the fitted log probabilities (same interface as classificatie_model.predict)
+class NaiveBayesRuntime:
+    def __init__(self, feature_log_prob, class_log_prior, classes):
+        self.feature_log_prob_ = feature_log_prob
+        self.class_log_prior_ = class_log_prior
+        self.classes_ = classes
+
+    # Function to compute X @ feature_log_prob.T + class_log_prior for a SparseCounts matrix
+    def joint_log_likelihood(self, X):
+        weighted = self.feature_log_prob_[:, X.indices] * X.data
+        totals = np.zeros((X.shape[0], len(self.classes_)))
+        rows = np.repeat(np.arange(X.shape[0]), np.diff(X.indptr))
+        np.add.at(totals, rows, weighted.T)
+        return totals + self.class_log_prior_
+
+    def predict(self, X):
+        return self.classes_[self.joint_log_likelihood(X).argmax(axis=1)]
+
+
+# Function to compute the checksums of the source model files (None for files that are not present)
+def source_checksums(directory="."):
+    checksums = []
+    for file_name in SOURCE_FILES:
+        path = os.path.join(directory, file_name)
+        if os.path.exists(path):
+            with open(path, "rb") as source:
+                checksums.append(hashlib.sha256(source.read()).hexdigest())
+        else:
+            checksums.append(None)
+    return checksums
+
+
+# Function to derive the version of the sentiment models from the checksums of nlp_model.pkl and
+# classificatie_model.pkl (from the artifact when the pickles are not deployed next to it)
+def sentiment_model_version(path=ARTIFACT_PATH):
+    checksums = source_checksums(os.path.dirname(path) or ".")[2:]
+    if None in checksums and os.path.exists(path):
+        stored = list(np.load(path, allow_pickle=False)['source_checksums'])[2:]
+        checksums = [now if now is not None else saved for now, saved in zip(checksums, stored)]
+    if None in checksums:
+        raise FileNotFoundError("Cannot determine the sentiment model version: model files and artifact are missing.")
+    return hashlib.sha256("|".join(checksums).encode()).hexdigest()[:16]
+
+
+# Function to load the artifact; returns None when it is missing, has another format version or was
+# exported from different model files than the ones next to it (callers then fall back to scikit-learn)
+def load_artifact(path=ARTIFACT_PATH):
+    if not os.path.exists(path):
+        return None
+    artifact = np.load(path, allow_pickle=False)
+    if int(artifact['format_version']) != FORMAT_VERSION:
+        print(f"Model artifact {path} has format version {int(artifact['format_version'])}, expected {FORMAT_VERSION}")
+        return None
+    stored = list(artifact['source_checksums'])
+    current = source_checksums(os.path.dirname(path) or ".")
+    if any(now is not None and now != saved for now, saved in zip(current, stored)):
+        print(f"Model artifact {path} is out of date with the model files; re-export it")
+        return None
+    return artifact
+
+
+# Function to build the popularity runtime (scaler, model) from a loaded artifact
+def popularity_models(artifact):
+    return (StandardScalerRuntime(artifact['scaler_mean'], artifact['scaler_scale']),
+            KMeansRuntime(artifact['kmeans_centers']))
+
+
+# Function to build the sentiment runtime (nlp_model, classificatie_model) from a loaded artifact
+def sentiment_models(artifact):
+    vectorizer = VocabularyRuntime(artifact['vocabulary'], str(artifact['token_pattern']),
+                                   bool(artifact['lowercase']), bool(artifact['binary']))
+    classifier = NaiveBayesRuntime(artifact['nb_feature_log_prob'], artifact['nb_class_log_prior'],
+                                   artifact['nb_classes'])
+    return vectorizer, classifier
+
+
+# Function to load the popularity (scaler, model): the NumPy runtime when the artifact is available and
+# up to date, otherwise (or with MODEL_RUNTIME=sklearn) the pickled scikit-learn models
+def load_popularity_models():
+    if os.getenv("MODEL_RUNTIME", "numpy") == "numpy":
+        artifact = load_artifact()
+        if artifact is not None:
+            return popularity_models(artifact)
+
+    from joblib import load
+    return load('teddyxscaler.joblib'), load('kmeans_model_for_ted_videos.joblib')
+
+
+# Function to load the sentiment (nlp_model, classificatie_model), with the same fallback as above
+def load_sentiment_models():
+    if os.getenv("MODEL_RUNTIME", "numpy") == "numpy":
+        artifact = load_artifact()
+        if artifact is not None:
+            return sentiment_models(artifact)
+
+    from joblib import load
+    return load('nlp_model.pkl'), load('classificatie_model.pkl')  # Bag of Words model, Naive Bayes model
+
+
+# Function to write the artifact from the scikit-learn models and check the runtime against them
+def export_models(path=ARTIFACT_PATH, samples=20000):
+    from joblib import load
+
+    warnings.filterwarnings('ignore', category=UserWarning)
+    scaler = load('teddyxscaler.joblib')
+    model = load('kmeans_model_for_ted_videos.joblib')
+    nlp_model = load('nlp_model.pkl')
+    classificatie_model = load('classificatie_model.pkl')
+
+    if nlp_model.ngram_range != (1, 1) or nlp_model.analyzer != 'word' or nlp_model.preprocessor or nlp_model.tokenizer:
+        raise ValueError("The NumPy runtime only supports word unigram CountVectorizers with the default tokenizer")
+
+    terms = np.empty(len(nlp_model.vocabulary_), dtype=object)
+    for term, index in nlp_model.vocabulary_.items():
+        terms[index] = term
+
+    np.savez(
+        path,
+        format_version=np.array(FORMAT_VERSION),
+        source_checksums=np.array(source_checksums(), dtype=str),
+        scaler_mean=scaler.mean_,
+        scaler_scale=scaler.scale_,
+        kmeans_centers=model.cluster_centers_,
+        vocabulary=terms.astype(str),
+        token_pattern=np.array(nlp_model.token_pattern),
+        lowercase=np.array(nlp_model.lowercase),
+        binary=np.array(nlp_model.binary),
+        nb_feature_log_prob=classificatie_model.feature_log_prob_,
+        nb_class_log_prior=classificatie_model.class_log_prior_,
+        nb_classes=classificatie_model.classes_
+    )
+
+    artifact = load_artifact(path)
+    check_parity(artifact, scaler, model, nlp_model, classificatie_model, samples)
+    print(f"Exported {path} ({os.path.getsize(path)} bytes)")
+
+
+# Function to compare the runtime predictions with the scikit-learn predictions; raises on any mismatch
+def check_parity(artifact, scaler, model, nlp_model, classificatie_model, samples=20000):
+    import features
+
+    rng = np.random.default_rng(0)
+    run_scaler, run_model = popularity_models(artifact)
+
+    # Features spread around the fitted distribution, duration bins 1..3
+    raw = scaler.mean_ + rng.normal(0, 3, (samples, len(scaler.mean_))) * scaler.scale_
+    bins = rng.integers(1, 4, samples).astype(np.float64)
+    expected = model.predict(np.column_stack([scaler.transform(raw)[:, :3], bins, scaler.transform(raw)[:, 3]]))
+    scaled = run_scaler.transform(raw)
+    actual = run_model.predict(np.column_stack([scaled[:, :3], bins, scaled[:, 3]]))
+    if not np.allclose(scaled, scaler.transform(raw)) or (expected != actual).any():
+        raise ValueError(f"Popularity runtime differs from scikit-learn on {(expected != actual).sum()} of {samples} samples")
+
+    # Rows with infinite or NaN features (view_count 0) are left unrated by both runtimes
+    matrix = np.column_stack([scaled[:, :3], bins, scaled[:, 3]]).astype(np.float32)
+    matrix[rng.random(samples) < 0.05, rng.integers(0, 3)] = np.inf
+    matrix[rng.random(samples) < 0.05, 4] = np.nan
+    expected = features.predict_clusters(model, matrix)
+    actual = features.predict_clusters(run_model, matrix)
+    if (expected != actual).any():
+        raise ValueError(f"Popularity runtime differs from scikit-learn on {(expected != actual).sum()} of "
+                         f"{samples} samples with non-finite features")
+
+    # Documents drawn from the vocabulary plus words it does not know
+    vectorizer, classifier = sentiment_models(artifact)
+    words = list(nlp_model.vocabulary_) + ["unknownword", "the", "and", "a", "x1", "talk"]
+    documents = [" ".join(rng.choice(words, rng.integers(0, 400))) for _ in range(max(1, samples // 20))]
+    expected = classificatie_model.predict(nlp_model.transform(documents))
+    actual = classifier.predict(vectorizer.transform(documents))
+    if (expected != actual).any():
+        raise ValueError(f"Sentiment runtime differs from scikit-learn on {(expected != actual).sum()} of {len(documents)} documents")
+    print(f"Parity check passed: {samples} popularity samples, {len(documents)} sentiment documents")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the pipeline models to a NumPy-only artifact")
+    parser.add_argument("command", choices=["export", "check"])
+    parser.add_argument("--path", default=ARTIFACT_PATH)
+    parser.add_argument("--samples", type=int, default=20000)
+    args = parser.parse_args()
+
+    if args.command == "export":
+        export_models(args.path, args.samples)
+    else:
+        from joblib import load
+        warnings.filterwarnings('ignore', category=UserWarning)
+        artifact = load_artifact(args.path)
+        if artifact is None:
+            raise SystemExit(f"No usable artifact at {args.path}")
+        check_parity(artifact, load('teddyxscaler.joblib'), load('kmeans_model_for_ted_videos.joblib'),
+                     load('nlp_model.pkl'), load('classificatie_model.pkl'), args.samples)
+
+
+if __name__ == "__main__":
+    main()
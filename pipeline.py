@@ -0,0 +1,134 @@
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import database
+import discovery
+import metrics
+import run_ledger
+import schrif_video_weg
+import popularity_prediction
+import transcript
+
+# Run popularity scoring and transcripts/sentiment at the same time (they do not depend on each other)
+parallel_stages = os.getenv("PIPELINE_PARALLEL", "1") == "1"
+
+
+# Function to run one stage, record its wall time and report (not raise) its failure
+def run_stage(name, timings, function, *args):
+    start = time.perf_counter()
+    try:
+        return function(*args)
+    except Exception as e:
+        schrif_video_weg.log_message("pipeline", "ERROR", f"Stage {name} failed: {e}")
+        metrics.count("stage_failures", stage=name)
+        print(f"Error running stage {name}: {e}")
+        return None
+    finally:
+        timings[name] = time.perf_counter() - start
+        metrics.observe("stage", timings[name], stage=name)
+
+
+# Function to get the videos the skipped stages would have handed on when a run starts after ingest:
+# the videos on the share from the manifest, and the videos this run ingested (None when the run is new,
+# so scoring takes every unrated row)
+def skipped_ingest_results(run_id, resumed):
+    with database.transaction(schrif_video_weg.connectie) as cursor:
+        present = discovery.present_video_ids(cursor)
+        touched = run_ledger.completed(cursor, run_id, "ingest") if resumed else None
+    return present, touched
+
+
+# Function to leave out the videos a stage already finished in this run (for a resumed run)
+def unfinished(run_id, stage, video_ids):
+    if video_ids is None:
+        return None
+    with database.transaction(schrif_video_weg.connectie) as cursor:
+        done = run_ledger.completed(cursor, run_id, stage)
+    if done:
+        print(f"Resuming run {run_id}: {stage} already done for {len(done)} videos")
+    return [video_id for video_id in video_ids if video_id not in done]
+
+
+# Function to run ingest, popularity scoring and transcript/sentiment in one process.
+# Models are loaded once, the ingest connection is reused, and the stages hand each other the
+# video IDs they touched instead of rescanning the share. Progress is recorded per video in the run
+# ledger; with resume the last unfinished run is continued and only its unfinished work is done, and
+# from_stage skips the stages before it. The metrics of the run are exported under its run_id at the end.
+# Returns the per-stage timings.
+def run_pipeline(resume=False, from_stage="ingest"):
+    timings = {}
+    run_id, resumed = run_ledger.open_run("pipeline", resume or from_stage != "ingest")
+    print(f"{'Resuming' if resumed else 'Starting'} run {run_id} from stage {from_stage}")
+
+    try:
+        start = time.perf_counter()
+        scaler, model = popularity_prediction.load_models()
+        transcript_models = transcript.load_models()
+        timings["load_models"] = time.perf_counter() - start
+        metrics.observe("stage", timings["load_models"], stage="load_models")
+
+        if from_stage == "ingest":
+            start = time.perf_counter()
+            videos, touched = schrif_video_weg.run_ingest(run_id)
+            present = videos.present
+            timings["ingest"] = time.perf_counter() - start
+            metrics.observe("stage", timings["ingest"], stage="ingest")
+            print("schrif_video_weg_done")
+        else:
+            if schrif_video_weg.connectie is None:
+                schrif_video_weg.setup(schrif_video_weg.connect_database())
+            present, touched = skipped_ingest_results(run_id, resumed)
+
+        scoring_videos = unfinished(run_id, "scoring", touched) if resumed else touched
+        transcript_videos = unfinished(run_id, "transcripts", present) if resumed else present
+
+        # Scoring reuses the ingest connection; transcripts take a second one from the pool when both stages
+        # run at once
+        transcript_connection = database.connect() if parallel_stages else schrif_video_weg.connectie
+        transcript.setup(transcript_connection, transcript_models)
+        futures = []
+        try:
+            with ThreadPoolExecutor(max_workers=2 if parallel_stages else 1) as executor:
+                if from_stage != "transcripts":
+                    futures.append(executor.submit(run_stage, "scoring", timings,
+                                                   popularity_prediction.score_popularity,
+                                                   schrif_video_weg.connectie, scaler, model, scoring_videos, run_id))
+                futures.append(executor.submit(run_stage, "transcripts", timings,
+                                               transcript.fetch_transcripts_and_update_sentiment,
+                                               transcript_videos, None, run_id))
+        finally:
+            if transcript_connection is not schrif_video_weg.connectie:
+                database.release(transcript_connection)
+    except BaseException:
+        run_ledger.close_run(run_id, "failed")
+        raise
+
+    # run_stage returns None for a stage that failed; the run stays open for --resume
+    run_ledger.close_run(run_id, "failed" if any(future.result() is None for future in futures) else "finished")
+
+    summary = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in timings.items())
+    print(f"Stage timings: {summary}")
+    schrif_video_weg.log_message("pipeline", "INFO",
+                                 f"Pipeline run {run_id} finished for {len(present)} videos. {summary}")
+    schrif_video_weg.log_sink.flush()
+    metrics.finish_run("pipeline", run_id)
+    database.report()
+    return timings
+
+
+# Main function to run the whole daily pipeline
+def main():
+    parser = argparse.ArgumentParser(description="Run ingest, popularity scoring and transcripts/sentiment")
+    parser.add_argument("--resume", action="store_true",
+                        help="Continue the last unfinished run, skipping the work it already finished")
+    parser.add_argument("--from-stage", choices=run_ledger.STAGES, default="ingest",
+                        help="Start at this stage (implies --resume when there is an unfinished run)")
+    args = parser.parse_args()
+
+    run_pipeline(args.resume, args.from_stage)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,167 +1,199 @@
+import io
 import os
 import pandas as pd
-import psycopg2
-from joblib import load
 from dotenv import load_dotenv
-from sklearn.preprocessing import StandardScaler
-import re
-import numpy as np
+import database
+import feature_store
+import features
+import metrics
+import model_runtime
+import run_ledger
+import scoring_service
 
 load_dotenv()
 
-# Load the scaler and model
-scaler = load('teddyxscaler.joblib')
-model = load('kmeans_model_for_ted_videos.joblib')
-
-# Database connection details (place in a .env file for security)
-db_name = os.getenv("DB_NAME")
-db_user = os.getenv("DB_USER")
-db_host = os.getenv("DB_HOST")
-db_password = os.getenv("DB_PASSWORD")
-db_port = os.getenv("DB_PORT")
-
-if not all([db_name, db_user, db_host, db_password, db_port]):
-    raise ValueError("Missing one or more environment variables for database connection.")
-
-# Connect to the database
-connection = psycopg2.connect(
-    database=db_name,
-    user=db_user,
-    password=db_password,
-    host=db_host,
-    port=db_port
-)
-cursor = connection.cursor()
-
-# Function to convert ISO 8601 duration to seconds (e.g., PT1H2M3S to seconds)
-def convert_duration_to_seconds(duration):
-    match = re.match(
-        r'PT((?P<hours>\d+)H)?((?P<minutes>\d+)M)?((?P<seconds>\d+)S)?', duration)
-    if not match:
-        return 0
-    time_data = match.groupdict()
-    hours = int(time_data['hours'] or 0)
-    minutes = int(time_data['minutes'] or 0)
-    seconds = int(time_data['seconds'] or 0)
-    return hours * 3600 + minutes * 60 + seconds
-
-# Fetch new data that needs to be labeled
-cursor.execute("""
-    SELECT fvs.video_id, fvs.view_count, fvs.like_count, fvs.comment_count, dv.duration, dv.category_id, fvs.timestamp
+# Client for the warm scoring service (None when SCORING_SERVICE_URL is not set)
+scoring_client = scoring_service.client_from_env()
+
+
+# Function to load the scaler and model (NumPy runtime when the exported artifact is up to date)
+def load_models():
+    return model_runtime.load_popularity_models()
+
+
+# Function to get a database connection from the shared pool (connection details are placed in a .env
+# file for security; give the connection back with database.release)
+def connect_database():
+    return database.connect()
+
+
+# Selection of the statistics rows that still need a popularity label (optionally only for some video IDs)
+unrated_filter_sql = """
+    WHERE fvs.popularity_rating IS NULL
+      AND (%(video_ids)s IS NULL OR fvs.video_id = ANY(%(video_ids)s))
+"""
+unrated_rows_sql = """
+    FROM Fact_Video_Statistics fvs
+    JOIN Dim_Video dv ON fvs.video_id = dv.video_id
+""" + unrated_filter_sql
+
+# The same rows with their precomputed features from the feature store
+unrated_store_rows_sql = """
     FROM Fact_Video_Statistics fvs
     JOIN Dim_Video dv ON fvs.video_id = dv.video_id
-    WHERE fvs.popularity_rating IS NULL;
-""")
-rows = cursor.fetchall()
-print(f"Fetched {len(rows)} rows of data.")
-
-# Transform data into a DataFrame
-df = pd.DataFrame(rows, columns=['video_id', 'view_count', 'like_count', 'comment_count', 'duration', 'category_id', 'timestamp'])
-
-# Ensure the 'timestamp' column is a datetime object
-df['timestamp'] = pd.to_datetime(df['timestamp'], errors='coerce')
-
-# Calculate the mean like_count and comment_count for each timestamp (date)
-df['date'] = df['timestamp'].dt.date
-mean_likes = df.groupby('date')['like_count'].transform('mean')
-mean_comments = df.groupby('date')['comment_count'].transform('mean')
-
-# Calculate mean like_count and comment_count for each timestamp (date)
-df['date'] = df['timestamp'].dt.date
-mean_likes = df.groupby('date')['like_count'].transform('mean')
-mean_comments = df.groupby('date')['comment_count'].transform('mean')
-
-# Replace zero values with the respective daily mean using np.where
-df['like_count'] = np.where(df['like_count'] == 0, mean_likes, df['like_count'])
-df['comment_count'] = np.where(df['comment_count'] == 0, mean_comments, df['comment_count'])
-
-print("Converting video durations to seconds...")
-# Convert duration to seconds
-df['duration_seconds'] = df['duration'].apply(convert_duration_to_seconds)
-
-print("Creating duration bins...")
-# Create duration bins with updated labels (1, 2, 3, 4)
-df['duration_bin'] = pd.cut(df['duration_seconds'], bins=[0, 300, 900, float('inf')], labels=[1, 2, 3], right=False)
-
-print("Calculating ratios and interaction scores...")
-df['like_view_ratio'] = df['like_count'] / df['view_count']
-df['comment_view_ratio'] = df['comment_count'] / df['view_count']
-df['interaction_score'] = df['like_view_ratio'] + df['comment_view_ratio']
-
-print("Mapping category popularity...")
-category_popularity = {
-    10: 1,  # Music
-    23: 2,  # Comedy
-    22: 1,  # People & Blogs
-    24: 4,  # Entertainment
-    28: 1,  # Science & Technology
-    27: 6,  # Education
-    25: 7,  # News & Politics
-    26: 8,  # Howto & Style
-    17: 8,  # Sports
-    19: 9,  # Travel & Events
-    2: 10,  # Autos & Vehicles
-    15: 10,  # Pets & Animals
-    20: 10,  # Gaming
-    1: 6,   # Film & Animation
-    18: 7,  # Short Movies
-    21: 7,  # Videoblogging
-    29: 8,  # Nonprofits & Activism
-    30: 9,  # Movies
-    31: 9,  # Anime/Animation
-    32: 9,  # Action/Adventure
-    33: 10,  # Classics
-    34: 2,  # Comedy (duplicate, consider using 23)
-    35: 5,  # Documentary
-    36: 7,  # Drama
-    37: 6,  # Family
-    38: 9,  # Foreign
-    39: 8,  # Horror
-    40: 7,  # Sci-Fi/Fantasy
-    41: 8,  # Thriller
-    42: 7,  # Shorts
-    43: 8,  # Shows
-    44: 9   # Trailers
-}
-
-
-# Calculate 'category_popularity' using the dictionary
-df['category_popularity'] = df['category_id'].map(category_popularity).fillna(5)
-# Print out category_id and category_popularity for debugging
-
-print("Applying scaling to relevant features...")
-# Apply scaling using the loaded scaler (only for the features that need scaling)
-scaled_features = scaler.transform(df[['like_view_ratio', 'comment_view_ratio', 'interaction_score', 'category_popularity']])
-
-for index, row in df.iterrows():
-    print(scaled_features)
-# Replace the original values with the scaled values
-df[['like_view_ratio', 'comment_view_ratio', 'interaction_score', 'category_popularity']] = scaled_features
-
-# Include 'duration_bin' directly in the features for clustering (no scaling needed for this)
-features_for_clustering = ['like_view_ratio', 'comment_view_ratio', 'interaction_score', 'duration_bin', 'category_popularity']
-
-print("Predicting clusters using the KMeans model...")
-df['predicted_cluster'] = model.predict(df[features_for_clustering])
-
-# Map predictions to 'populair' or 'niet populair'
-print("Mapping predicted clusters to popularity status...")
-df['popularity_status'] = df['predicted_cluster'].map({1: 'niet populair', 0: 'populair'})
-
-print("Updating the database with popularity predictions...")
-for _, row in df.iterrows():
-    cursor.execute(
-        """
-        UPDATE Fact_Video_Statistics
-        SET popularity_rating = %s
-        WHERE video_id = %s;
-        """,
-        (row['popularity_status'], row['video_id'])
-    )
-    connection.commit()
-
-# Close the database connection
-cursor.close()
-connection.close()
-
-print("Database connection closed. Script completed.")
\ No newline at end of file
+    JOIN Feature_Video_Statistics fs ON fs.video_id = fvs.video_id AND fs.date_id = fvs.date_id
+""" + unrated_filter_sql
+
+# Refresh the incremental feature store (feature_store.py) before scoring and read the duration bins and
+# category popularity from it instead of computing them from the raw rows. Off by default: both are cheap to
+# derive from Dim_Video, so the refresh costs more than it saves; the store is kept up to date for the
+# Video_Features view (retraining, dashboards) with python feature_store.py. Enable with FEATURE_STORE=1.
+use_feature_store = os.getenv("FEATURE_STORE", "0") == "1"
+
+# Number of rows read, scored and written back at a time
+chunk_size = int(os.getenv("SCORING_CHUNK_SIZE", "10000"))
+
+
+# Function to get the mean like_count and comment_count per date over all unrated rows, so zero counts
+# are imputed with the same daily means no matter how the rows are split into chunks. Every scoring path
+# (with or without the feature store, and the scoring_queue workers) imputes with these means.
+def get_daily_means(cursor, params):
+    cursor.execute("""
+        SELECT fvs.timestamp::date, AVG(fvs.like_count)::float8, AVG(fvs.comment_count)::float8
+    """ + unrated_rows_sql + """
+        GROUP BY fvs.timestamp::date;
+    """, params)
+    daily_means = pd.DataFrame(cursor.fetchall(), columns=['date', 'mean_likes', 'mean_comments'])
+    return daily_means.set_index('date')
+
+
+# Function to add the popularity_status column to one chunk of unrated rows (through the scoring service
+# when one is configured and reachable, in-process otherwise)
+@metrics.timed("scoring_chunk")
+def score_chunk(df, daily_means, scaler, model):
+    clusters = scoring_client.popularity_clusters(df, daily_means) if scoring_client else None
+    if clusters is not None:
+        print("Predicted clusters with the scoring service...")
+        df['predicted_cluster'] = clusters
+    else:
+        df['predicted_cluster'] = predict_chunk(df, daily_means, scaler, model)
+
+    # Map predictions to 'populair' or 'niet populair'; rows without usable features stay unrated (NULL)
+    print("Mapping predicted clusters to popularity status...")
+    df['popularity_status'] = df['predicted_cluster'].map({1: 'niet populair', 0: 'populair'})
+    unrated = int(df['popularity_status'].isna().sum())
+    if unrated:
+        print(f"{unrated} rows without usable features (no views) left unrated.")
+    return df
+
+
+# Function to predict the clusters of one chunk in-process
+def predict_chunk(df, daily_means, scaler, model):
+    print("Building features...")
+    with metrics.timer("scoring_features"):
+        matrix, duration_bin = features.build_features(df, daily_means)
+
+    print("Applying scaling to relevant features...")
+    # Apply scaling using the loaded scaler (only for the features that need scaling)
+    with metrics.timer("scoring_scale"):
+        scaled_features = features.scale(scaler, matrix)
+
+    print("Predicting clusters using the KMeans model...")
+    # Include 'duration_bin' directly in the features for clustering (no scaling needed for this)
+    with metrics.timer("scoring_predict"):
+        return features.predict_clusters(model, features.clustering_matrix(scaled_features, duration_bin))
+
+
+# Function to write the popularity_status of a scored chunk back to the database in one bulk transaction
+# (recording the scored videos in the run ledger when there is a run)
+@metrics.timed("db_write_popularity")
+def write_popularity(connection, df, run_id=None):
+    with database.transaction(connection, bulk=True) as cursor:
+        update_popularity(cursor, df)
+        run_ledger.complete(cursor, run_id, "scoring", set(df['video_id']))
+
+
+# Function to update popularity_rating for a scored chunk without committing: COPY the results into a
+# temp table, then one UPDATE ... FROM keyed on the (video_id, date_id) primary key. Rows left unrated
+# are not written.
+def update_popularity(cursor, df):
+    print("Updating the database with popularity predictions...")
+    df = df[df['popularity_status'].notna()]
+    cursor.execute("""
+        CREATE TEMP TABLE IF NOT EXISTS popularity_updates (
+            video_id VARCHAR(15),
+            date_id INT,
+            status VARCHAR(15)
+        ) ON COMMIT DELETE ROWS;
+    """)
+
+    buffer = io.StringIO()
+    df[['video_id', 'date_id', 'popularity_status']].to_csv(buffer, sep='\t', header=False, index=False)
+    buffer.seek(0)
+    cursor.copy_expert("COPY popularity_updates (video_id, date_id, status) FROM STDIN", buffer)
+
+    cursor.execute("""
+        UPDATE Fact_Video_Statistics fvs
+        SET popularity_rating = u.status
+        FROM popularity_updates u
+        WHERE fvs.video_id = u.video_id AND fvs.date_id = u.date_id;
+    """)
+
+
+# Function to label the unrated statistics rows (optionally only for the given video IDs).
+# Rows are streamed from a server-side cursor in chunks of chunk_size; each chunk is scored and written
+# back before the next one is read, so memory use does not grow with the backlog.
+# Returns the IDs of the videos that were scored.
+def score_popularity(connection, scaler, model, video_ids=None, run_id=None):
+    params = {"video_ids": list(video_ids) if video_ids is not None else None}
+    columns = ['video_id', 'date_id', 'view_count', 'like_count', 'comment_count', 'duration', 'category_id', 'timestamp']
+    if use_feature_store:
+        feature_store.refresh(connection)
+        cursor = connection.cursor()
+        daily_means = get_daily_means(cursor, params)
+        select_sql = "SELECT fvs.video_id, fvs.date_id, fvs.view_count, fvs.like_count, fvs.comment_count, dv.duration, " \
+                     "dv.category_id, fvs.timestamp, fs.duration_bin, fs.category_popularity" + unrated_store_rows_sql
+        columns += ['duration_bin', 'category_popularity']
+    else:
+        cursor = connection.cursor()
+        daily_means = get_daily_means(cursor, params)
+        select_sql = "SELECT fvs.video_id, fvs.date_id, fvs.view_count, fvs.like_count, fvs.comment_count, dv.duration, " \
+                     "dv.category_id, fvs.timestamp" + unrated_rows_sql
+    cursor.close()
+
+    # Fetch new data that needs to be labeled (the server-side cursor stays open across the commits below)
+    scored = set()
+    total = 0
+    with database.stream(connection, "unrated_video_statistics", select_sql + ";", params, chunk_size) as chunks:
+        for rows in chunks:
+            total += len(rows)
+            print(f"Fetched {len(rows)} rows of data ({total} so far).")
+
+            # Transform data into a DataFrame
+            df = pd.DataFrame(rows, columns=columns)
+            df = score_chunk(df, daily_means, scaler, model)
+            write_popularity(connection, df, run_id)
+            metrics.count("rows_scored", len(df))
+            scored.update(df['video_id'])
+
+    return scored
+
+
+# Main function to run the script
+def main():
+    scaler, model = load_models()
+    connection = connect_database()
+    try:
+        score_popularity(connection, scaler, model)
+        metrics.finish_run("popularity_prediction")
+    finally:
+        # Give the database connection back to the pool
+        database.release(connection)
+        database.close_pool()
+
+    print("Database connection closed. Script completed.")
+    database.report()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+import json
+import os
+
+import psycopg2.extras
+
+import database
+
+# Run ledger for resumable pipeline runs. Every run of pipeline.py or schrif_video_weg.py gets a row in
+# Pipeline_Run, and each stage records the videos it finished in Pipeline_Run_Video under that run ID, in the
+# same transaction as its own batch commit, so the ledger never claims work that was rolled back. A run
+# that dies halfway (API quota, container restart) stays 'running' (or 'failed' when a stage raised);
+# with --resume the next run continues it and every stage skips the videos the ledger already has.
+# A finished run keeps only its per-stage counts; its per-video rows are deleted. Runs belong to the script
+# that started them, and a run is only taken over (resumed or abandoned) once it failed or stopped
+# sending heartbeats.
+
+# Pipeline stages in run order (for --from-stage)
+STAGES = ["ingest", "scoring", "transcripts"]
+
+# Stages the ledger records per video: the two ingest passes (snippet/contentDetails and statistics),
+# ingest itself (both passes done), scoring and transcripts/sentiment
+LEDGER_STAGES = ["details", "statistics"] + STAGES
+
+# A 'running' run whose last heartbeat (start, resume or recorded progress) is older than this is taken to
+# be dead (killed process, container restart)
+stale_after_minutes = int(os.getenv("RUN_STALE_AFTER_MINUTES", "60"))
+
+# Condition for the unfinished runs of a script that are no longer being worked on
+TAKEOVER_CONDITION = """
+    script = %(script)s AND (status = 'failed'
+                             OR (status = 'running' AND heartbeat_at < now() - %(stale_after)s * interval '1 minute'))
+"""
+
+
+# Function to create the ledger tables
+def create_tables(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS Pipeline_Run (
+            run_id SERIAL PRIMARY KEY,
+            script VARCHAR(50) NOT NULL,
+            started_at TIMESTAMP NOT NULL DEFAULT now(),
+            heartbeat_at TIMESTAMP NOT NULL DEFAULT now(),
+            resumed_at TIMESTAMP,
+            finished_at TIMESTAMP,
+            status VARCHAR(20) NOT NULL DEFAULT 'running',
+            completed JSONB
+        );
+        CREATE TABLE IF NOT EXISTS Pipeline_Run_Video (
+            run_id INT NOT NULL REFERENCES Pipeline_Run (run_id) ON DELETE CASCADE,
+            stage VARCHAR(20) NOT NULL,
+            video_id VARCHAR(15) NOT NULL,
+            PRIMARY KEY (run_id, stage, video_id)
+        );
+    """)
+
+
+# Function to start a run of script, or with resume continue its latest failed or dead run (a new run when
+# there is none). Starting a new run abandons the failed and dead runs of the same script; runs of other
+# scripts and runs that are still alive are left alone. Returns (run_id, resumed).
+def open_run(script, resume=False):
+    params = {"script": script, "stale_after": stale_after_minutes}
+    with database.pooled_connection() as connection, database.transaction(connection) as cursor:
+        create_tables(cursor)
+        cursor.execute("""
+            SELECT run_id FROM Pipeline_Run WHERE script = %(script)s AND status = 'running' AND NOT ("""
+                       + TAKEOVER_CONDITION + """);""", params)
+        alive = [row[0] for row in cursor.fetchall()]
+        if alive:
+            print(f"Runs of {script} still running (heartbeat in the last {stale_after_minutes} minutes), "
+                  f"left alone: {', '.join(map(str, alive))}")
+
+        if resume:
+            cursor.execute("""
+                UPDATE Pipeline_Run SET status = 'running', resumed_at = now(), heartbeat_at = now()
+                WHERE run_id = (SELECT max(run_id) FROM Pipeline_Run WHERE """ + TAKEOVER_CONDITION + """)
+                RETURNING run_id;
+            """, params)
+            row = cursor.fetchone()
+            if row is not None:
+                return row[0], True
+
+        cursor.execute("""
+            UPDATE Pipeline_Run SET status = 'abandoned', finished_at = now()
+            WHERE """ + TAKEOVER_CONDITION + """
+            RETURNING run_id;
+        """, params)
+        abandoned = [row[0] for row in cursor.fetchall()]
+        if abandoned:
+            cursor.execute("DELETE FROM Pipeline_Run_Video WHERE run_id = ANY(%s);", (abandoned,))
+        cursor.execute("INSERT INTO Pipeline_Run (script) VALUES (%s) RETURNING run_id;", (script,))
+        return cursor.fetchone()[0], False
+
+
+# Function to close a run with status 'finished' or 'failed' and store its per-stage counts. The per-video
+# rows of a finished run are deleted; a failed run keeps them for --resume.
+def close_run(run_id, status="finished"):
+    with database.pooled_connection() as connection, database.transaction(connection) as cursor:
+        cursor.execute("""
+            SELECT stage, COUNT(*) FROM Pipeline_Run_Video WHERE run_id = %s GROUP BY stage;
+        """, (run_id,))
+        counts = dict(cursor.fetchall())
+        cursor.execute("""
+            UPDATE Pipeline_Run SET status = %s, finished_at = now(), completed = %s WHERE run_id = %s;
+        """, (status, json.dumps(counts), run_id))
+        if status == "finished":
+            cursor.execute("DELETE FROM Pipeline_Run_Video WHERE run_id = %s;", (run_id,))
+    print(f"Run {run_id} {status}: " + ", ".join(f"{stage} {counts.get(stage, 0)}" for stage in LEDGER_STAGES))
+    return counts
+
+
+# Function to record that a stage finished these videos in the run, which also counts as a heartbeat; the
+# caller commits (together with the stage's own writes). Does nothing without a run.
+def complete(cursor, run_id, stage, video_ids):
+    if run_id is None or not video_ids:
+        return
+    psycopg2.extras.execute_values(cursor, """
+        INSERT INTO Pipeline_Run_Video (run_id, stage, video_id)
+        VALUES %s
+        ON CONFLICT DO NOTHING;
+    """, [(run_id, stage, video_id) for video_id in video_ids], page_size=1000)
+    cursor.execute("UPDATE Pipeline_Run SET heartbeat_at = now() WHERE run_id = %s;", (run_id,))
+
+
+# Function to get the videos a stage already finished in the run (empty without a run)
+def completed(cursor, run_id, stage):
+    if run_id is None:
+        return set()
+    cursor.execute("SELECT video_id FROM Pipeline_Run_Video WHERE run_id = %s AND stage = %s;", (run_id, stage))
+    return {row[0] for row in cursor.fetchall()}
@@ -1,11 +1,16 @@
+import argparse
 import os
-import subprocess
-import requests
-import psycopg2
-import paramiko
+import psycopg2.extras
 import datetime
 import pytz
 from dotenv import load_dotenv
+import youtube_fetcher
+import dimension_cache
+import log_writer
+import discovery
+import database
+import metrics
+import run_ledger
 
 
 load_dotenv()
@@ -18,24 +23,27 @@ remote_directory = os.getenv("REMOTE_DIRECTORY")
 if not all([ssh_host, ssh_username, ssh_password, remote_directory]):
     raise ValueError("Missing one or more environment variables for SSH connection.")
 
-# Database connection details
-db_name = os.getenv("DB_NAME")
-db_user = os.getenv("DB_USER")
-db_host = os.getenv("DB_HOST")
-db_password = os.getenv("DB_PASSWORD")
-db_port = os.getenv("DB_PORT")
-
-if not all([db_name, db_user, db_host, db_password, db_port]):
-    raise ValueError("Missing one or more environment variables for database connection.")
-
-connectie = psycopg2.connect(
-    database=db_name,
-    user=db_user,
-    host=db_host,
-    password=db_password,
-    port=db_port
+# Function to get a database connection from the shared pool (give it back with database.release)
+def connect_database():
+    return database.connect()
+
+
+# Database connection of the ingest stage and the cache for the Dim_Date / Dim_Category lookups done for
+# every video, set by setup() on the first run_ingest()
+connectie = None
+cur = None
+dimensions = None
+
+# Log rows are buffered and written by a background thread on its own connection
+log_sink = log_writer.BufferedLogWriter(
+    database.connect,
+    batch_size=int(os.getenv("LOG_BATCH_SIZE", "100")),
+    flush_interval=float(os.getenv("LOG_FLUSH_INTERVAL", "2")),
+    release=database.release
 )
-cur = connectie.cursor()
+
+# First day of the Dim_Date range preloaded into the cache (the rest is fetched on demand)
+dim_date_cache_start = datetime.date.fromisoformat(os.getenv("DIM_DATE_CACHE_START", "2006-01-01"))
 
 # YouTube Data API key
 api_key = os.getenv("YOUTUBE_API_KEY")
@@ -43,6 +51,31 @@ api_key = os.getenv("YOUTUBE_API_KEY")
 if not api_key:
     raise ValueError("Missing YouTube API key in environment variables")
 
+# YouTube Data API base URL (can point to a local stub server for offline runs)
+youtube_api_url = os.getenv("YOUTUBE_API_URL", "https://www.googleapis.com/youtube/v3").rstrip("/")
+
+# The videos endpoint accepts at most 50 comma-separated IDs per call
+max_ids_per_request = 50
+
+# Where the video files are listed from: "sftp" (default) or "local" (REMOTE_DIRECTORY is a local directory)
+discovery_source = os.getenv("DISCOVERY_SOURCE", "sftp")
+
+# Unchanged videos get their statistics refreshed once this many hours have passed since their last ingest
+stats_refresh_interval = datetime.timedelta(hours=float(os.getenv("STATS_REFRESH_HOURS", "20")))
+
+# Unchanged videos get their snippet/contentDetails re-checked against the stored etag this often
+details_refresh_interval = datetime.timedelta(days=float(os.getenv("DETAILS_REFRESH_DAYS", "7")))
+
+# Concurrent fetch settings: parallel requests, requests per second (0 disables the limit),
+# fetched batches waiting for the database writer, and retries on 403/429/5xx
+fetch_workers = int(os.getenv("FETCH_WORKERS", "4"))
+fetch_rate_limit = float(os.getenv("FETCH_RATE_LIMIT", "10"))
+fetch_queue_size = int(os.getenv("FETCH_QUEUE_SIZE", "8"))
+fetch_max_retries = int(os.getenv("FETCH_MAX_RETRIES", "4"))
+
+# Number of fetched videos written per bulk upsert transaction
+write_batch_size = int(os.getenv("WRITE_BATCH_SIZE", "500"))
+
 # Categories mapping
 categories = {
     1: "Film & Animation", 2: "Autos & Vehicles", 10: "Music", 15: "Pets & Animals", 17: "Sports",
@@ -58,6 +91,14 @@ categories = {
 amsterdam_tz = pytz.timezone('Europe/Amsterdam')
 
 
+# Function to set the database connection used by the functions below
+def setup(connection):
+    global connectie, cur, dimensions
+    connectie = connection
+    cur = connection.cursor()
+    dimensions = dimension_cache.DimensionCache(cur)
+
+
 def create_log_table():
     cur.execute("""
         CREATE TABLE IF NOT EXISTS Log (
@@ -68,16 +109,11 @@ def create_log_table():
             message TEXT
         );
     """)
-    connectie.commit()
 
 
-# Log message function
+# Log message function (queued; written in batches by log_sink, never blocks the pipeline)
 def log_message(service_name, log_level, message):
-    cur.execute("""
-        INSERT INTO Log (service_name, log_level, message)
-        VALUES (%s, %s, %s);
-    """, (service_name, log_level, message))
-    connectie.commit()
+    log_sink.log(service_name, log_level, message)
 
 
 # Function to create the necessary tables except Dim_Date
@@ -93,9 +129,12 @@ def create_tables():
             duration TEXT NOT NULL,
             category_id INT NOT NULL,
             date_id INT REFERENCES Dim_Date(date_id),
-            sentiment VARCHAR(15) DEFAULT NULL
+            sentiment VARCHAR(15) DEFAULT NULL,
+            etag VARCHAR(64) DEFAULT NULL
         );
     """)
+    # etag of the last snippet/contentDetails response, used to skip unchanged videos (added later)
+    cur.execute("ALTER TABLE Dim_Video ADD COLUMN IF NOT EXISTS etag VARCHAR(64) DEFAULT NULL;")
 
     # Create Dim_Category table (if not already created)
     cur.execute("""
@@ -119,162 +158,359 @@ def create_tables():
             );
         """)
 
-    connectie.commit()
+    discovery.create_manifest_table(cur)
+
 
+# Function to get metadata for up to 50 videos with a single videos.list call.
+# Runs on the fetch threads, so it only does HTTP; logging and database writes stay on the main thread.
+def get_videos_metadata_batch(video_ids, session, rate_limiter=None, parts="snippet,contentDetails,statistics"):
+    with metrics.timer("youtube_api_request", parts=parts):
+        return youtube_fetcher.get_with_retry(session, f"{youtube_api_url}/videos", params={
+            "id": ",".join(video_ids),
+            "part": parts,
+            "maxResults": max_ids_per_request,
+            "key": api_key
+        }, rate_limiter=rate_limiter, max_retries=fetch_max_retries, api="youtube")
 
-# Function to get metadata for a single video
-def get_video_metadata(video_id):
-    url = f"https://www.googleapis.com/youtube/v3/videos?id={video_id}&part=snippet,contentDetails,statistics&key={api_key}"
-    response = requests.get(url)
 
-    if response.status_code == 200:
-        log_message("video_weg_service", "INFO", f"Successfully retrieved metadata for video ID {video_id}")
-        return response.json()
-    else:
+# Function to check one fetched batch, log the outcome and return the returned items
+def check_metadata_response(video_ids, response, error=None):
+    if error is not None:
         log_message("video_weg_service", "ERROR",
-                    f"Failed to retrieve metadata for video ID {video_id}. Status code: {response.status_code}")
-        return None
+                    f"Failed to retrieve metadata for {len(video_ids)} video IDs: {error}")
+        return []
+    if response.status_code != 200:
+        log_message("video_weg_service", "ERROR",
+                    f"Failed to retrieve metadata for {len(video_ids)} video IDs. Status code: {response.status_code}")
+        return []
+
+    items = response.json().get('items', [])
+    log_message("video_weg_service", "INFO",
+                f"Successfully retrieved metadata for {len(items)} of {len(video_ids)} video IDs")
+
+    # Log the IDs the API did not return in one message instead of one row per video
+    returned_ids = {item['id'] for item in items}
+    missing_ids = [video_id for video_id in video_ids if video_id not in returned_ids]
+    if missing_ids:
+        log_message("video_weg_service", "ERROR",
+                    f"No metadata found for {len(missing_ids)} video IDs: {', '.join(missing_ids)}")
+    return items
 
 
-# Function to get the date_id from the Dim_Date table based on timestamp
+# Function to split video IDs into chunks that fit in one videos.list call
+def chunk_video_ids(video_ids, chunk_size=max_ids_per_request):
+    for start in range(0, len(video_ids), chunk_size):
+        yield video_ids[start:start + chunk_size]
+
+
+# Function to get the date_id from the Dim_Date table based on timestamp (served from the dimension cache)
 def get_date_id_for_timestamp(timestamp):
-    date = timestamp.date()
-    cur.execute("""
-        SELECT date_id FROM Dim_Date WHERE year = %s AND month = %s AND day = %s;
-    """, (date.year, date.month, date.day))
-    result = cur.fetchone()
-    if result:
-        return result[0]
-    else:
-        return None
+    return dimensions.date_id(timestamp.date())
+
+
+# Function to preload Dim_Date and write the static categories mapping to Dim_Category once per run
+def load_dimension_cache():
+    today = datetime.datetime.now(amsterdam_tz).date()
+    loaded = dimensions.load_dates(dim_date_cache_start, today + datetime.timedelta(days=1))
+    dimensions.sync_categories(categories)
+    print(f"Dimension cache loaded: {loaded} dates, {len(categories)} categories")
 
 
-# Function to insert or update the video metadata into the database
-# Function to insert or update the video metadata into the database
+# Function to insert or update the video metadata into the database.
+# Items fetched with snippet/contentDetails update Dim_Video, items fetched with statistics update
+# Fact_Video_Statistics; an item can carry both.
+@metrics.timed("db_upsert_video")
 def upsert_video_metadata(metadata):
     try:
         video_id = metadata['id']
-        snippet = metadata['snippet']
-        stats = metadata.get('statistics', {})
-        category_id = int(snippet['categoryId'])
-        published_date = snippet['publishedAt']
-
-        # Insert/Update Dim_Category
-        category = categories.get(category_id, "Unknown")
-        cur.execute("""
-            INSERT INTO Dim_Category (category_id, category)
-            VALUES (%s, %s)
-            ON CONFLICT (category_id) DO UPDATE
-            SET category = EXCLUDED.category;
-        """, (category_id, category))
-
-        # Get the timestamp and date_id for the Fact_Video_Statistics
-        current_time_amsterdam = datetime.datetime.now(amsterdam_tz)
-        date_id_fact = get_date_id_for_timestamp(current_time_amsterdam)
-
-        # Get the date_id for Dim_Video based on the published_date
-        published_datetime = datetime.datetime.strptime(published_date, '%Y-%m-%dT%H:%M:%SZ')
-        date_id_video = get_date_id_for_timestamp(published_datetime)
-
-        # Insert/Update Dim_Video with sentiment as NULL for now
-        cur.execute("""
-            INSERT INTO Dim_Video (video_id, title, published_date, channel_id, channel_name, duration, category_id, date_id, sentiment)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, NULL)  -- Sentiment is NULL
-            ON CONFLICT (video_id) DO UPDATE
-            SET title = EXCLUDED.title,
-                published_date = EXCLUDED.published_date,
-                channel_id = EXCLUDED.channel_id,
-                channel_name = EXCLUDED.channel_name,
-                duration = EXCLUDED.duration,
-                category_id = EXCLUDED.category_id,
-                date_id = EXCLUDED.date_id,
-                sentiment = EXCLUDED.sentiment; 
-        """, (video_id, snippet['title'], snippet['publishedAt'], snippet['channelId'], snippet['channelTitle'],
-              metadata['contentDetails']['duration'], category_id, date_id_video))
-
-        # Continue with Fact_Video_Statistics as usual, without sentiment
-        cur.execute("""
-            SELECT COUNT(*) FROM Fact_Video_Statistics
-            WHERE video_id = %s AND date_id = %s;
-        """, (video_id, date_id_fact))
-
-        exists = cur.fetchone()[0] > 0
-
-        if exists:
-            # Update the existing record
+        new_categories = set()
+
+        if 'snippet' in metadata:
+            snippet = metadata['snippet']
+            category_id = int(snippet['categoryId'])
+            published_date = snippet['publishedAt']
+
+            # Insert/Update Dim_Category (only for categories the cache has not seen yet)
+            new_categories = dimensions.missing_categories([category_id])
+            if new_categories:
+                category = categories.get(category_id, "Unknown")
+                cur.execute("""
+                    INSERT INTO Dim_Category (category_id, category)
+                    VALUES (%s, %s)
+                    ON CONFLICT (category_id) DO UPDATE
+                    SET category = EXCLUDED.category;
+                """, (category_id, category))
+
+            # Get the date_id for Dim_Video based on the published_date
+            published_datetime = datetime.datetime.strptime(published_date, '%Y-%m-%dT%H:%M:%SZ')
+            date_id_video = get_date_id_for_timestamp(published_datetime)
+
+            # Insert/Update Dim_Video with sentiment as NULL for now, unless the etag shows nothing changed
             cur.execute("""
-                       UPDATE Fact_Video_Statistics
-                       SET view_count = %s, like_count = %s, comment_count = %s, timestamp = %s
-                       WHERE video_id = %s AND date_id = %s;
-                   """, (stats.get('viewCount', 0), stats.get('likeCount', 0), stats.get('commentCount', 0),
-                         current_time_amsterdam, video_id, date_id_fact))
-        else:
-            # Insert new record
+                INSERT INTO Dim_Video (video_id, title, published_date, channel_id, channel_name, duration, category_id, date_id, sentiment, etag)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, NULL, %s)  -- Sentiment is NULL
+                ON CONFLICT (video_id) DO UPDATE
+                SET title = EXCLUDED.title,
+                    published_date = EXCLUDED.published_date,
+                    channel_id = EXCLUDED.channel_id,
+                    channel_name = EXCLUDED.channel_name,
+                    duration = EXCLUDED.duration,
+                    category_id = EXCLUDED.category_id,
+                    date_id = EXCLUDED.date_id,
+                    sentiment = EXCLUDED.sentiment,
+                    etag = EXCLUDED.etag
+                WHERE Dim_Video.etag IS DISTINCT FROM EXCLUDED.etag OR EXCLUDED.etag IS NULL;
+            """, (video_id, snippet['title'], snippet['publishedAt'], snippet['channelId'], snippet['channelTitle'],
+                  metadata['contentDetails']['duration'], category_id, date_id_video, details_etag(metadata)))
+
+        if 'statistics' in metadata:
+            stats = metadata['statistics']
+
+            # Get the timestamp and date_id for the Fact_Video_Statistics
+            current_time_amsterdam = datetime.datetime.now(amsterdam_tz)
+            date_id_fact = get_date_id_for_timestamp(current_time_amsterdam)
+
+            # Continue with Fact_Video_Statistics as usual, without sentiment
             cur.execute("""
-                      INSERT INTO Fact_Video_Statistics (video_id, view_count, like_count, comment_count, timestamp, popularity_rating, date_id)
-                      VALUES (%s, %s, %s, %s, %s, NULL, %s);
-                  """, (video_id, stats.get('viewCount', 0), stats.get('likeCount', 0), stats.get('commentCount', 0),
-                        current_time_amsterdam, date_id_fact))
+                INSERT INTO Fact_Video_Statistics (video_id, view_count, like_count, comment_count, timestamp, popularity_rating, date_id)
+                VALUES (%s, %s, %s, %s, %s, NULL, %s)
+                ON CONFLICT (video_id, date_id) DO UPDATE
+                SET view_count = EXCLUDED.view_count,
+                    like_count = EXCLUDED.like_count,
+                    comment_count = EXCLUDED.comment_count,
+                    timestamp = EXCLUDED.timestamp;
+            """, (video_id, stats.get('viewCount', 0), stats.get('likeCount', 0), stats.get('commentCount', 0),
+                  current_time_amsterdam, date_id_fact))
 
         connectie.commit()
+        dimensions.mark_categories(new_categories)
         log_message("video_weg_service", "INFO", f"Successfully inserted/updated metadata for video ID {video_id}")
+        return True
 
     except Exception as e:
+        connectie.rollback()
         log_message("video_weg_service", "ERROR",
                     f"Failed to insert/update metadata for video ID {metadata['id']}: {e}")
-        connectie.rollback()
-
+        return False
 
 
-# Function to fetch video files from the remote directory via SSH
-def fetch_video_files_via_ssh():
-    ssh = paramiko.SSHClient()
-    ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-    ssh.connect(ssh_host, username=ssh_username, password=ssh_password)
+# Function to get the etag to store in Dim_Video. The API etag covers every requested part, so it only
+# identifies the snippet/contentDetails when statistics were not part of the same request.
+def details_etag(metadata):
+    if 'statistics' in metadata:
+        return None
+    return metadata.get('etag')
+
+
+# Function to insert or update a batch of video metadata with one statement per table and one commit.
+# ON CONFLICT replaces the per-video SELECT COUNT(*) + UPDATE/INSERT, so there is no check-then-write race.
+# Dim_Video rows whose stored etag matches are left untouched. With a run_id the written videos are recorded
+# in the run ledger under stage in the same commit. Returns the IDs of the videos that were written.
+@metrics.timed("db_upsert_batch")
+def upsert_video_metadata_batch(items, run_id=None, stage=None):
+    if not items:
+        return set()
+
+    current_time_amsterdam = datetime.datetime.now(amsterdam_tz)
+    category_rows = {}
+    video_rows = {}
+    fact_rows = {}
+    parsed = set()
+
+    for metadata in items:
+        video_id = metadata.get('id')
+        try:
+            if 'snippet' in metadata:
+                snippet = metadata['snippet']
+                category_id = int(snippet['categoryId'])
+                published_datetime = datetime.datetime.strptime(snippet['publishedAt'], '%Y-%m-%dT%H:%M:%SZ')
+                video_row = [video_id, snippet['title'], snippet['publishedAt'], snippet['channelId'],
+                             snippet['channelTitle'], metadata['contentDetails']['duration'], category_id,
+                             dimensions.date_id(published_datetime.date()), None, details_etag(metadata)]
+                category_rows[category_id] = (category_id, categories.get(category_id, "Unknown"))
+                video_rows[video_id] = video_row
+            if 'statistics' in metadata:
+                stats = metadata['statistics']
+                fact_rows[video_id] = [video_id, int(stats.get('viewCount', 0)), int(stats.get('likeCount', 0)),
+                                       int(stats.get('commentCount', 0)), current_time_amsterdam]
+            parsed.add(video_id)
+        except (KeyError, TypeError, ValueError) as e:
+            log_message("video_weg_service", "ERROR", f"Failed to parse metadata for video ID {video_id}: {e}")
+            video_rows.pop(video_id, None)
+            fact_rows.pop(video_id, None)
+
+    if not parsed:
+        return set()
 
-    sftp = ssh.open_sftp()
     try:
-        video_files = sftp.listdir(remote_directory)
-        return video_files
-    finally:
-        sftp.close()
-        ssh.close()
+        changed = []
+        new_categories = dimensions.missing_categories(category_rows)
+        # One bulk transaction for the whole batch (see database.bulk_synchronous_commit)
+        database.use_bulk_commit(cur)
+        if new_categories:
+            psycopg2.extras.execute_values(cur, """
+                INSERT INTO Dim_Category (category_id, category)
+                VALUES %s
+                ON CONFLICT (category_id) DO UPDATE
+                SET category = EXCLUDED.category;
+            """, [category_rows[category_id] for category_id in new_categories])
+
+        # Insert/Update Dim_Video with sentiment as NULL for now, skipping rows whose etag did not change
+        if video_rows:
+            changed = psycopg2.extras.execute_values(cur, """
+                INSERT INTO Dim_Video (video_id, title, published_date, channel_id, channel_name, duration, category_id, date_id, sentiment, etag)
+                VALUES %s
+                ON CONFLICT (video_id) DO UPDATE
+                SET title = EXCLUDED.title,
+                    published_date = EXCLUDED.published_date,
+                    channel_id = EXCLUDED.channel_id,
+                    channel_name = EXCLUDED.channel_name,
+                    duration = EXCLUDED.duration,
+                    category_id = EXCLUDED.category_id,
+                    date_id = EXCLUDED.date_id,
+                    sentiment = EXCLUDED.sentiment,
+                    etag = EXCLUDED.etag
+                WHERE Dim_Video.etag IS DISTINCT FROM EXCLUDED.etag OR EXCLUDED.etag IS NULL
+                RETURNING video_id;
+            """, list(video_rows.values()), page_size=len(video_rows), fetch=True)
+
+        if fact_rows:
+            date_id_fact = dimensions.date_id(current_time_amsterdam.date())
+            psycopg2.extras.execute_values(cur, """
+                INSERT INTO Fact_Video_Statistics (video_id, view_count, like_count, comment_count, timestamp, date_id, popularity_rating)
+                VALUES %s
+                ON CONFLICT (video_id, date_id) DO UPDATE
+                SET view_count = EXCLUDED.view_count,
+                    like_count = EXCLUDED.like_count,
+                    comment_count = EXCLUDED.comment_count,
+                    timestamp = EXCLUDED.timestamp;
+            """, [row + [date_id_fact, None] for row in fact_rows.values()], page_size=len(fact_rows))
+
+        run_ledger.complete(cur, run_id, stage, parsed)
+        connectie.commit()
+        dimensions.mark_categories(new_categories)
+        log_message("video_weg_service", "INFO",
+                    f"Successfully inserted/updated metadata for {len(parsed)} video IDs "
+                    f"({len(changed)} of {len(video_rows)} video details changed, {len(fact_rows)} statistics rows)")
+        return parsed
 
+    except Exception as e:
+        connectie.rollback()
+        log_message("video_weg_service", "ERROR",
+                    f"Bulk insert/update failed for {len(parsed)} video IDs, retrying per video: {e}")
+        # Fall back to the per-video path so one bad row does not lose the whole batch
+        written = {metadata['id'] for metadata in items
+                   if metadata.get('id') in parsed and upsert_video_metadata(metadata)}
+        run_ledger.complete(cur, run_id, stage, written)
+        connectie.commit()
+        return written
 
-# Function to extract metadata from video IDs in the remote directory
-def extract_metadata_from_videos(video_files):
-    for video_file in video_files:
-        video_id = os.path.splitext(video_file)[0]  # Remove file extension
-        print(f"Extracting metadata for video ID: {video_id}")
 
-        metadata = get_video_metadata(video_id)
+# Function to list the video files in the remote directory (or a local directory when DISCOVERY_SOURCE=local)
+def list_video_files():
+    if discovery_source == "local":
+        return discovery.list_local_files(remote_directory)
+    return discovery.list_sftp_files(ssh_host, ssh_username, ssh_password, remote_directory)
 
-        if metadata and 'items' in metadata and len(metadata['items']) > 0:
-            upsert_video_metadata(metadata['items'][0])
-            connectie.commit()
-        else:
-            log_message("video_weg_service", "ERROR", f"No metadata found for video ID: {video_id}")
 
+# Function to list the remote directory once, diff it against Video_Manifest and return what to ingest
+def discover_videos():
+    result = discovery.discover(cur, list_video_files(), stats_refresh_interval, details_refresh_interval)
+    connectie.commit()
+    log_message("video_weg_service", "INFO",
+                f"Discovered {len(result.present)} videos: {len(result.new_or_changed)} new or changed, "
+                f"{len(result.stale)} due for a statistics refresh, {len(result.details_due)} due for a details check")
+    return result
+
+
+# Function to extract metadata for video IDs, 50 IDs per API call, and return the IDs that were stored.
+# Batches are fetched concurrently over one pooled session while this thread writes the results; with a
+# run_id every written batch is recorded in the run ledger under stage.
+def extract_metadata_from_videos(video_ids, parts="snippet,contentDetails,statistics", run_id=None, stage=None):
+    written = set()
+    batches = list(chunk_video_ids(video_ids))
+    print(f"Extracting {parts} for {len(video_ids)} video IDs in {len(batches)} batches")
+
+    rate_limiter = youtube_fetcher.TokenBucket(fetch_rate_limit) if fetch_rate_limit > 0 else None
+    with youtube_fetcher.create_session(fetch_workers) as session:
+        results = youtube_fetcher.fetch_concurrently(
+            batches,
+            lambda batch: get_videos_metadata_batch(batch, session, rate_limiter, parts),
+            workers=fetch_workers,
+            queue_size=fetch_queue_size
+        )
+        pending_items = []
+        for batch, response, error in results:
+            pending_items.extend(check_metadata_response(batch, response, error))
+            if len(pending_items) >= write_batch_size:
+                written |= upsert_video_metadata_batch(pending_items, run_id, stage)
+                pending_items = []
+        written |= upsert_video_metadata_batch(pending_items, run_id, stage)
+
+    return written
+
+
+# Function to run the ingest stage; returns the discovery result and the IDs of the videos that were stored.
+# With a run_id progress is recorded in the run ledger batch by batch, and a resumed run only fetches the
+# details and statistics the ledger does not have yet for it.
+def run_ingest(run_id=None):
+    if connectie is None:
+        setup(connect_database())
+    date_lookups, date_queries = dimensions.date_lookups, dimensions.date_queries
+
+    # Schema and dimension cache in one transaction
+    with database.transaction(connectie):
+        create_log_table()
+        create_tables()  # Create the tables except Dim_Date
+        load_dimension_cache()
+    videos = discover_videos()
+    details_done = run_ledger.completed(cur, run_id, "details")
+    stats_done = run_ledger.completed(cur, run_id, "statistics")
+    if details_done or stats_done:
+        print(f"Resuming run {run_id}: details of {len(details_done)} and statistics of {len(stats_done)} "
+              f"videos already stored")
+
+    # Snippet/contentDetails only for new or changed files and on the details cadence; Dim_Video rows
+    # are only rewritten when the etag changed. Every video due for ingest gets the cheap statistics call.
+    details_written = details_done | extract_metadata_from_videos(
+        [video_id for video_id in videos.new_or_changed + videos.details_due if video_id not in details_done],
+        parts="snippet,contentDetails", run_id=run_id, stage="details")
+    stats_written = stats_done | extract_metadata_from_videos(
+        [video_id for video_id in videos.to_ingest() if video_id not in stats_done],
+        parts="statistics", run_id=run_id, stage="statistics")
+
+    # A new video only counts as ingested once both its details and its statistics are stored
+    written = stats_written - (set(videos.new_or_changed) - details_written)
+    discovery.mark_ingested(cur, written)
+    discovery.mark_details_checked(cur, details_written)
+    run_ledger.complete(cur, run_id, "ingest", written)
+    connectie.commit()
+    metrics.count("videos_ingested", len(written))
+    # Date lookups are dict hits: counted by the cache, not timed one by one
+    metrics.count("dim_date_lookups", dimensions.date_lookups - date_lookups)
+    metrics.count("dim_date_queries", dimensions.date_queries - date_queries)
+    log_message("video_weg_service", "INFO", "Database updated with video metadata.")
+    log_sink.flush()
+    return videos, written
 
-# Main function to run the script
+
+# Main function to run the script (ingest only; pipeline.py runs ingest, scoring and transcripts together)
 def main():
-    create_log_table()
-    create_tables()  # Create the tables except Dim_Date
-    video_files = fetch_video_files_via_ssh()
-    extract_metadata_from_videos(video_files)
-    log_message("video_weg_service", "INFO", "Database updated with video metadata.")
-    print("schrif_video_weg_done")
-    try:
-        subprocess.run(['python', 'popularity_prediction.py'], check=True)
-    except subprocess.CalledProcessError as e:
-        print(f"Error running popularity prediction: {e}")
+    parser = argparse.ArgumentParser(description="Ingest the metadata and statistics of the videos on the share")
+    parser.add_argument("--resume", action="store_true", help="Continue the last unfinished run")
+    args = parser.parse_args()
 
-        # Call transcript.py to handle transcripts and sentiment analysis
+    run_id, _ = run_ledger.open_run("schrif_video_weg", args.resume)
     try:
-        subprocess.run(['python', 'transcript.py'], check=True)
-    except subprocess.CalledProcessError as e:
-        print(f"Error running transcript script: {e}")
+        run_ingest(run_id)
+    except BaseException:
+        run_ledger.close_run(run_id, "failed")
+        raise
+    run_ledger.close_run(run_id)
+    print("schrif_video_weg_done")
+    metrics.finish_run("schrif_video_weg", run_id)
+    database.report()
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
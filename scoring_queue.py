@@ -0,0 +1,205 @@
+import argparse
+import os
+import socket
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+import psycopg2.extras
+
+import database
+import popularity_prediction
+
+# Work-queue mode for popularity scoring, so several processes (on one box or in several containers)
+# can score the same backlog without doing the work twice. The unrated (video_id, date_id) rows are put
+# in Popularity_Queue; every worker claims a chunk with FOR UPDATE SKIP LOCKED and takes a lease on it,
+# scores it, and writes the labels and removes the chunk from the queue in one transaction. Rows of a
+# worker that crashed keep their lease until it expires and are then claimed by another worker.
+#
+#   python scoring_queue.py --workers 4               enqueue the backlog and score it with 4 processes
+#   python scoring_queue.py --workers 4 --no-enqueue  join the queue from another box or container
+
+# Seconds a claimed chunk stays reserved for its worker; must be longer than scoring one chunk takes
+lease_seconds = int(os.getenv("SCORING_LEASE_SECONDS", "300"))
+
+# Seconds a worker waits before looking again when every queued row is leased by another worker
+poll_interval = float(os.getenv("SCORING_POLL_SECONDS", "1"))
+
+
+# Function to create the queue and the daily means the queued rows are imputed with
+def create_queue_tables(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS Popularity_Queue (
+            video_id VARCHAR(15),
+            date_id INT,
+            lease_owner TEXT DEFAULT NULL,
+            lease_expires TIMESTAMP DEFAULT NULL,
+            PRIMARY KEY (video_id, date_id)
+        );
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS Popularity_Queue_Means (
+            date DATE PRIMARY KEY,
+            mean_likes FLOAT8,
+            mean_comments FLOAT8
+        );
+    """)
+
+
+# Function to queue the unrated statistics rows (optionally only for some video IDs) and recompute the
+# daily means over everything in the queue, so every worker imputes with the same means whatever chunk
+# it gets. Returns the number of rows that were added.
+def enqueue(connection, video_ids=None):
+    params = {"video_ids": list(video_ids) if video_ids is not None else None}
+    cursor = connection.cursor()
+    create_queue_tables(cursor)
+    cursor.execute("""
+        INSERT INTO Popularity_Queue (video_id, date_id)
+        SELECT fvs.video_id, fvs.date_id
+    """ + popularity_prediction.unrated_rows_sql + """
+        ON CONFLICT (video_id, date_id) DO NOTHING;
+    """, params)
+    added = cursor.rowcount
+
+    cursor.execute("DELETE FROM Popularity_Queue_Means;")
+    cursor.execute("""
+        INSERT INTO Popularity_Queue_Means (date, mean_likes, mean_comments)
+        SELECT fvs.timestamp::date, AVG(fvs.like_count)::float8, AVG(fvs.comment_count)::float8
+        FROM Popularity_Queue q
+        JOIN Fact_Video_Statistics fvs ON fvs.video_id = q.video_id AND fvs.date_id = q.date_id
+        GROUP BY fvs.timestamp::date;
+    """)
+    connection.commit()
+    cursor.close()
+    return added
+
+
+# Function to read the daily means of the queue in the form score_chunk expects
+def get_queue_means(cursor):
+    cursor.execute("SELECT date, mean_likes, mean_comments FROM Popularity_Queue_Means;")
+    daily_means = pd.DataFrame(cursor.fetchall(), columns=['date', 'mean_likes', 'mean_comments'])
+    return daily_means.set_index('date')
+
+
+# Function to claim up to chunk queued rows that nobody holds a valid lease on, and return their data.
+# The claim is committed right away: the lease, not an open transaction, keeps other workers off the rows.
+def claim_chunk(connection, worker_id, chunk):
+    cursor = connection.cursor()
+    cursor.execute("""
+        WITH claimed AS (
+            UPDATE Popularity_Queue q
+            SET lease_owner = %(worker_id)s,
+                lease_expires = now() + make_interval(secs => %(lease_seconds)s)
+            FROM (
+                SELECT video_id, date_id FROM Popularity_Queue
+                WHERE lease_expires IS NULL OR lease_expires < now()
+                LIMIT %(chunk)s
+                FOR UPDATE SKIP LOCKED
+            ) free
+            WHERE q.video_id = free.video_id AND q.date_id = free.date_id
+            RETURNING q.video_id, q.date_id
+        )
+        SELECT c.video_id, c.date_id, fvs.view_count, fvs.like_count, fvs.comment_count, dv.duration, dv.category_id, fvs.timestamp
+        FROM claimed c
+        LEFT JOIN Fact_Video_Statistics fvs ON fvs.video_id = c.video_id AND fvs.date_id = c.date_id
+        LEFT JOIN Dim_Video dv ON dv.video_id = c.video_id;
+    """, {"worker_id": worker_id, "lease_seconds": lease_seconds, "chunk": chunk})
+    rows = cursor.fetchall()
+
+    # Queued rows whose statistics or video were deleted since they were queued cannot be scored
+    orphans = [(row[0], row[1]) for row in rows if row[7] is None or row[5] is None]
+    if orphans:
+        delete_from_queue(cursor, orphans, worker_id)
+    connection.commit()
+    cursor.close()
+
+    return pd.DataFrame([row for row in rows if row[7] is not None and row[5] is not None],
+                        columns=['video_id', 'date_id', 'view_count', 'like_count', 'comment_count', 'duration', 'category_id', 'timestamp'])
+
+
+# Function to remove rows from the queue, but only while this worker still holds their lease
+def delete_from_queue(cursor, keys, worker_id):
+    psycopg2.extras.execute_values(cursor, """
+        DELETE FROM Popularity_Queue q
+        USING (VALUES %s) AS done(video_id, date_id, lease_owner)
+        WHERE q.video_id = done.video_id AND q.date_id = done.date_id AND q.lease_owner = done.lease_owner;
+    """, [(video_id, date_id, worker_id) for video_id, date_id in keys], page_size=1000)
+
+
+# Function to write the labels of a scored chunk and remove it from the queue in one bulk transaction
+def complete_chunk(connection, df, worker_id):
+    with database.transaction(connection, bulk=True) as cursor:
+        popularity_prediction.update_popularity(cursor, df)
+        delete_from_queue(cursor, list(df[['video_id', 'date_id']].itertuples(index=False, name=None)), worker_id)
+
+
+# Function to count the rows still in the queue (leased or not)
+def queue_size(cursor):
+    cursor.execute("SELECT COUNT(*) FROM Popularity_Queue;")
+    return cursor.fetchone()[0]
+
+
+# Function to run one worker until the queue is empty. Returns the number of rows it scored.
+def run_worker(worker_id=None, chunk=None):
+    worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+    chunk = chunk or popularity_prediction.chunk_size
+    scaler, model = popularity_prediction.load_models()
+    connection = popularity_prediction.connect_database()
+    try:
+        cursor = connection.cursor()
+        daily_means = get_queue_means(cursor)
+        connection.commit()
+        scored = 0
+        while True:
+            df = claim_chunk(connection, worker_id, chunk)
+            if df.empty:
+                # Everything left is leased by other workers (or by a crashed one, until its lease expires)
+                remaining = queue_size(cursor)
+                connection.commit()
+                if remaining == 0:
+                    break
+                time.sleep(poll_interval)
+                continue
+
+            print(f"Worker {worker_id} claimed {len(df)} rows.")
+            df = popularity_prediction.score_chunk(df, daily_means, scaler, model)
+            complete_chunk(connection, df, worker_id)
+            scored += len(df)
+    finally:
+        database.release(connection)
+        database.close_pool()
+
+    print(f"Worker {worker_id} scored {scored} rows.")
+    database.report(f"Worker {worker_id} database")
+    return scored
+
+
+# Function to start local worker processes on the queue and wait for them. Returns the number of
+# rows they scored together.
+def launch(workers, chunk=None):
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(run_worker, None, chunk) for _ in range(workers)]
+        return sum(future.result() for future in futures)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score popularity with several workers over a Postgres work queue")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("SCORING_WORKERS", os.cpu_count() or 1)))
+    parser.add_argument("--chunk", type=int, default=popularity_prediction.chunk_size)
+    parser.add_argument("--no-enqueue", action="store_true", help="Only work on rows another process queued")
+    args = parser.parse_args()
+
+    if not args.no_enqueue:
+        connection = popularity_prediction.connect_database()
+        try:
+            print(f"Queued {enqueue(connection)} unrated rows.")
+        finally:
+            database.release(connection)
+            database.close_pool()
+
+    scored = launch(args.workers, args.chunk)
+    print(f"{args.workers} workers scored {scored} rows. Script completed.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+import argparse
+import json
+import os
+import queue
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+import requests
+
+import features
+import model_runtime
+
+# Long-running local scoring service. It loads the popularity (scaler + KMeans) and sentiment
+# (nlp_model + classificatie_model) models once and answers scoring requests over HTTP. Requests that
+# arrive at the same time are coalesced into one predict call per micro-batch.
+#
+#   POST /popularity  {"rows": {column: [values]}, "daily_means": {"date": [...], "mean_likes": [...],
+#                      "mean_comments": [...]}}                      -> {"clusters": [...]}
+#   POST /sentiment   {"documents": ["cleaned transcript", ...]}   -> {"predictions": [...]}
+#   GET  /health                                                     -> {"status": "ok"}
+#
+# Start it with: python scoring_service.py --port 8766
+# The pipeline scripts use it when SCORING_SERVICE_URL is set and fall back to in-process scoring
+# when it is not reachable.
+
+ROW_COLUMNS = ['view_count', 'like_count', 'comment_count', 'duration', 'category_id', 'timestamp']
+
+
+# Collects concurrent requests and runs them through predict as one batch. A batch is closed when it
+# holds max_batch items or when the first request in it has waited max_wait seconds.
+class MicroBatcher:
+    def __init__(self, predict, concat, max_batch=4096, max_wait=0.005):
+        self.predict = predict
+        self.concat = concat
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.requests = queue.Queue()
+        self.batches = 0
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    # Function to score one request's inputs (size rows or documents); blocks until its batch has been predicted
+    def submit(self, inputs, size=None):
+        done = threading.Event()
+        job = {"inputs": inputs, "size": len(inputs) if size is None else size,
+               "done": done, "result": None, "error": None}
+        self.requests.put(job)
+        done.wait()
+        if job["error"] is not None:
+            raise job["error"]
+        return job["result"]
+
+    def _run(self):
+        while True:
+            jobs = [self.requests.get()]
+            size = jobs[0]["size"]
+            deadline = time.monotonic() + self.max_wait
+            while size < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    job = self.requests.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                jobs.append(job)
+                size += job["size"]
+
+            self.batches += 1
+            try:
+                results = self.predict(self.concat([job["inputs"] for job in jobs]))
+                offset = 0
+                for job in jobs:
+                    job["result"] = results[offset:offset + job["size"]]
+                    offset += job["size"]
+            except Exception as e:
+                for job in jobs:
+                    job["error"] = e
+            for job in jobs:
+                job["done"].set()
+
+
+# Function to convert the daily means DataFrame to its JSON form
+def daily_means_to_json(daily_means):
+    return {'date': [str(date)[:10] for date in daily_means.index],
+            'mean_likes': daily_means['mean_likes'].tolist(),
+            'mean_comments': daily_means['mean_comments'].tolist()}
+
+
+# The scoring service: warm models plus one micro-batcher per model
+class ScoringService:
+    def __init__(self, max_batch=4096, max_wait=0.005):
+        self.scaler, self.model = model_runtime.load_popularity_models()
+        self.nlp_model, self.classificatie_model = model_runtime.load_sentiment_models()
+        self.popularity = MicroBatcher(self._predict_popularity, lambda parts: parts, max_batch, max_wait)
+        self.sentiment = MicroBatcher(self._predict_sentiment, lambda parts: [doc for part in parts for doc in part],
+                                      max_batch, max_wait)
+
+    # Function to score the rows of all requests in a batch in one pass; every request brings its own
+    # daily means, so the zero-count imputation is keyed on the request
+    def _predict_popularity(self, requests):
+        rows = {column: [value for request in requests for value in request["rows"][column]] for column in ROW_COLUMNS}
+        keys = np.repeat(np.arange(len(requests)), [len(request["rows"]["view_count"]) for request in requests])
+        dates = [(key, date) for key, request in enumerate(requests) for date in request["daily_means"]["date"]]
+        daily_means = pd.DataFrame(
+            {'mean_likes': [mean for request in requests for mean in request["daily_means"]["mean_likes"]],
+             'mean_comments': [mean for request in requests for mean in request["daily_means"]["mean_comments"]]},
+            index=pd.MultiIndex.from_arrays([[key for key, _ in dates], pd.to_datetime([date for _, date in dates])]))
+
+        df = pd.DataFrame(rows)
+        df['timestamp'] = pd.to_datetime(df['timestamp'])
+        matrix, duration_bin = features.build_features(df, daily_means, keys)
+        scaled = features.scale(self.scaler, matrix)
+        return features.predict_clusters(self.model, features.clustering_matrix(scaled, duration_bin))
+
+    def _predict_sentiment(self, documents):
+        return self.classificatie_model.predict(self.nlp_model.transform(documents))
+
+    # Function to score a popularity request ({"rows": ..., "daily_means": ...} as sent by ScoringClient).
+    # The request is validated here, so one malformed request cannot fail the batch it would share.
+    def score_popularity(self, request):
+        row_counts = {len(request["rows"][column]) for column in ROW_COLUMNS}
+        date_counts = {len(request["daily_means"][column]) for column in ['date', 'mean_likes', 'mean_comments']}
+        if len(row_counts) != 1 or len(date_counts) != 1:
+            raise ValueError("Columns of a popularity request must have the same length")
+        return self.popularity.submit(request, row_counts.pop())
+
+    def score_sentiment(self, documents):
+        return self.sentiment.submit(list(documents))
+
+
+# Function to create the HTTP server around a ScoringService
+def make_server(service, host="127.0.0.1", port=8766):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            if self.path == "/health":
+                self._reply(200, {"status": "ok"})
+            else:
+                self._reply(404, {"error": "not found"})
+
+        def do_POST(self):
+            try:
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                if self.path == "/popularity":
+                    clusters = service.score_popularity(body)
+                    self._reply(200, {"clusters": [int(cluster) for cluster in clusters]})
+                elif self.path == "/sentiment":
+                    predictions = service.score_sentiment(body["documents"])
+                    self._reply(200, {"predictions": [int(prediction) for prediction in predictions]})
+                else:
+                    self._reply(404, {"error": "not found"})
+            except (KeyError, ValueError, TypeError) as e:
+                self._reply(400, {"error": str(e)})
+
+        def _reply(self, status, payload):
+            data = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    return ThreadingHTTPServer((host, port), Handler)
+
+
+# Client used by the pipeline scripts. Every method returns None when the service cannot be reached;
+# after the first connection failure the client stays disabled so the caller scores in-process.
+class ScoringClient:
+    def __init__(self, url, timeout=60):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.available = True
+
+    def _post(self, path, payload):
+        if not self.available:
+            return None
+        try:
+            response = self.session.post(f"{self.url}{path}", json=payload, timeout=self.timeout)
+            response.raise_for_status()
+            return response.json()
+        except requests.RequestException as e:
+            print(f"Scoring service at {self.url} not available, scoring in-process: {e}")
+            self.available = False
+            return None
+
+    # Function to get the KMeans clusters for a DataFrame with ROW_COLUMNS
+    def popularity_clusters(self, df, daily_means):
+        rows = df[ROW_COLUMNS].copy()
+        rows['timestamp'] = rows['timestamp'].astype(str)
+        result = self._post("/popularity", {"rows": rows.to_dict(orient="list"),
+                                            "daily_means": daily_means_to_json(daily_means)})
+        return None if result is None else np.array(result["clusters"])
+
+    # Function to get the sentiment predictions for cleaned transcripts
+    def sentiments(self, documents):
+        result = self._post("/sentiment", {"documents": list(documents)})
+        return None if result is None else np.array(result["predictions"])
+
+
+# Function to create a client when SCORING_SERVICE_URL is set, None otherwise
+def client_from_env():
+    url = os.getenv("SCORING_SERVICE_URL")
+    return ScoringClient(url) if url else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Warm scoring service for popularity and sentiment")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--max-batch", type=int, default=4096, help="Rows/documents per micro-batch")
+    parser.add_argument("--max-wait-ms", type=float, default=5, help="How long a batch waits for more requests")
+    args = parser.parse_args()
+
+    service = ScoringService(args.max_batch, args.max_wait_ms / 1000)
+    server = make_server(service, args.host, args.port)
+    print(f"Scoring service listening on http://{args.host}:{server.server_address[1]}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
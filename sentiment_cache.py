@@ -0,0 +1,60 @@
+import psycopg2.extras
+
+# Cache of sentiment results keyed by (content hash of the transcript, sentiment model version). The
+# content hash is the one transcript_store uses for the blobs; the model version is derived from the
+# checksums of nlp_model.pkl and classificatie_model.pkl (model_runtime.sentiment_model_version), so
+# after a model swap the old entries are simply not found and only transcripts without an entry for the
+# new version are classified again. Identical transcripts share one entry and are classified once.
+
+
+# Function to create the cache table
+def create_tables(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS Sentiment_Cache (
+            content_hash CHAR(64),
+            model_version VARCHAR(16),
+            sentiment VARCHAR(15) NOT NULL,
+            created_at TIMESTAMP NOT NULL DEFAULT now(),
+            PRIMARY KEY (content_hash, model_version)
+        );
+    """)
+
+
+# Function to look up cached sentiments; returns {content_hash: sentiment} for the hashes that are cached
+def lookup(cursor, model_version, content_hashes):
+    cursor.execute("""
+        SELECT content_hash, sentiment
+        FROM Sentiment_Cache
+        WHERE model_version = %s AND content_hash = ANY(%s);
+    """, (model_version, list(content_hashes)))
+    return dict(cursor.fetchall())
+
+
+# Function to store (content_hash, sentiment) results; the caller commits
+def store(cursor, model_version, results):
+    psycopg2.extras.execute_values(cursor, """
+        INSERT INTO Sentiment_Cache (content_hash, model_version, sentiment)
+        VALUES %s
+        ON CONFLICT (content_hash, model_version) DO NOTHING;
+    """, [(content_hash, model_version, sentiment) for content_hash, sentiment in results], page_size=1000)
+
+
+# Cache hits and misses of one run. A transcript counts as a hit when its sentiment came from the cache or
+# from an identical transcript classified earlier in the same batch.
+class CacheStats:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.hits = 0
+        self.misses = 0
+
+    def record(self, hits, misses):
+        self.hits += hits
+        self.misses += misses
+
+    def report(self, model_version):
+        total = self.hits + self.misses
+        hit_rate = self.hits / total if total else 0.0
+        print(f"Sentiment cache (model {model_version}): {self.hits} hits, {self.misses} classified, "
+              f"hit rate {hit_rate:.1%}.")
@@ -0,0 +1,65 @@
+import os
+import sys
+import threading
+
+import psycopg2
+import pytest
+
+# The pipeline modules live in the repository root; run the tests from there (python -m pytest)
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPOSITORY)
+os.chdir(REPOSITORY)
+
+# schrif_video_weg refuses to import without its SSH and API settings; the tests never use them
+for name, value in {"SSH_HOST": "localhost", "SSH_USERNAME": "test", "SSH_PASSWORD": "test",
+                    "REMOTE_DIRECTORY": "/tmp", "YOUTUBE_API_KEY": "test"}.items():
+    os.environ.setdefault(name, value)
+
+
+# Stub YouTube API (benchmarks/stub_youtube_api) on a free port, with schrif_video_weg pointed at it;
+# yields the handler class (request_count, revision)
+@pytest.fixture
+def stub_api(monkeypatch):
+    import schrif_video_weg
+    from benchmarks.stub_youtube_api import make_server
+
+    server = make_server(port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(schrif_video_weg, "youtube_api_url", f"http://127.0.0.1:{server.server_address[1]}")
+    monkeypatch.setattr(schrif_video_weg, "fetch_rate_limit", 0)
+    yield server.RequestHandlerClass
+    server.shutdown()
+    server.server_close()
+
+
+# Log messages of schrif_video_weg as (level, message), instead of the Log table
+@pytest.fixture
+def logged(monkeypatch):
+    import schrif_video_weg
+
+    messages = []
+    monkeypatch.setattr(schrif_video_weg, "log_message",
+                        lambda service_name, log_level, message: messages.append((log_level, message)))
+    return messages
+
+
+# Pooled connection (database.connect) whose search_path points at an empty scratch schema, dropped again
+# afterwards; the tests using it are skipped when no database is configured or reachable
+@pytest.fixture
+def pg_schema():
+    import database
+
+    try:
+        connection = database.connect()
+    except (ValueError, psycopg2.OperationalError) as e:
+        pytest.skip(f"No database: {e}")
+
+    with database.transaction(connection) as cursor:
+        cursor.execute("DROP SCHEMA IF EXISTS pytest_scratch CASCADE; CREATE SCHEMA pytest_scratch;")
+        cursor.execute("SET search_path TO pytest_scratch;")
+    yield connection
+
+    connection.rollback()
+    with database.transaction(connection) as cursor:
+        cursor.execute("DROP SCHEMA IF EXISTS pytest_scratch CASCADE; RESET search_path;")
+    database.release(connection)
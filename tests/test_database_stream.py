@@ -0,0 +1,26 @@
+import psycopg2
+import pytest
+
+import database
+
+
+def test_stream_survives_a_rolled_back_chunk(pg_schema):
+    cursor = pg_schema.cursor()
+    rows = 0
+    with database.stream(pg_schema, "test_stream", "SELECT generate_series(1, 25);", chunk_size=10) as chunks:
+        for chunk in chunks:
+            with pytest.raises(psycopg2.errors.DivisionByZero):
+                cursor.execute("SELECT 1 / 0;")
+            pg_schema.rollback()
+            rows += len(chunk)
+    assert rows == 25
+
+
+def test_stream_closes_the_cursor_when_the_block_raises(pg_schema):
+    with pytest.raises(psycopg2.errors.DivisionByZero):
+        with database.stream(pg_schema, "test_stream", "SELECT generate_series(1, 25);", chunk_size=10) as chunks:
+            next(chunks)
+            pg_schema.cursor().execute("SELECT 1 / 0;")
+    cursor = pg_schema.cursor()
+    cursor.execute("SELECT COUNT(*) FROM pg_cursors WHERE name = 'test_stream';")
+    assert cursor.fetchone()[0] == 0
@@ -0,0 +1,65 @@
+import re
+
+import pytest
+
+import database
+import schrif_video_weg
+from benchmarks.stub_youtube_api import fake_video_item
+
+
+# Scratch schema (Dim_Date and the ingest tables) set up as the ingest connection of schrif_video_weg
+@pytest.fixture
+def ingest_database(pg_schema, monkeypatch):
+    with database.transaction(pg_schema) as cursor:
+        cursor.execute("""
+            CREATE TABLE Dim_Date (date_id SERIAL PRIMARY KEY, year INT, month INT, day INT);
+            INSERT INTO Dim_Date (year, month, day)
+            SELECT EXTRACT(year FROM d), EXTRACT(month FROM d), EXTRACT(day FROM d)
+            FROM generate_series('2005-01-01'::date, '2035-12-31'::date, '1 day') d;
+        """)
+    for name in ("connectie", "cur", "dimensions"):
+        monkeypatch.setattr(schrif_video_weg, name, None)
+    schrif_video_weg.setup(pg_schema)
+    schrif_video_weg.create_tables()
+    pg_schema.commit()
+    return pg_schema
+
+
+# Function to get the transaction ID that last wrote each Dim_Video row and its title
+def video_rows(connection):
+    with database.transaction(connection) as cursor:
+        cursor.execute("SELECT video_id, xmin::text, title FROM Dim_Video;")
+        return {video_id: (xmin, title) for video_id, xmin, title in cursor.fetchall()}
+
+
+# Function to get (changed, fetched) from the "... of ... video details changed" log messages
+def details_changed(logged):
+    counts = [re.search(r"(\d+) of (\d+) video details changed", message) for level, message in logged]
+    return [tuple(map(int, match.groups())) for match in counts if match]
+
+
+def test_upsert_rewrites_only_videos_with_a_changed_etag(ingest_database, stub_api, logged):
+    video_ids = [f"video{index}" for index in range(40)]
+    parts = "snippet,contentDetails"
+    edited = {video_id for video_id in video_ids
+              if fake_video_item(video_id, parts.split(","), 1)["etag"] != fake_video_item(video_id, parts.split(","), 0)["etag"]}
+    assert 0 < len(edited) < len(video_ids)
+
+    schrif_video_weg.extract_metadata_from_videos(video_ids, parts)
+    assert details_changed(logged) == [(40, 40)]
+    first = video_rows(ingest_database)
+
+    # Same revision: every etag matches, so no Dim_Video row is rewritten
+    logged.clear()
+    schrif_video_weg.extract_metadata_from_videos(video_ids, parts)
+    assert details_changed(logged) == [(0, 40)]
+    assert video_rows(ingest_database) == first
+
+    # New revision: only the edited videos come back from RETURNING and get a new row version
+    logged.clear()
+    stub_api.revision = 1
+    schrif_video_weg.extract_metadata_from_videos(video_ids, parts)
+    assert details_changed(logged) == [(len(edited), 40)]
+    second = video_rows(ingest_database)
+    assert {video_id for video_id in video_ids if second[video_id][0] != first[video_id][0]} == edited
+    assert all(second[video_id][1].endswith("(edit 1)") for video_id in edited)
@@ -0,0 +1,66 @@
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+from joblib import load
+
+import features
+from benchmarks.bench_features import (legacy_convert_duration_to_seconds, legacy_predict, synthetic_rows,
+                                       vectorized_predict)
+
+warnings.filterwarnings('ignore', category=UserWarning)
+
+DURATIONS = ["PT1H2M3S", "PT15M", "PT4M59S", "PT5M", "PT14M59S", "PT45S", "PT2H", "PT1H5S",
+             "P1DT2H", "PT", "", "garbage", "PT0S"]
+
+
+def test_duration_to_seconds_matches_the_legacy_regex():
+    expected = [legacy_convert_duration_to_seconds(duration) for duration in DURATIONS]
+    assert features.duration_to_seconds(DURATIONS).tolist() == expected
+    assert expected[DURATIONS.index("P1DT2H")] == 0
+    assert expected[DURATIONS.index("PT")] == 0
+    assert expected[DURATIONS.index("")] == 0
+
+
+def test_missing_durations_become_zero():
+    assert features.duration_to_seconds([None, "PT1M", None, np.nan]).tolist() == [0, 60, 0, 0]
+
+
+def test_duration_bins_match_the_legacy_cut():
+    seconds = np.array([0, 1, 299, 300, 301, 899, 900, 901, 36000])
+    legacy = pd.cut(seconds, bins=[0, 300, 900, float('inf')], labels=[1, 2, 3], right=False)
+    assert features.duration_bins(seconds).tolist() == legacy.astype(int).tolist()
+
+
+def test_category_popularity_defaults_for_unknown_categories():
+    category_ids = [22, 27, 44, 99, 0, -1, 10_000]
+    expected = pd.Series(category_ids).map(features.category_popularity).fillna(5).tolist()
+    assert features.category_popularity_for(category_ids).tolist() == expected
+
+
+def test_build_features_imputes_zero_counts_with_the_daily_means():
+    df = pd.DataFrame({
+        'view_count': [1000, 1000, 2000],
+        'like_count': [0, 40, 80],
+        'comment_count': [10, 0, 30],
+        'duration': ["PT3M", "PT10M", "PT1H"],
+        'category_id': [22, 27, 99],
+        'timestamp': pd.to_datetime(["2026-10-01 08:00", "2026-10-01 20:00", "2026-10-02 12:00"]),
+    })
+    matrix, duration_bin = features.build_features(df, features.daily_means_for(df))
+    # 2026-10-01: mean likes (0 + 40) / 2 = 20, mean comments (10 + 0) / 2 = 5
+    assert matrix[:, 0].tolist() == pytest.approx([0.02, 0.04, 0.04])
+    assert matrix[:, 1].tolist() == pytest.approx([0.01, 0.005, 0.015])
+    assert matrix[:, 2].tolist() == pytest.approx([0.03, 0.045, 0.055])
+    assert matrix[:, 3].tolist() == [1, 6, 5]
+    assert duration_bin.tolist() == [1, 2, 3]
+
+
+def test_vectorized_predictions_match_the_legacy_pandas_path():
+    scaler, model = load('teddyxscaler.joblib'), load('kmeans_model_for_ted_videos.joblib')
+    df = synthetic_rows(5000)
+    df.loc[::97, 'duration'] = "P1DT2H"
+    df.loc[1::97, 'duration'] = "PT"
+    df.loc[2::97, 'duration'] = ""
+    assert np.array_equal(np.asarray(legacy_predict(df, scaler, model)), vectorized_predict(df, scaler, model))
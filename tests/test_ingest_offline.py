@@ -0,0 +1,41 @@
+import schrif_video_weg
+
+
+def test_chunk_video_ids_fits_one_call():
+    video_ids = [f"video{index}" for index in range(120)]
+    chunks = list(schrif_video_weg.chunk_video_ids(video_ids))
+    assert [len(chunk) for chunk in chunks] == [50, 50, 20]
+    assert [video_id for chunk in chunks for video_id in chunk] == video_ids
+
+
+def test_extract_fetches_50_ids_per_call_and_logs_missing_in_bulk(stub_api, logged, monkeypatch):
+    written_items = []
+
+    def upsert(items, run_id=None, stage=None):
+        written_items.extend(items)
+        return {item["id"] for item in items}
+
+    monkeypatch.setattr(schrif_video_weg, "upsert_video_metadata_batch", upsert)
+    video_ids = [f"video{index}" for index in range(45)] + [f"missing{index}" for index in range(3)]
+
+    written = schrif_video_weg.extract_metadata_from_videos(video_ids, parts="snippet,contentDetails")
+
+    # 48 IDs fit in one videos.list call; the stub would answer more than 50 with a 400
+    assert stub_api.request_count == 1
+    assert written == {f"video{index}" for index in range(45)}
+    assert all(set(item) >= {"snippet", "contentDetails"} for item in written_items)
+    missing_messages = [message for level, message in logged if message.startswith("No metadata found")]
+    assert missing_messages == ["No metadata found for 3 video IDs: missing0, missing1, missing2"]
+    assert ("ERROR", missing_messages[0]) in logged
+
+
+def test_extract_splits_large_batches(stub_api, logged, monkeypatch):
+    monkeypatch.setattr(schrif_video_weg, "upsert_video_metadata_batch",
+                        lambda items, run_id=None, stage=None: {item["id"] for item in items})
+    video_ids = [f"video{index}" for index in range(120)]
+
+    written = schrif_video_weg.extract_metadata_from_videos(video_ids)
+
+    assert stub_api.request_count == 3
+    assert written == set(video_ids)
+    assert not [message for level, message in logged if level == "ERROR"]
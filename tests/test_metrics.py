@@ -0,0 +1,48 @@
+import pytest
+
+import metrics
+from metrics import BUCKETS, Histogram
+
+
+# Function to build a histogram from observations
+def histogram_of(values):
+    histogram = Histogram()
+    for value in values:
+        histogram.observe(value)
+    return histogram
+
+
+def test_empty_histogram_has_no_quantiles():
+    assert Histogram().quantile(0.5) is None
+
+
+def test_quantile_is_interpolated_within_the_bucket():
+    # A value equal to a bucket bound falls into that bucket: (BUCKETS[9], BUCKETS[10]]
+    histogram = histogram_of([BUCKETS[10]] * 100)
+    assert histogram.quantile(0.5) == pytest.approx(BUCKETS[9] + (BUCKETS[10] - BUCKETS[9]) * 0.5)
+    assert histogram.quantile(0.25) == pytest.approx(BUCKETS[9] + (BUCKETS[10] - BUCKETS[9]) * 0.25)
+    assert histogram.quantile(1.0) == pytest.approx(BUCKETS[10])
+
+
+def test_quantile_never_exceeds_the_largest_observation():
+    histogram = histogram_of([0.0031])
+    assert all(histogram.quantile(q) <= 0.0031 for q in metrics.QUANTILES)
+
+
+def test_quantiles_pick_the_bucket_of_their_rank():
+    histogram = histogram_of([0.001] * 90 + [1.0] * 10)
+    assert histogram.quantile(0.5) <= 0.001
+    lower = BUCKETS[BUCKETS.index(next(bound for bound in BUCKETS if bound >= 1.0)) - 1]
+    assert lower < histogram.quantile(0.95) <= histogram.quantile(0.99) <= 1.0
+
+
+def test_values_beyond_the_last_bucket_interpolate_up_to_the_maximum():
+    histogram = histogram_of([BUCKETS[-1] * 4] * 10)
+    assert histogram.buckets[-1] == 10
+    assert BUCKETS[-1] < histogram.quantile(0.5) < BUCKETS[-1] * 4
+    assert histogram.quantile(1.0) == pytest.approx(BUCKETS[-1] * 4)
+
+
+def test_count_sum_and_max_are_tracked():
+    histogram = histogram_of([0.5, 0.25, 2.0])
+    assert (histogram.count, histogram.sum, histogram.max) == (3, 2.75, 2.0)
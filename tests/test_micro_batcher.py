@@ -0,0 +1,75 @@
+import threading
+import time
+
+import pytest
+
+from scoring_service import MicroBatcher
+
+
+# Function to submit every input list from its own thread; returns the results in the same order
+def submit_concurrently(batcher, inputs):
+    results = [None] * len(inputs)
+
+    def submit(index):
+        try:
+            results[index] = batcher.submit(inputs[index])
+        except Exception as e:
+            results[index] = e
+
+    threads = [threading.Thread(target=submit, args=(index,)) for index in range(len(inputs))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=10)
+    return results
+
+
+# Function to flatten the parts of a batch into one list, like the sentiment batcher does
+def concat(parts):
+    return [item for part in parts for item in part]
+
+
+def test_concurrent_requests_share_one_predict_call_and_get_their_own_slice():
+    calls = []
+
+    def predict(items):
+        calls.append(list(items))
+        return [item * 10 for item in items]
+
+    batcher = MicroBatcher(predict, concat, max_batch=100, max_wait=0.5)
+    inputs = [[1, 2], [3], [4, 5, 6], [7]]
+    assert submit_concurrently(batcher, inputs) == [[10, 20], [30], [40, 50, 60], [70]]
+    assert len(calls) == 1 and sorted(calls[0]) == [1, 2, 3, 4, 5, 6, 7]
+    assert batcher.batches == 1
+
+
+def test_a_full_batch_is_predicted_without_waiting_for_max_wait():
+    batcher = MicroBatcher(lambda items: list(items), concat, max_batch=3, max_wait=5)
+    start = time.monotonic()
+    assert batcher.submit([1, 2, 3]) == [1, 2, 3]
+    assert time.monotonic() - start < 2
+
+
+def test_requests_beyond_max_batch_go_to_the_next_batch():
+    calls = []
+
+    def predict(items):
+        calls.append(len(items))
+        return list(items)
+
+    batcher = MicroBatcher(predict, concat, max_batch=4, max_wait=0.5)
+    inputs = [[index, index] for index in range(5)]
+    assert submit_concurrently(batcher, inputs) == inputs
+    # Each batch closes as soon as it holds 4 items (two requests of 2)
+    assert calls == [4, 4, 2]
+
+
+def test_a_failed_predict_raises_in_every_request_of_the_batch():
+    def predict(items):
+        raise ValueError("model failed")
+
+    batcher = MicroBatcher(predict, concat, max_batch=100, max_wait=0.5)
+    results = submit_concurrently(batcher, [[1], [2]])
+    assert all(isinstance(result, ValueError) for result in results)
+    with pytest.raises(ValueError):
+        batcher.submit([3])
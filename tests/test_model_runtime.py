@@ -0,0 +1,66 @@
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+from joblib import load
+
+import features
+import model_runtime
+
+warnings.filterwarnings('ignore', category=UserWarning)
+
+
+@pytest.fixture(scope="module")
+def sklearn_models():
+    return (load('teddyxscaler.joblib'), load('kmeans_model_for_ted_videos.joblib'),
+            load('nlp_model.pkl'), load('classificatie_model.pkl'))
+
+
+@pytest.fixture(scope="module")
+def artifact():
+    artifact = model_runtime.load_artifact()
+    if artifact is None:
+        pytest.skip("No up-to-date model artifact; run python model_runtime.py export")
+    return artifact
+
+
+def test_parity_on_finite_and_non_finite_samples(artifact, sklearn_models):
+    model_runtime.check_parity(artifact, *sklearn_models, samples=5000)
+
+
+def test_kmeans_runtime_raises_on_non_finite_input_like_sklearn(artifact, sklearn_models):
+    _, run_model = model_runtime.popularity_models(artifact)
+    model = sklearn_models[1]
+    for value in [np.inf, -np.inf, np.nan]:
+        X = np.array([[value, 0.1, 0.2, 1.0, 0.3]], dtype=model.cluster_centers_.dtype)
+        with pytest.raises(ValueError):
+            model.predict(X)
+        with pytest.raises(ValueError):
+            run_model.predict(X)
+
+
+def test_rows_without_views_are_left_unrated_by_both_runtimes(artifact, sklearn_models):
+    scaler, model = sklearn_models[:2]
+    run_scaler, run_model = model_runtime.popularity_models(artifact)
+    df = pd.DataFrame({
+        'view_count': [1000, 0, 50000, 0],
+        'like_count': [40, 5, 0, 0],
+        'comment_count': [3, 1, 10, 0],
+        'duration': ['PT12M3S', 'PT3M', 'PT1H2M', None],
+        'category_id': [28, 22, 27, 99],
+        'timestamp': pd.to_datetime(['2024-05-01 10:00'] * 4),
+    })
+    daily_means = features.daily_means_for(df)
+    matrix, duration_bin = features.build_features(df, daily_means)
+
+    results = []
+    for run_scaler_or_scaler, run_model_or_model in [(scaler, model), (run_scaler, run_model)]:
+        scaled = features.scale(run_scaler_or_scaler, matrix)
+        results.append(features.predict_clusters(run_model_or_model,
+                                                 features.clustering_matrix(scaled, duration_bin)))
+
+    expected, actual = results
+    assert (expected == actual).all()
+    assert list(expected[[1, 3]]) == [features.UNRATED_CLUSTER] * 2
+    assert set(expected[[0, 2]]) <= {0, 1}
@@ -0,0 +1,48 @@
+import pytest
+import requests
+from youtube_transcript_api import (AgeRestricted, FailedToCreateConsentCookie, InvalidVideoId, IpBlocked,
+                                    NoTranscriptFound, NotTranslatable, PoTokenRequired, RequestBlocked,
+                                    TranscriptsDisabled, VideoUnavailable, VideoUnplayable, YouTubeDataUnparsable,
+                                    YouTubeRequestFailed)
+
+import transcript
+
+VIDEO_ID = "abcdefghijk"
+
+
+@pytest.mark.parametrize("error", [
+    TranscriptsDisabled(VIDEO_ID),
+    NoTranscriptFound(VIDEO_ID, ["en"], None),
+    VideoUnavailable(VIDEO_ID),
+    AgeRestricted(VIDEO_ID),
+    VideoUnplayable(VIDEO_ID, "Members only", []),
+    InvalidVideoId(VIDEO_ID),
+    PoTokenRequired(VIDEO_ID),
+    NotTranslatable(VIDEO_ID),
+    LookupError(f"No transcript for video {VIDEO_ID}"),
+], ids=lambda error: type(error).__name__)
+def test_permanent_errors_mean_no_transcript(error):
+    assert transcript.is_unavailable(error)
+    assert not transcript.is_transient(error)
+
+
+@pytest.mark.parametrize("error", [
+    YouTubeRequestFailed(VIDEO_ID, requests.HTTPError("503 Server Error")),
+    requests.ConnectionError("Connection reset"),
+    requests.Timeout("Read timed out"),
+], ids=lambda error: type(error).__name__)
+def test_transient_errors_are_retried(error):
+    assert transcript.is_transient(error)
+    assert not transcript.is_unavailable(error)
+
+
+@pytest.mark.parametrize("error", [
+    RequestBlocked(VIDEO_ID),
+    IpBlocked(VIDEO_ID),
+    FailedToCreateConsentCookie(VIDEO_ID),
+    YouTubeDataUnparsable(VIDEO_ID),
+    ValueError("Unexpected"),
+], ids=lambda error: type(error).__name__)
+def test_other_errors_fail_the_fetch(error):
+    assert not transcript.is_unavailable(error)
+    assert not transcript.is_transient(error)
@@ -0,0 +1,44 @@
+import pytest
+
+import database
+import transcript_store
+
+
+# Scratch schema holding a Dim_Transcript from before the compressed storage
+@pytest.fixture
+def connection(pg_schema):
+    with database.transaction(pg_schema) as cursor:
+        cursor.execute("""
+            CREATE TABLE Dim_Transcript (video_id VARCHAR(15) PRIMARY KEY, transcript_text TEXT NOT NULL,
+                                         language VARCHAR(10), version VARCHAR(20));
+        """)
+    return pg_schema
+
+
+# Function to get the tables this transaction holds an ACCESS EXCLUSIVE lock on
+def exclusive_locks(cursor):
+    cursor.execute("""
+        SELECT c.relname FROM pg_locks l JOIN pg_class c ON c.oid = l.relation
+        WHERE l.pid = pg_backend_pid() AND l.mode = 'AccessExclusiveLock' AND c.relname IN ('dim_transcript', 'transcript_blob');
+    """)
+    return {row[0] for row in cursor.fetchall()}
+
+
+def test_create_tables_migrates_once_and_then_takes_no_exclusive_locks(connection):
+    with database.transaction(connection) as cursor:
+        transcript_store.create_tables(cursor)
+        assert exclusive_locks(cursor) == {"dim_transcript", "transcript_blob"}
+
+    with database.transaction(connection) as cursor:
+        transcript_store.create_tables(cursor)
+        assert exclusive_locks(cursor) == set()
+        assert transcript_store.insert(cursor, "video1", "Some transcript", "en", "1")
+        assert not transcript_store.insert(cursor, "video1", "Another transcript", "en", "1")
+        cursor.execute("""
+            SELECT a.attrelid::regclass::text, a.attname, a.attstorage, a.attnotnull FROM pg_attribute a
+            WHERE (a.attrelid = 'dim_transcript'::regclass AND a.attname IN ('content_hash', 'transcript_text'))
+               OR (a.attrelid = 'transcript_blob'::regclass AND a.attname = 'data');
+        """)
+        assert sorted(cursor.fetchall()) == [("dim_transcript", "content_hash", "x", False),
+                                             ("dim_transcript", "transcript_text", "x", False),
+                                             ("transcript_blob", "data", "e", True)]
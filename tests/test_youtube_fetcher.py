@@ -0,0 +1,129 @@
+import time
+
+import pytest
+import requests
+
+import youtube_fetcher
+
+
+# Stand-in for the time module: monotonic() only moves when sleep() is called
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class FakeResponse:
+    def __init__(self, status_code):
+        self.status_code = status_code
+        self.content = b"{}"
+
+
+# Session that answers with the given status codes in turn (or raises them when they are exceptions)
+class FakeSession:
+    def __init__(self, answers):
+        self.answers = list(answers)
+        self.calls = 0
+
+    def get(self, url, params=None, timeout=None):
+        self.calls += 1
+        answer = self.answers.pop(0)
+        if isinstance(answer, Exception):
+            raise answer
+        return FakeResponse(answer)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(youtube_fetcher, "time", clock)
+    return clock
+
+
+@pytest.mark.parametrize("status_code", [429, 403, 500, 503])
+def test_get_with_retry_retries_rate_limits_and_server_errors(clock, status_code):
+    session = FakeSession([status_code, status_code, 200])
+    response = youtube_fetcher.get_with_retry(session, "http://stub/videos", {}, max_retries=4, backoff=0.5)
+    assert response.status_code == 200
+    assert session.calls == 3
+    # Full jitter: each wait is at most the exponential backoff ceiling of its attempt
+    assert len(clock.sleeps) == 2
+    assert all(0 <= seconds <= 0.5 * 2 ** attempt for attempt, seconds in enumerate(clock.sleeps))
+
+
+def test_get_with_retry_returns_the_last_response_after_the_last_retry(clock):
+    session = FakeSession([503] * 4)
+    response = youtube_fetcher.get_with_retry(session, "http://stub/videos", {}, max_retries=3)
+    assert response.status_code == 503
+    assert session.calls == 4
+
+
+def test_get_with_retry_does_not_retry_other_errors(clock):
+    session = FakeSession([400])
+    assert youtube_fetcher.get_with_retry(session, "http://stub/videos", {}).status_code == 400
+    assert session.calls == 1
+    assert clock.sleeps == []
+
+
+def test_get_with_retry_raises_connection_errors_after_the_last_retry(clock):
+    session = FakeSession([requests.ConnectionError("reset")] * 3)
+    with pytest.raises(requests.ConnectionError):
+        youtube_fetcher.get_with_retry(session, "http://stub/videos", {}, max_retries=2)
+    assert session.calls == 3
+
+
+def test_call_with_retry_only_retries_transient_errors(clock):
+    attempts = []
+
+    def flaky(video_id):
+        attempts.append(video_id)
+        if len(attempts) < 3:
+            raise TimeoutError("slow")
+        return "text"
+
+    assert youtube_fetcher.call_with_retry(flaky, ("video1",), lambda e: isinstance(e, TimeoutError)) == "text"
+    assert len(attempts) == 3
+
+    def broken(video_id):
+        attempts.append(video_id)
+        raise ValueError("bad")
+
+    attempts.clear()
+    with pytest.raises(ValueError):
+        youtube_fetcher.call_with_retry(broken, ("video2",), lambda e: isinstance(e, TimeoutError))
+    assert attempts == ["video2"]
+
+
+def test_token_bucket_paces_requests_to_the_rate():
+    bucket = youtube_fetcher.TokenBucket(rate=50, capacity=2)
+    start = time.monotonic()
+    for _ in range(12):
+        bucket.acquire()
+    # The first two tokens are the burst; the other ten arrive one every 0.02 seconds
+    assert 0.19 <= time.monotonic() - start < 1.0
+
+
+def test_fetch_concurrently_returns_every_batch_with_its_result_or_error():
+    def fetch_batch(batch):
+        if batch == "bad":
+            raise ValueError(batch)
+        return batch.upper()
+
+    results = list(youtube_fetcher.fetch_concurrently(["a", "bad", "c", "d"], fetch_batch, workers=3, queue_size=1))
+    assert sorted((batch, result) for batch, result, _ in results) == [("a", "A"), ("bad", None), ("c", "C"), ("d", "D")]
+    assert [type(error) for batch, _, error in results if batch == "bad"] == [ValueError]
+
+
+def test_fetch_concurrently_stops_when_the_caller_stops_early():
+    batches = [str(index) for index in range(100)]
+    results = youtube_fetcher.fetch_concurrently(batches, lambda batch: batch, workers=4, queue_size=2)
+    first = next(results)
+    results.close()
+    assert first[0] in batches
@@ -1,25 +1,39 @@
+import argparse
 import os
-import psycopg2
-import paramiko
-from youtube_transcript_api import YouTubeTranscriptApi
+import psycopg2.extras
+import requests
+from youtube_transcript_api import (YouTubeTranscriptApi, CouldNotRetrieveTranscript, YouTubeRequestFailed,
+                                    RequestBlocked, FailedToCreateConsentCookie, YouTubeDataUnparsable)
 from youtube_transcript_api.formatters import TextFormatter
-import joblib  # For loading the models
 import re  # For cleaning the text
 import logging
 from dotenv import load_dotenv
+import database
+import discovery
+import metrics
+import model_runtime
+import run_ledger
+import scoring_service
+import sentiment_cache
+import transcript_store
+import youtube_fetcher
 
 # Load environment variables
 load_dotenv()
 
-# Database connection details
-connectie = psycopg2.connect(
-    database=os.getenv("DB_NAME"),
-    user=os.getenv("DB_USER"),
-    host=os.getenv("DB_HOST"),
-    password=os.getenv("DB_PASSWORD"),
-    port=os.getenv("DB_PORT")
-)
-cur = connectie.cursor()
+# Database connection and models, set by setup() from main() or the pipeline orchestrator
+connectie = None
+cur = None
+nlp_model = None
+classificatie_model = None
+
+# Version of the sentiment models (from their checksums), the key of the sentiment cache next to the
+# transcript content hash; set by setup()
+sentiment_model_version = None
+cache_stats = sentiment_cache.CacheStats()
+
+# Client for the warm scoring service (None when SCORING_SERVICE_URL is not set)
+scoring_client = scoring_service.client_from_env()
 
 # SSH connection details
 ssh_host = os.getenv("SSH_HOST")
@@ -30,30 +44,61 @@ remote_directory = os.getenv("REMOTE_DIRECTORY")
 if not all([ssh_host, ssh_username, ssh_password, remote_directory]):
     raise ValueError("Missing one or more environment variables for SSH connection.")
 
-# Load the NLP and classification models
-nlp_model = joblib.load('nlp_model.pkl')  # Bag of Words model
-classificatie_model = joblib.load('classificatie_model.pkl')  # Naive Bayes model
+# Transcript fetching: number of fetch threads, requests per second to the transcript host (shared by all
+# threads), retries on transient failures, and how many fetched transcripts may wait for the database
+transcript_workers = int(os.getenv("TRANSCRIPT_WORKERS", "8"))
+transcript_rate_limit = float(os.getenv("TRANSCRIPT_RATE_LIMIT", "10"))
+transcript_max_retries = int(os.getenv("TRANSCRIPT_MAX_RETRIES", "3"))
+transcript_queue_size = int(os.getenv("TRANSCRIPT_QUEUE_SIZE", "16"))
 
-# Function to check if a video transcript already exists in the database
-def transcript_exists(video_id):
-    cur.execute("SELECT COUNT(*) FROM Dim_Transcript WHERE video_id = %s;", (video_id,))
-    result = cur.fetchone()
-    return result[0] > 0  # Returns True if transcript exists, False otherwise
+# Transcripts classified and written back together, during the daily run and per backfill chunk
+sentiment_batch_size = int(os.getenv("SENTIMENT_BATCH_SIZE", "64"))
+sentiment_backfill_chunk_size = int(os.getenv("SENTIMENT_BACKFILL_CHUNK_SIZE", "1000"))
 
-# Function to insert transcripts into the database
-def insert_transcript(video_id, transcript_text, language, version):
-    if transcript_exists(video_id):
-        print(f"Transcript for video {video_id} already exists in the database. Skipping...")
-        return  # Skip if the transcript already exists
+# Transcript service serving plain-text transcripts at <url>/transcripts/<video_id>, used instead of
+# YouTube when set (the benchmarks point it at the local stub)
+transcript_service_url = os.getenv("TRANSCRIPT_SERVICE_URL")
+
+# Function to get a database connection from the shared pool (give it back with database.release)
+def connect_database():
+    return database.connect()
+
+# Function to load the NLP and classification models (NumPy runtime when the exported artifact is up to date)
+def load_models():
+    return model_runtime.load_sentiment_models()
+
+# Function to set the database connection and models used by the functions below
+def setup(connection, models):
+    global connectie, cur, nlp_model, classificatie_model, sentiment_model_version
+    connectie = connection
+    cur = connection.cursor()
+    nlp_model, classificatie_model = models
+    sentiment_model_version = model_runtime.sentiment_model_version()
 
+# Function to create the compressed transcript storage (blob table and content_hash column) and the
+# sentiment cache if needed
+def create_transcript_tables():
+    transcript_store.create_tables(cur)
+    sentiment_cache.create_tables(cur)
+    connectie.commit()
+
+# Function to insert transcripts into the database. The caller commits, so the transcripts of a whole batch
+# share one commit; a savepoint keeps a failed insert from undoing the others. Only videos that
+# plan_transcripts found without a transcript are fetched; a transcript stored in the meantime (a concurrent
+# run) is kept.
+@metrics.timed("db_insert_transcript")
+def insert_transcript(video_id, transcript_text, language, version):
+    cur.execute("SAVEPOINT insert_transcript;")
     try:
-        cur.execute("""
-            INSERT INTO Dim_Transcript (video_id, transcript_text, language, version)
-            VALUES (%s, %s, %s, %s);
-        """, (video_id, transcript_text, language, version))
-        connectie.commit()
-        print(f"Transcript for video {video_id} successfully inserted into the database.")
+        # Stored compressed; a transcript with the same content reuses the existing blob
+        inserted = transcript_store.insert(cur, video_id, transcript_text, language, version)
+        cur.execute("RELEASE SAVEPOINT insert_transcript;")
+        if inserted:
+            print(f"Transcript for video {video_id} successfully inserted into the database.")
+        else:
+            print(f"Transcript for video {video_id} already exists in the database. Skipping...")
     except Exception as e:
+        cur.execute("ROLLBACK TO SAVEPOINT insert_transcript;")
         print(f"Error inserting transcript for video {video_id}: {e}")
 
 # Function to clean and prepare the transcript text
@@ -65,97 +110,312 @@ def clean_transcript(text):
     text = re.sub(r'[^a-z\s]', '', text)  # Keep only lowercase letters and spaces
 
     # Remove extra spaces
-    text = re.sub(r'\s+', ' ', text).strip()
+    text = " ".join(text.split())
 
     return text
 
-# Function to clean up and classify transcripts, and update sentiment in Dim_Video
-# Function to check if sentiment is already filled in Dim_Video
-def sentiment_exists(video_id):
-    cur.execute("SELECT sentiment FROM Dim_Video WHERE video_id = %s;", (video_id,))
-    result = cur.fetchone()
-    return result and result[0] is not None  # Returns True if sentiment is not NULL
-
-# Function to clean up and classify transcripts, and update sentiment in Dim_Video
-def process_transcript(video_id, transcript_text):
-    try:
-        # Check if the sentiment is already filled in Dim_Video
-        if sentiment_exists(video_id):
-            print(f"Sentiment for video {video_id} already exists. Skipping sentiment update...")
-            return
+# Function to classify a batch of transcripts: clean them, vectorize them into one sparse matrix and
+# predict them in one call. Returns the labels ('positief' or 'negatief') in the same order.
+@metrics.timed("sentiment_classify")
+def classify_transcripts(transcript_texts):
+    cleaned_transcripts = [clean_transcript(text) for text in transcript_texts]
 
-        # Clean the transcript text
-        cleaned_transcript = clean_transcript(transcript_text)
-
-        # Use the NLP model to transform the text into numerical features
-        X_transformed = nlp_model.transform([cleaned_transcript])  # Wrap in a list
+    # Predict the sentiment with the scoring service when it is configured and reachable
+    sentiment_predictions = scoring_client.sentiments(cleaned_transcripts) if scoring_client else None
+    if sentiment_predictions is None:
+        # Use the NLP model to transform the texts into numerical features
+        X_transformed = nlp_model.transform(cleaned_transcripts)
 
         # Predict the sentiment using the classification model
-        sentiment_prediction = classificatie_model.predict(X_transformed)
+        sentiment_predictions = classificatie_model.predict(X_transformed)
+
+    return ['positief' if prediction == 1 else 'negatief' for prediction in sentiment_predictions]
 
-        # Convert the prediction to a label ('positief' or 'negatief')
-        sentiment = 'positief' if sentiment_prediction[0] == 1 else 'negatief'
+# Function to classify a batch of (video_id, transcript_text) and write the sentiments with one
+# UPDATE ... FROM (VALUES ...) and one commit. Sentiments cached for the current model version are reused
+# and identical transcripts are classified once; new results are added to the cache in the same commit.
+# Only NULL sentiments are filled in, unless overwrite is set (backfill). With a run_id the batch is recorded
+# in the run ledger in the same commit. Returns the number of videos whose sentiment was written.
+@metrics.timed("sentiment_batch")
+def process_transcripts(batch, overwrite=False, run_id=None):
+    if not batch:
+        return 0
+    try:
+        content_hashes = [transcript_store.content_hash(transcript_text) for _, transcript_text in batch]
+        sentiment_by_hash = sentiment_cache.lookup(cur, sentiment_model_version, set(content_hashes))
+        missing = {}
+        for content_hash, (_, transcript_text) in zip(content_hashes, batch):
+            if content_hash not in sentiment_by_hash:
+                missing.setdefault(content_hash, transcript_text)
+        if missing:
+            classified = dict(zip(missing, classify_transcripts(list(missing.values()))))
+            sentiment_cache.store(cur, sentiment_model_version, classified.items())
+            sentiment_by_hash.update(classified)
 
-        # Update the sentiment column in Dim_Video where sentiment is NULL
-        cur.execute("""
-            UPDATE Dim_Video
-            SET sentiment = %s
-            WHERE video_id = %s AND sentiment IS NULL;
-        """, (sentiment, video_id))
+        sentiments = [sentiment_by_hash[content_hash] for content_hash in content_hashes]
+        database.use_bulk_commit(cur)
+        psycopg2.extras.execute_values(cur, """
+            UPDATE Dim_Video dv
+            SET sentiment = v.sentiment
+            FROM (VALUES %s) AS v(video_id, sentiment, overwrite)
+            WHERE dv.video_id = v.video_id AND (dv.sentiment IS NULL OR v.overwrite);
+        """, [(video_id, sentiment, overwrite) for (video_id, _), sentiment in zip(batch, sentiments)],
+            page_size=len(batch))
+        updated = cur.rowcount
+        run_ledger.complete(cur, run_id, "transcripts", [video_id for video_id, _ in batch])
         connectie.commit()
+        cache_stats.record(len(batch) - len(missing), len(missing))
+        metrics.count("sentiment_cache_hits", len(batch) - len(missing))
+        metrics.count("transcripts_classified", len(missing))
 
-        print(f"Sentiment for video {video_id} successfully updated to '{sentiment}'.")
+        print(f"Sentiment updated for {updated} of {len(batch)} videos "
+              f"({sentiments.count('positief')} positief, {sentiments.count('negatief')} negatief).")
+        return updated
     except Exception as e:
-        print(f"Error processing transcript for video {video_id}: {e}")
-# Function to fetch video files from the remote directory via SSH
-def fetch_video_files_via_ssh():
-    ssh = paramiko.SSHClient()
-    ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-    ssh.connect(ssh_host, username=ssh_username, password=ssh_password)
-
-    sftp = ssh.open_sftp()
-    try:
-        video_files = sftp.listdir(remote_directory)
-        return video_files
-    finally:
-        sftp.close()
-        ssh.close()
+        connectie.rollback()
+        print(f"Error processing transcripts for {len(batch)} videos: {e}")
+        return 0
 
-# Function to extract video IDs from filenames (assuming filenames represent video IDs)
-def extract_video_ids(video_files):
-    video_ids = [os.path.splitext(video_file)[0] for video_file in video_files]  # Strip file extensions
-    return video_ids
+# Function to bring every stored transcript's sentiment up to date with the current models (e.g. after a
+# model swap). Sentiments cached for the current model version are copied in one UPDATE; only the other
+# transcripts are streamed from a server-side cursor and classified chunk by chunk, so memory use is
+# bounded by the chunk size. Returns the number of videos updated.
+def backfill_sentiment(chunk_size=None):
+    chunk_size = chunk_size or sentiment_backfill_chunk_size
+    create_transcript_tables()
+    cache_stats.reset()
 
-# Function to fetch and insert transcripts into the database, and update sentiment
-def fetch_transcripts_and_update_sentiment():
-    # Step 1: Fetch video files via SSH
-    video_files = fetch_video_files_via_ssh()
+    cur.execute("""
+        SELECT COUNT(*)
+        FROM Dim_Transcript t
+        JOIN Dim_Video dv ON dv.video_id = t.video_id
+        JOIN Sentiment_Cache c ON c.content_hash = t.content_hash AND c.model_version = %s;
+    """, (sentiment_model_version,))
+    cached = cur.fetchone()[0]
+    cur.execute("""
+        UPDATE Dim_Video dv
+        SET sentiment = c.sentiment
+        FROM Dim_Transcript t
+        JOIN Sentiment_Cache c ON c.content_hash = t.content_hash AND c.model_version = %s
+        WHERE dv.video_id = t.video_id AND dv.sentiment IS DISTINCT FROM c.sentiment;
+    """, (sentiment_model_version,))
+    updated = cur.rowcount
+    connectie.commit()
+    cache_stats.record(cached, 0)
 
-    # Step 2: Extract video IDs from the filenames
-    video_ids = extract_video_ids(video_files)
+    with database.stream(connectie, "backfill_transcripts", """
+        SELECT t.video_id, """ + transcript_store.TEXT_COLUMNS + """
+        FROM Dim_Transcript t
+        JOIN Dim_Video dv ON dv.video_id = t.video_id
+        LEFT JOIN Transcript_Blob b ON b.content_hash = t.content_hash
+        WHERE NOT EXISTS (SELECT 1 FROM Sentiment_Cache c
+                          WHERE c.content_hash = t.content_hash AND c.model_version = %s);
+    """, (sentiment_model_version,), chunk_size) as chunks:
+        for rows in chunks:
+            batch = [(video_id, transcript_store.text(*columns)) for video_id, *columns in rows]
+            updated += process_transcripts(batch, overwrite=True)
 
-    # Step 3: Fetch and insert transcripts into the database
-    for video_id in video_ids:
-        try:
-            # Fetch the transcript for the given video ID
-            transcript = YouTubeTranscriptApi.get_transcript(video_id, languages=['en'])
+    print(f"Sentiment backfill completed: {updated} videos reclassified.")
+    cache_stats.report(sentiment_model_version)
+    return updated
+
+# Function to get the video IDs on the share. schrif_video_weg.py records its single listing per run in
+# Video_Manifest, so the share is only listed here when the manifest is empty (standalone runs).
+def get_video_ids():
+    cur.execute("SELECT to_regclass('video_manifest') IS NOT NULL;")
+    if cur.fetchone()[0]:
+        video_ids = discovery.present_video_ids(cur)
+        if video_ids:
+            return video_ids
+
+    if os.getenv("DISCOVERY_SOURCE", "sftp") == "local":
+        video_files = discovery.list_local_files(remote_directory)
+    else:
+        video_files = discovery.list_sftp_files(ssh_host, ssh_username, ssh_password, remote_directory)
+    return [video_file.video_id for video_file in video_files]
+
+# Client that fetches the English transcript of a video as plain text. Anything with the same fetch()
+# method can be passed to fetch_transcripts_and_update_sentiment instead (the benchmarks use a local fake).
+class TranscriptClient:
+    def __init__(self):
+        self.api = YouTubeTranscriptApi()
+        self.formatter = TextFormatter()
+
+    def fetch(self, video_id):
+        metrics.count("api_calls", api="transcripts")
+        transcript = self.api.fetch(video_id, languages=['en'])
+        text = self.formatter.format_transcript(transcript)
+        metrics.count("bytes_fetched", len(text.encode()), api="transcripts")
+        return text
 
-            # Format the transcript to plain text
-            formatter = TextFormatter()
-            transcript_text = formatter.format_transcript(transcript)
+# Client for a transcript service (TRANSCRIPT_SERVICE_URL); a 404 means the video has no transcript
+class TranscriptServiceClient:
+    def __init__(self, url):
+        self.url = url.rstrip("/")
+        self.session = youtube_fetcher.create_session(transcript_workers)
 
+    def fetch(self, video_id):
+        metrics.count("api_calls", api="transcripts")
+        response = self.session.get(f"{self.url}/transcripts/{video_id}", timeout=30)
+        metrics.count("bytes_fetched", len(response.content), api="transcripts")
+        if response.status_code == 404:
+            raise LookupError(f"No transcript for video {video_id}")
+        response.raise_for_status()
+        return response.text
+
+# Function to create the transcript client for this run
+def transcript_client():
+    if transcript_service_url:
+        return TranscriptServiceClient(transcript_service_url)
+    return TranscriptClient()
+
+# Function to tell transient failures (worth a retry) from other errors
+def is_transient(error):
+    return isinstance(error, (requests.RequestException, YouTubeRequestFailed))
+
+# Transcript API errors that are about the request rather than the video (failed or blocked requests, the
+# consent page, a page the library cannot parse): the fetch failed and the video is tried again later
+FETCH_ERRORS = (YouTubeRequestFailed, RequestBlocked, FailedToCreateConsentCookie, YouTubeDataUnparsable)
+
+# Function to tell videos that have no usable transcript (done, nothing to retry) from failed fetches.
+# Every other CouldNotRetrieveTranscript is permanent for the video (disabled, not found, unavailable, age
+# restricted, unplayable, ...). LookupError is what TranscriptServiceClient raises for a 404.
+def is_unavailable(error):
+    if isinstance(error, LookupError):
+        return True
+    return isinstance(error, CouldNotRetrieveTranscript) and not isinstance(error, FETCH_ERRORS)
+
+# Function to fetch transcripts on worker threads, with a shared rate limit and retries with backoff.
+# Results go through a bounded queue, so the database work of the caller overlaps with fetching.
+# Yields (video_id, transcript_text, error) in completion order.
+def fetch_transcripts(video_ids, client, workers=None, rate_limit=None):
+    workers = workers or transcript_workers
+    rate_limit = transcript_rate_limit if rate_limit is None else rate_limit
+    rate_limiter = youtube_fetcher.TokenBucket(rate_limit) if rate_limit > 0 else None
+
+    def fetch_one(video_id):
+        with metrics.timer("transcript_fetch"):
+            return youtube_fetcher.call_with_retry(client.fetch, (video_id,), is_transient, rate_limiter,
+                                                   transcript_max_retries)
+
+    yield from youtube_fetcher.fetch_concurrently(video_ids, fetch_one, workers, transcript_queue_size)
+
+# Result of planning the transcript stage: which videos need a download, which only need their stored
+# transcript classified, and which are finished
+class TranscriptPlan:
+    def __init__(self, need_transcript, need_sentiment, done):
+        self.need_transcript = need_transcript
+        self.need_sentiment = need_sentiment
+        self.done = done
+
+# Function to split the candidate videos with one anti-join against Dim_Transcript and Dim_Video.sentiment.
+# Videos without a Dim_Video row have nowhere to store a sentiment, so a stored transcript finishes them.
+def plan_transcripts(video_ids):
+    cur.execute("""
+        SELECT c.video_id, t.video_id IS NOT NULL, dv.video_id IS NOT NULL AND dv.sentiment IS NULL
+        FROM unnest(%s::text[]) AS c(video_id)
+        LEFT JOIN Dim_Transcript t ON t.video_id = c.video_id
+        LEFT JOIN Dim_Video dv ON dv.video_id = c.video_id;
+    """, (list(video_ids),))
+    need_transcript = []
+    need_sentiment = []
+    done = []
+    for video_id, has_transcript, missing_sentiment in cur.fetchall():
+        if not has_transcript:
+            need_transcript.append(video_id)
+        elif missing_sentiment:
+            need_sentiment.append(video_id)
+        else:
+            done.append(video_id)
+    connectie.commit()
+    return TranscriptPlan(need_transcript, need_sentiment, done)
+
+# Function to read stored transcripts back from Dim_Transcript; yields (video_id, transcript_text)
+def stored_transcripts(video_ids, batch_size=500):
+    for start in range(0, len(video_ids), batch_size):
+        yield from list(transcript_store.read(cur, video_ids[start:start + batch_size]))
+
+# Function to fetch and insert transcripts into the database, and update sentiment.
+# Only videos without a stored transcript are downloaded; videos that have one but no sentiment are
+# classified from the database. With a run_id finished videos (and videos that have no transcript) are
+# recorded in the run ledger. Fetches that failed for another reason are not: after the other videos are
+# done the stage raises, so the run can be resumed. Returns the IDs of the videos whose transcript was fetched.
+def fetch_transcripts_and_update_sentiment(video_ids=None, client=None, run_id=None):
+    # Step 1 and 2: Get the video IDs from the shared discovery listing
+    if video_ids is None:
+        video_ids = get_video_ids()
+
+    create_transcript_tables()
+    cache_stats.reset()
+    plan = plan_transcripts(video_ids)
+    print(f"Transcripts: {len(plan.need_transcript)} to fetch, {len(plan.need_sentiment)} to classify from the "
+          f"database, {len(plan.done)} already done.")
+
+    # Stored transcripts that still need a sentiment (no network needed)
+    for start in range(0, len(plan.need_sentiment), sentiment_batch_size):
+        process_transcripts(list(stored_transcripts(plan.need_sentiment[start:start + sentiment_batch_size])),
+                            run_id=run_id)
+
+    # Step 3: Fetch transcripts concurrently; insert them and classify them here, on this thread's connection
+    fetched = set()
+    pending = []
+    unavailable = []
+    failed = {}
+    for video_id, transcript_text, error in fetch_transcripts(plan.need_transcript, client or transcript_client()):
+        if error is not None:
+            # Videos without a transcript are done for this run; other failures are retried on resume
+            if is_unavailable(error):
+                print(f"No transcript for video {video_id}: {type(error).__name__}")
+                unavailable.append(video_id)
+            else:
+                print(f"Cannot fetch transcript for video {video_id}: {error!r}")
+                failed[video_id] = error
+            continue
+        fetched.add(video_id)
+        try:
             # Insert the transcript into the database
             insert_transcript(video_id, transcript_text, "en", "manual")
+        except Exception as e:
+            print(f"Cannot store transcript for video {video_id}: {e}")
+            continue
 
-            # Process the transcript to classify sentiment and update Dim_Video
-            process_transcript(video_id, transcript_text)
+        # Commit the transcripts, then classify them and update Dim_Video, a batch at a time
+        pending.append((video_id, transcript_text))
+        if len(pending) >= sentiment_batch_size:
+            run_ledger.complete(cur, run_id, "transcripts", unavailable)
+            connectie.commit()
+            process_transcripts(pending, run_id=run_id)
+            pending = []
+            unavailable = []
+    run_ledger.complete(cur, run_id, "transcripts", unavailable)
+    connectie.commit()
+    process_transcripts(pending, run_id=run_id)
 
-        except Exception as e:
-            print(f"Cannot fetch transcript for video {video_id}: {e}")
+    cache_stats.report(sentiment_model_version)
+    if failed:
+        video_id, error = next(iter(failed.items()))
+        raise RuntimeError(f"Could not fetch the transcripts of {len(failed)} videos "
+                           f"(first: {video_id}: {error!r})")
+    return fetched
 
 # Main function to run the script
 def main():
-    fetch_transcripts_and_update_sentiment()
+    parser = argparse.ArgumentParser(description="Fetch transcripts and classify their sentiment")
+    parser.add_argument("--backfill-sentiment", action="store_true",
+                        help="Reclassify every stored transcript instead of fetching new ones")
+    args = parser.parse_args()
+
+    setup(connect_database(), load_models())
+    try:
+        if args.backfill_sentiment:
+            backfill_sentiment()
+        else:
+            fetch_transcripts_and_update_sentiment()
+        metrics.finish_run("transcript")
+    finally:
+        database.release(connectie)
+        database.close_pool()
+    database.report()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,246 @@
+import argparse
+import hashlib
+import os
+import time
+import zlib
+
+import psycopg2.extras
+
+import database
+
+try:
+    import zstandard
+except ImportError:  # zstandard is optional; without it new blobs are written with zlib
+    zstandard = None
+
+# Compressed, content-addressed storage for transcripts. The text of a transcript is stored once in
+# Transcript_Blob, compressed and keyed by the SHA-256 of the text; Dim_Transcript rows point at it
+# through content_hash, so reuploads and mirrored talks share one blob. Rows written before this change
+# keep their plain transcript_text until the migration converts them; read() handles both.
+#
+#   python transcript_store.py migrate [--batch-size 500] [--vacuum]   convert plain rows and report sizes
+#   python transcript_store.py report                                   table sizes and read throughput
+
+# Codec for new blobs: zstd when the zstandard package is installed, zlib otherwise (reads support both)
+codec = os.getenv("TRANSCRIPT_CODEC", "zstd" if zstandard else "zlib")
+if codec == "zstd" and zstandard is None:
+    raise ValueError("TRANSCRIPT_CODEC=zstd needs the zstandard package.")
+
+COMPRESSION_LEVEL = {"zstd": 9, "zlib": 6}
+
+# Columns to select (with Dim_Transcript as t, Transcript_Blob as b) for text(); see read()
+TEXT_COLUMNS = "t.transcript_text, b.codec, b.data"
+
+
+# Function to create the blob table and the content_hash column on Dim_Transcript. The ALTERs take an
+# ACCESS EXCLUSIVE lock (blocking the dashboard's reads), so they only run when the catalog shows they
+# have not been applied yet; on every later run this is a catalog lookup.
+def create_tables(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS Transcript_Blob (
+            content_hash CHAR(64) PRIMARY KEY,
+            codec VARCHAR(8) NOT NULL,
+            raw_size INT NOT NULL,
+            data BYTEA NOT NULL
+        );
+    """)
+    cursor.execute("""
+        SELECT c.relname, a.attname, a.attstorage, a.attnotnull
+        FROM pg_attribute a
+        JOIN pg_class c ON c.oid = a.attrelid
+        WHERE a.attrelid IN (to_regclass('transcript_blob'), to_regclass('dim_transcript'))
+          AND a.attname IN ('data', 'content_hash', 'transcript_text') AND NOT a.attisdropped;
+    """)
+    columns = {(table, column): (storage, not_null) for table, column, storage, not_null in cursor.fetchall()}
+
+    # The data is compressed already, so TOAST should store it out of line without trying again
+    if columns[("transcript_blob", "data")][0] != "e":
+        cursor.execute("ALTER TABLE Transcript_Blob ALTER COLUMN data SET STORAGE EXTERNAL;")
+    if ("dim_transcript", "content_hash") not in columns:
+        cursor.execute("ALTER TABLE Dim_Transcript ADD COLUMN IF NOT EXISTS content_hash CHAR(64) DEFAULT NULL;")
+    if columns.get(("dim_transcript", "transcript_text"), (None, False))[1]:
+        cursor.execute("ALTER TABLE Dim_Transcript ALTER COLUMN transcript_text DROP NOT NULL;")
+
+
+# Function to compute the content hash of a transcript (the key of its blob and of its cached sentiment)
+def content_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+# Function to compress a transcript; returns (content_hash, codec, raw_size, data)
+def compress(text):
+    raw = text.encode("utf-8")
+    if codec == "zstd":
+        data = zstandard.ZstdCompressor(level=COMPRESSION_LEVEL["zstd"]).compress(raw)
+    else:
+        data = zlib.compress(raw, COMPRESSION_LEVEL["zlib"])
+    return content_hash(text), codec, len(raw), data
+
+
+# Function to decompress a blob written with any supported codec
+def decompress(blob_codec, data):
+    if blob_codec == "zstd":
+        if zstandard is None:
+            raise ValueError("Transcript blob is zstd-compressed, install the zstandard package to read it.")
+        return zstandard.ZstdDecompressor().decompress(bytes(data)).decode("utf-8")
+    if blob_codec == "zlib":
+        return zlib.decompress(bytes(data)).decode("utf-8")
+    raise ValueError(f"Unknown transcript codec {blob_codec}")
+
+
+# Function to turn the TEXT_COLUMNS of one row into the transcript text (plain rows are returned as they are)
+def text(transcript_text, blob_codec, data):
+    if data is None:
+        return transcript_text
+    return decompress(blob_codec, data)
+
+
+# Function to store compressed blobs; blobs that exist already (same content hash) are reused
+def store_blobs(cursor, blobs):
+    psycopg2.extras.execute_values(cursor, """
+        INSERT INTO Transcript_Blob (content_hash, codec, raw_size, data)
+        VALUES %s
+        ON CONFLICT (content_hash) DO NOTHING;
+    """, blobs, page_size=100)
+
+
+# Function to insert a transcript for a video (both statements run once per video, so they are prepared);
+# the caller commits. A video that already has a transcript keeps it. Returns whether the row was inserted.
+def insert(cursor, video_id, transcript_text, language, version):
+    blob_hash, blob_codec, raw_size, data = compress(transcript_text)
+    database.execute_prepared(cursor, "insert_transcript_blob", """
+        INSERT INTO Transcript_Blob (content_hash, codec, raw_size, data)
+        VALUES ($1, $2, $3, $4)
+        ON CONFLICT (content_hash) DO NOTHING
+    """, (blob_hash, blob_codec, raw_size, psycopg2.Binary(data)))
+    database.execute_prepared(cursor, "insert_transcript", """
+        INSERT INTO Dim_Transcript (video_id, transcript_text, language, version, content_hash)
+        VALUES ($1, NULL, $2, $3, $4)
+        ON CONFLICT (video_id) DO NOTHING
+    """, (video_id, language, version, blob_hash))
+    return cursor.rowcount == 1
+
+
+# Function to read the transcripts of the given videos; yields (video_id, transcript_text)
+def read(cursor, video_ids):
+    cursor.execute("""
+        SELECT t.video_id, """ + TEXT_COLUMNS + """
+        FROM Dim_Transcript t
+        LEFT JOIN Transcript_Blob b ON b.content_hash = t.content_hash
+        WHERE t.video_id = ANY(%s);
+    """, (list(video_ids),))
+    for video_id, transcript_text, blob_codec, data in cursor.fetchall():
+        yield video_id, text(transcript_text, blob_codec, data)
+
+
+# Function to convert the plain rows of Dim_Transcript in batches, one transaction per batch.
+# Returns the number of rows converted.
+def migrate(connection, batch_size=500):
+    cursor = connection.cursor()
+    create_tables(cursor)
+    connection.commit()
+
+    converted = 0
+    last_video_id = ""
+    while True:
+        cursor.execute("""
+            SELECT video_id, transcript_text
+            FROM Dim_Transcript
+            WHERE content_hash IS NULL AND transcript_text IS NOT NULL AND video_id > %s
+            ORDER BY video_id
+            LIMIT %s;
+        """, (last_video_id, batch_size))
+        rows = cursor.fetchall()
+        if not rows:
+            break
+
+        blobs = {}
+        hashes = []
+        for video_id, transcript_text in rows:
+            blob_hash, blob_codec, raw_size, data = compress(transcript_text)
+            blobs[blob_hash] = (blob_hash, blob_codec, raw_size, psycopg2.Binary(data))
+            hashes.append((video_id, blob_hash))
+        store_blobs(cursor, list(blobs.values()))
+        psycopg2.extras.execute_values(cursor, """
+            UPDATE Dim_Transcript t
+            SET content_hash = v.content_hash, transcript_text = NULL
+            FROM (VALUES %s) AS v(video_id, content_hash)
+            WHERE t.video_id = v.video_id;
+        """, hashes, page_size=len(hashes))
+        connection.commit()
+
+        converted += len(rows)
+        last_video_id = rows[-1][0]
+        print(f"Converted {converted} transcripts.")
+
+    connection.commit()
+    cursor.close()
+    return converted
+
+
+# Function to get the total size (with TOAST and indexes) of the transcript tables in bytes
+def table_sizes(cursor):
+    cursor.execute("""
+        SELECT pg_total_relation_size('dim_transcript'),
+               COALESCE(pg_total_relation_size(to_regclass('transcript_blob')), 0);
+    """)
+    return cursor.fetchone()
+
+
+# Function to read every transcript through the accessor and measure the throughput.
+# Returns (transcripts, text bytes, seconds).
+def read_throughput(connection, batch_size=500):
+    cursor = connection.cursor()
+    cursor.execute("SELECT video_id FROM Dim_Transcript ORDER BY video_id;")
+    video_ids = [row[0] for row in cursor.fetchall()]
+    start = time.perf_counter()
+    total_bytes = 0
+    for offset in range(0, len(video_ids), batch_size):
+        for _, transcript_text in read(cursor, video_ids[offset:offset + batch_size]):
+            total_bytes += len(transcript_text or "")
+    elapsed = time.perf_counter() - start
+    connection.commit()
+    cursor.close()
+    return len(video_ids), total_bytes, elapsed
+
+
+# Function to print the table sizes and the read throughput
+def report(connection, label):
+    cursor = connection.cursor()
+    create_tables(cursor)
+    connection.commit()
+    transcript_size, blob_size = table_sizes(cursor)
+    cursor.close()
+    count, total_bytes, elapsed = read_throughput(connection)
+    print(f"{label}: Dim_Transcript {transcript_size / 1e6:.1f} MB + Transcript_Blob {blob_size / 1e6:.1f} MB = "
+          f"{(transcript_size + blob_size) / 1e6:.1f} MB; read {count} transcripts ({total_bytes / 1e6:.1f} MB text) "
+          f"in {elapsed:.2f}s, {count / max(elapsed, 1e-9):.0f} transcripts/s")
+
+
+def main():
+    import transcript
+
+    parser = argparse.ArgumentParser(description="Compressed transcript storage: migrate plain rows and report sizes")
+    parser.add_argument("command", choices=["migrate", "report"])
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--vacuum", action="store_true", help="VACUUM FULL Dim_Transcript after migrating to return the space")
+    args = parser.parse_args()
+
+    connection = transcript.connect_database()
+    try:
+        report(connection, "Before" if args.command == "migrate" else "Now")
+        if args.command == "migrate":
+            print(f"Migrated {migrate(connection, args.batch_size)} transcripts to {codec}.")
+            if args.vacuum:
+                connection.autocommit = True
+                connection.cursor().execute("VACUUM FULL Dim_Transcript;")
+                connection.autocommit = False
+            report(connection, "After")
+    finally:
+        database.release(connection)
+        database.close_pool()
+    database.report()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+import queue
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+
+# Status codes worth retrying: quota/rate limiting (403, 429) and server errors (5xx)
+RETRY_STATUS_CODES = {403, 429, 500, 502, 503, 504}
+
+
+# Token bucket that limits how many requests per second all fetch threads send together
+class TokenBucket:
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or max(1.0, rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+# Function to create a session whose keep-alive pool is large enough for all fetch threads
+def create_session(pool_size):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+# Function to send a GET request, retrying with jittered exponential backoff on 403/429/5xx.
+# Every attempt counts as an API call of api (metrics), with the size of its response body.
+def get_with_retry(session, url, params, rate_limiter=None, max_retries=4, backoff=0.5, timeout=30, api="http"):
+    attempt = 0
+    while True:
+        if rate_limiter:
+            rate_limiter.acquire()
+        try:
+            metrics.count("api_calls", api=api)
+            response = session.get(url, params=params, timeout=timeout)
+            metrics.count("bytes_fetched", len(response.content), api=api)
+            if response.status_code not in RETRY_STATUS_CODES or attempt >= max_retries:
+                return response
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt >= max_retries:
+                raise
+
+        # Full jitter: sleep a random time up to the exponential backoff ceiling
+        metrics.count("api_retries")
+        time.sleep(random.uniform(0, backoff * (2 ** attempt)))
+        attempt += 1
+
+
+# Function to call function(*args), retrying with the same jittered exponential backoff when it raises an
+# exception for which is_transient(exception) is true (clients that are not plain HTTP GETs)
+def call_with_retry(function, args, is_transient, rate_limiter=None, max_retries=4, backoff=0.5):
+    attempt = 0
+    while True:
+        if rate_limiter:
+            rate_limiter.acquire()
+        try:
+            return function(*args)
+        except Exception as e:
+            if attempt >= max_retries or not is_transient(e):
+                raise
+
+        metrics.count("api_retries")
+        time.sleep(random.uniform(0, backoff * (2 ** attempt)))
+        attempt += 1
+
+
+# Function to run fetch_batch over all batches on a thread pool while the caller consumes the results.
+# Results are handed over through a bounded queue, so fetching overlaps with whatever the caller does
+# with each result (database writes) and fetchers pause when the caller falls behind.
+# Yields (batch, result, error) tuples in completion order.
+def fetch_concurrently(batches, fetch_batch, workers=4, queue_size=8):
+    results = queue.Queue(maxsize=queue_size)
+    pending = queue.Queue()
+    for batch in batches:
+        pending.put(batch)
+
+    def worker():
+        try:
+            while True:
+                try:
+                    batch = pending.get_nowait()
+                except queue.Empty:
+                    return
+                try:
+                    results.put((batch, fetch_batch(batch), None))
+                except Exception as e:
+                    results.put((batch, None, e))
+        finally:
+            results.put(None)
+
+    workers = max(1, workers)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for _ in range(workers):
+            executor.submit(worker)
+
+        finished = 0
+        try:
+            while finished < workers:
+                result = results.get()
+                if result is None:
+                    finished += 1
+                else:
+                    yield result
+        finally:
+            # Drain pending work and the result queue so blocked workers can exit if the caller stops early
+            while True:
+                try:
+                    pending.get_nowait()
+                except queue.Empty:
+                    break
+            while finished < workers:
+                if results.get() is None:
+                    finished += 1